@@ -0,0 +1,118 @@
+""" Indexed store of the MOAA burnup results by cell and time """
+import os
+import numpy as np
+from cell_index import CellIndex
+
+
+def parse_days(labels):
+    """ Converts headers such as '4.775E+01 days' to floats [days] """
+    return np.array([float(label.split()[0]) for label in labels])
+
+
+class BurnupStore:
+    """
+    Burnup results as a (cell x time) array.
+
+    Parameters
+    ----------
+    cells: array of int
+        cell numbers, one per row of 'values'
+    days: array of float
+        time axis [days]
+    values: array of float
+        shape (n_cells, n_times)
+    index: CellIndex
+        compact numbering, defaults to the AGR-1 train; the results may hold
+        any subset of its cells (one capsule, the cells of depletion groups),
+        only a query for a missing cell raises KeyError
+    """
+
+    def __init__(self, cells, days, values, index=None):
+        self.cells = np.asarray(cells, dtype=int)
+        self.days = np.asarray(days, dtype=float)
+        self.values = np.asarray(values, dtype=float)
+        self._row = {int(c): i for i, c in enumerate(self.cells)}
+
+        self.index = CellIndex() if index is None else index
+        shape = (len(self.index.capsules), len(self.index.stacks), len(self.index.compacts))
+        self._fuel_cells = np.array(self.index.cells('kernel')).reshape(shape)
+
+    @classmethod
+    def from_csv(cls, filename):
+        """ Parses a MOAA csv file (cells as rows, '<t> days' as columns) """
+        import pandas as pd
+
+        df = pd.read_csv(filename, index_col=[0])
+        return cls(df.index.to_numpy(), parse_days(df.columns), df.to_numpy(dtype=float))
+
+    @classmethod
+    def load(cls, filename):
+        """ Loads a store written by 'save' """
+        with np.load(filename) as data:
+            return cls(data['cells'], data['days'], data['values'])
+
+    @classmethod
+    def cached(cls, filename, cache=None):
+        """
+        Reads 'filename' through an .npz cache, which is rebuilt whenever the
+        csv file is newer than the cache.
+        """
+        if cache is None:
+            cache = os.path.splitext(filename)[0] + '.npz'
+        if os.path.exists(cache) and os.path.getmtime(cache) >= os.path.getmtime(filename):
+            return cls.load(cache)
+        store = cls.from_csv(filename)
+        store.save(cache)
+        return store
+
+    def save(self, filename):
+        """ Writes the store as an .npz file """
+        np.savez(filename, cells=self.cells, days=self.days, values=self.values)
+
+    def kernel_cells(self):
+        """ Returns the kernel cells of the index that are in the results, in index order """
+        return [c for c in self.index.cells('kernel') if c in self._row]
+
+    def rows(self, cells):
+        """ Returns the row index of each cell in 'cells' """
+        cells = np.asarray(cells, dtype=int)
+        try:
+            return np.array([self._row[c] for c in cells.ravel()], dtype=int).reshape(cells.shape)
+        except KeyError as err:
+            raise KeyError(f'cell {err.args[0]} is not in the burnup results') from None
+
+    def _time(self, time):
+        """
+        Returns the values at 'time': an index into the time axis (int) or a
+        time in days (float), linearly interpolated.
+        """
+        if time is None:
+            return self.values
+        if isinstance(time, (int, np.integer)):
+            return self.values[:, time]
+        idx = np.searchsorted(self.days, time).clip(1, len(self.days) - 1)
+        w = (time - self.days[idx-1]) / (self.days[idx] - self.days[idx-1])
+        return self.values[:, idx-1] * (1 - w) + self.values[:, idx] * w
+
+    def at(self, cells, time=-1):
+        """ Returns the values of 'cells' at 'time' (None for all times) """
+        return self._time(time)[self.rows(cells)]
+
+    def fuel(self, time=-1):
+        """
+        Returns the fuel burnup as an array indexed [capsule-1, stack-1,
+        compact-1] (plus a time axis if time is None).
+        """
+        return self.at(self._fuel_cells, time)
+
+    def axial(self, stack, time=-1):
+        """
+        Returns the burnup along 'stack', from the bottom compact of capsule 1
+        to the top compact of capsule 6.
+        """
+        values = self.at(self._fuel_cells[:, stack-1], time)
+        return values.reshape((-1,) + values.shape[2:])
+
+    def radial(self, cap, comp, time=-1):
+        """ Returns the burnup of the three stacks at capsule 'cap', compact 'comp' """
+        return self.at(self._fuel_cells[cap-1, :, comp-1], time)
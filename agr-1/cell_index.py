@@ -0,0 +1,141 @@
+""" Cell numbering of the AGR-1 compacts, shared by the generator and post-processing """
+import json
+
+
+# layer: (cell offset, surface suffix, universe suffix)
+LAYERS = {
+    'kernel': (1, 1, 4),
+    'buffer': (2, 2, 4),
+    'ipyc': (3, 3, 4),
+    'sic': (4, 4, 4),
+    'opyc': (5, 5, 4),
+    'matrix': (6, None, 4),
+    'matrix cube': (7, 6, 5),
+    'particle lattice': (8, 7, 6),
+    'matrix slab': (9, 9, 7),
+    'compact lattice': (10, 8, 0),
+    'compact': (11, None, None),
+}
+
+TRISO_MATERIALS = {
+    'buffer': 9090,
+    'ipyc': 9091,
+    'sic': 9092,
+    'opyc': 9093,
+    'matrix': 9094,
+    'matrix cube': 9094,
+    'matrix slab': 9094,
+}
+
+
+def compact_numbers(cap, stack, comp):
+    """
+    Returns the base numbers of a compact.
+
+    Returns
+    -------
+    c: int
+        base cell number, cells are c+1 ... c+11
+    s: int
+        base surface number, surfaces are {s}1 ... {s}9
+    m: int
+        kernel material number
+    u: int
+        base universe number, universes are {u}0, {u}4 ... {u}7
+    """
+    c = int(90000 + cap*1000 + stack*100 + 2*(comp-1)*10)
+    s = int(9000 + cap*100 + stack*10 + comp)
+    m = int(9000 + cap*100 + stack*10 + comp)
+    u = int(cap*100 + stack*10 + comp)
+    return c, s, m, u
+
+
+def moaa_path(cap, stack, comp):
+    """ Returns the MOAA path of the kernel of a compact """
+    c, _, _, _ = compact_numbers(cap, stack, comp)
+    return f'{c+1}<{c+8}<{c+10}<{c+11}'
+
+
+class CellIndex:
+    """
+    Two-way map between a location (capsule, stack, compact, layer) and the
+    cell, surface, material, universe and MOAA path numbers.
+
+    Parameters
+    ----------
+    capsules: list of int
+    stacks: list of int
+    compacts: list of int
+    """
+
+    def __init__(self, capsules=range(1, 7), stacks=range(1, 4), compacts=range(1, 5)):
+        self.capsules = list(capsules)
+        self.stacks = list(stacks)
+        self.compacts = list(compacts)
+        self._by_location = {}
+        self._by_cell = {}
+
+        for cap in self.capsules:
+            for stack in self.stacks:
+                for comp in self.compacts:
+                    c, s, m, u = compact_numbers(cap, stack, comp)
+                    for layer, (dc, ds, du) in LAYERS.items():
+                        record = {
+                            'cell': c + dc,
+                            'surface': None if ds is None else int(f'{s}{ds}'),
+                            'material': m if layer == 'kernel' else TRISO_MATERIALS.get(layer),
+                            'universe': None if du is None else int(f'{u}{du}'),
+                            'path': moaa_path(cap, stack, comp) if layer == 'kernel' else None,
+                        }
+                        location = (cap, stack, comp, layer)
+                        self._by_location[location] = record
+                        self._by_cell[record['cell']] = location
+
+    def record(self, cap, stack, comp, layer='kernel'):
+        """ Returns the numbers of a location as a dict """
+        return self._by_location[(cap, stack, comp, layer)]
+
+    def cell(self, cap, stack, comp, layer='kernel'):
+        """ Returns the cell number of a location """
+        return self._by_location[(cap, stack, comp, layer)]['cell']
+
+    def location(self, cell):
+        """ Returns (capsule, stack, compact, layer) of a cell number """
+        return self._by_cell[int(cell)]
+
+    def cells(self, layer='kernel'):
+        """ Returns the cell numbers of 'layer' for all compacts, in index order """
+        return [r['cell'] for (_, _, _, lay), r in self._by_location.items() if lay == layer]
+
+    def moaa_paths(self):
+        """ Returns the MOAA paths of all kernels, in index order """
+        return [r['path'] for (_, _, _, lay), r in self._by_location.items() if lay == 'kernel']
+
+    def save(self, filename):
+        """ Writes the index as json """
+        records = [
+            {'capsule': cap, 'stack': stack, 'compact': comp, 'layer': layer, **record}
+            for (cap, stack, comp, layer), record in self._by_location.items()
+        ]
+        with open(filename, 'w+') as f:
+            json.dump({
+                'capsules': self.capsules,
+                'stacks': self.stacks,
+                'compacts': self.compacts,
+                'records': records,
+            }, f, indent=1)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Loads an index written by 'save'. Raises ValueError if the file does not
+        match the current numbering scheme.
+        """
+        with open(filename) as f:
+            data = json.load(f)
+        index = cls(data['capsules'], data['stacks'], data['compacts'])
+        for r in data['records']:
+            record = index.record(r['capsule'], r['stack'], r['compact'], r['layer'])
+            if any(record[key] != r[key] for key in record):
+                raise ValueError(f'{filename} is out of sync with the numbering scheme')
+        return index
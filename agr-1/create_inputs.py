@@ -1,8 +1,14 @@
+""" Creates the AGR-1 MCNP inputs (ATR bench decks and SDR deck) and the MOAA depletion cases """
 import os
+import sys
+import argparse
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
-from jinja2 import Environment, FileSystemLoader
+from cell_index import CellIndex, compact_numbers
+from history_store import HistoryStore
+import materials as mcnp_materials
+
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
 
 
 def define_irrad_case(filename, time, power):
@@ -49,10 +55,7 @@ def compact_surfaces(s, thick, n_particles):
 
 
 def compact_cells(cap, stack, comp, particle):
-    c = int(90000 + cap*1000 + stack*100 + 2*(comp-1)*10)
-    s = int(9000 + cap*100 + stack*10 + comp)
-    m1 = int(9000 + cap*100 + stack*10 + comp)
-    u = int(cap*100 + stack*10 + comp)
+    c, s, m1, u = compact_numbers(cap, stack, comp)
 
     if particle == 'baseline':
         dens = [10.924, 1.100, 1.904, 3.208, 1.907, 1.297]
@@ -164,31 +167,38 @@ def compact_cells(cap, stack, comp, particle):
     return cells
 
 
-def compact_center(cap, stack, comp):
-     
-    if stack == 1:
-        cx, cy = 25.547039, -24.553123
-    elif stack == 2:
-        cx, cy = 24.553123, -25.547039
-    elif stack == 3:
-        cx, cy = 25.910838, -25.910838
-
-    if cap == 1:
-        cz = 17.81810
-    elif cap == 2:
-        cz = 33.04540
-    elif cap == 3:
-        cz = 48.27270
-    elif cap == 4:
-        cz = 63.50000
-    elif cap == 5:
-        cz = 78.72730
-    elif cap == 6:
-        cz = 93.95460
-
-    cz += (comp-1)*2.54 + 0.2 + (2.54-0.16-0.2)/2
-    # print(f'cz: {cz:.6f}')
-    return cx, cy, cz
+def compact_centers(capsules=range(1, 7), stacks=range(1, 4), compacts=range(1, 5)):
+    """
+    Returns the centre of every compact, from the stack and capsule tables.
+
+    Returns
+    -------
+    centers: np.ndarray
+        shape (capsules, stacks, compacts, 3), x, y, z [cm]
+    """
+    capsules, stacks, compacts = (np.array(list(v)) for v in (capsules, stacks, compacts))
+    centers = np.empty((len(capsules), len(stacks), len(compacts), 3))
+    centers[..., :2] = stack_centers[stacks - 1][None, :, None, :]
+    centers[..., 2] = (capsule_bottoms[capsules - 1][:, None, None]
+                       + (compacts - 1)[None, None, :]*COMPACT_PITCH + COMPACT_OFFSET)
+    return centers
+
+
+def compact_transforms(capsules=range(1, 7), stacks=range(1, 4), compacts=range(1, 5)):
+    """
+    Returns the TR cards placing the compacts: card tr{u} moves compact
+    universe {u}0 to its centre (see compact_numbers).
+    """
+    centers = compact_centers(capsules, stacks, compacts)
+    cards = 'c\nc compact centres, filled as fill={u}0 ({u})'
+    for n, cap in enumerate(capsules):
+        for k, stack in enumerate(stacks):
+            for j, comp in enumerate(compacts):
+                _, _, _, u = compact_numbers(cap, stack, comp)
+                cx, cy, cz = centers[n, k, j]
+                cards += f'\ntr{u}  {cx:.6f} {cy:.6f} {cz:.6f}'
+    return cards
+
 
 # --------------------
 #
@@ -207,12 +217,6 @@ n_particles['variant1'] = 4145
 n_particles['variant2'] = 4095
 n_particles['variant3'] = 4132
 
-cells = """c
-99970 8900 -1.164e-03 -97064     98000 -98001  $ bottom air filler
-99971 9000 -8.03      -97064     98001 -98002  vol=8.6736  $ capsule support
-99972 9040 -1.015     -97064     98002 -98003  $ graphite spacer
-"""
-
 capsule_particle = {
     1: 'variant3',
     2: 'variant2',
@@ -228,69 +232,114 @@ stack_cylinders = {
     3: (97031, 97032),
 }
 
-for cap, particle in capsule_particle.items():
+# x, y [cm] of stacks 1-3 (axes of the stack cylinders)
+stack_centers = np.array([
+    [25.547039, -24.553123],
+    [24.553123, -25.547039],
+    [25.910838, -25.910838],
+])
+# z [cm] of the bottom of the compact stacks of capsules 1-6
+capsule_bottoms = np.array([17.81810, 33.04540, 48.27270, 63.50000, 78.72730, 93.95460])
+COMPACT_PITCH = 2.54
+# compact centre above the bottom of its pitch: 0.2 below, 0.16 above the compact
+COMPACT_OFFSET = 0.2 + (2.54 - 0.16 - 0.2)/2
+# axial surfaces of compacts 1-4, as offsets to the bottom surface of the capsule
+compact_planes = [(1, 47), (47, 2), (2, 48), (48, 3)]
+
+
+# Compositions of the test train, as published: negative values are weight
+# fractions, positive ones atom fractions or densities (see tools/materials.py)
+air = {'7014.80c': '-0.76', '8016.80c': '-0.24'}
+light_water = {1001: '2', 8016: '1'}
+helium = {2004: '1'}
+ss316l = {
+    24050: '-0.00653131', 24052: '-0.14263466', 24053: '-0.01730730', 24054: '-0.00352673',
+    25055: '-0.02000000',
+    26054: '-0.03799186', 26056: '-0.60409084', 26057: '-0.01336731',
+    28058: '-0.08053185', 28060: '-0.03185216', 28061: '-0.00124553', 28062: '-0.00506366',
+    28064: '-0.00130679',
+    42092: '-0.00354458', 42094: '-0.00220235', 42095: '-0.00395701', 42096: '-0.00424858',
+    42097: '-0.00239899', 42098: '-0.00612312', 42100: '-0.00252537',
+}
+graphite = {6012: '0.9890', 6013: '0.0110'}
+# by capsule group: 1 (capsules 1, 6), 2 (capsules 2-5)
+borated_graphite = {
+    1: {6012: '8.4900E-2', '5010.20c': '8.4496E-4', 5011: '3.4003E-3'},
+    2: {6012: '8.4300E-2', '5010.20c': '1.0804E-3', 5011: '4.3476E-3'},
+}
+hafnium = {
+    8016: '1.3500E-4', 6012: '4.4300E-5',
+    14028: '6.3341E-6', 14029: '3.2289E-7', 14030: '2.1297E-7',
+    40090: '1.0169E-3', 40091: '2.2288E-4', 40092: '3.4029E-4', 40094: '3.4626E-4', 40096: '5.5719E-5',
+    72174: '6.7512E-5', 72176: '2.1934E-3', 72177: '7.8473E-3', 72178: '1.1431E-2', 72179: '5.7955E-3',
+    72180: '1.4845E-2',
+}
+silicon_carbide = {14028: '0.9220', 14029: '0.0470', 14030: '0.0310', 6012: '0.9890', 6013: '0.0110'}
+uco = {
+    92234: '3.34179E-03', 92235: '1.99636E-01', 92236: '1.93132E-04', 92238: '7.96829E-01',
+    6012: '0.3217217', 6013: '0.0035783', 8016: '1.3613',
+}
+
+
+def build_train():
+    """
+    Returns the cells, surfaces and materials of the AGR-1 test train; the
+    materials block starts with the TR cards of the compacts.
+    """
+    cells = """c
+99970 8900 -1.164e-03 -97064     98000 -98001  $ bottom air filler
+99971 9000 -8.03      -97064     98001 -98002  vol=8.6736  $ capsule support
+99972 9040 -1.015     -97064     98002 -98003  $ graphite spacer
+"""
+
+    for cap, particle in capsule_particle.items():
 
-    limit = 98004 + (cap-1)*7
-    cells += f"""c Capsule {cap}
+        limit = 98004 + (cap-1)*7
+        cells += f"""c Capsule {cap}
 9{cap}000 900{cap} -8.03      -97064         {limit-1} -{limit}  vol=6.179954  $ bottom support: ss316L
 9{cap}001 904{cap} -1.015     -97060         {limit} -{limit+1}  vol=5.027315  $ lower graphite spacer: graphite
 """
 
-    for stack in range(1, 4):
-        c = int(cap*1000 + stack*100)
-        s1, s2 = stack_cylinders[stack]
-        cells += f"""c
+        for stack in range(1, 4):
+            c = int(cap*1000 + stack*100)
+            s1, s2 = stack_cylinders[stack]
+            cells += f"""c
 9{c} 8902  1.2493e-4  {s1} -{s2}  {limit+1} -{limit+3}  $ stack {stack} gas gap 
 """
-        for comp in range(1, 5):
-            c = int(90000 + cap*1000 + stack*100 + 2*(comp-1)*10)
-            u = int(cap*100 + stack*10 + comp)
-            cells += compact_cells(cap, stack, comp, particle)
-            cx, cy, cz = compact_center(cap, stack, comp)
-
-            if comp == 1:
-                cells += f"""c
-{c+11} 0               -{s1}         {limit+1} -{limit+47} fill={u}0  ({cx:.6f} {cy:.6f} {cz:.6f})
-"""
-            elif comp == 2:
+            for comp in range(1, 5):
+                c, _, _, u = compact_numbers(cap, stack, comp)
+                cells += compact_cells(cap, stack, comp, particle)
+                bottom, top = compact_planes[comp-1]
                 cells += f"""c
-{c+11} 0               -{s1}         {limit+47} -{limit+2} fill={u}0  ({cx:.6f} {cy:.6f} {cz:.6f})
-"""
-            elif comp == 3:
-                cells += f"""c
-{c+11} 0               -{s1}         {limit+2} -{limit+48} fill={u}0  ({cx:.6f} {cy:.6f} {cz:.6f})
-"""
-            elif comp == 4:
-                cells += f"""c
-{c+11} 0               -{s1}         {limit+48} -{limit+3} fill={u}0  ({cx:.6f} {cy:.6f} {cz:.6f})
+{c+11} 0               -{s1}         {limit+bottom} -{limit+top} fill={u}0 ({u})
 """
 
-    if cap == 1:
-        cells += f"""c
+        if cap == 1:
+            cells += f"""c
 9{cap}080 9070 -1.7695     97012 97022 97032 -97060   {limit+1} -{limit+3}  vol=34.27310  $ compact holder: borated graphite
 """
-    elif cap == 2:
-        cells += f"""c
+        elif cap == 2:
+            cells += f"""c
 9{cap}080 9072 -1.7788     97012 97022 97032 -97060   {limit+1} -{limit+3}  vol=34.27310  $ compact holder: borated graphite
 """
-    elif cap == 3:
-        cells += f"""c
+        elif cap == 3:
+            cells += f"""c
 9{cap}080 9073 -1.7788     97012 97022 97032 -97060   {limit+1} -{limit+3}  vol=34.27310  $ compact holder: borated graphite
 """
-    elif cap == 4:
-        cells += f"""c
+        elif cap == 4:
+            cells += f"""c
 9{cap}080 9074 -1.7788     97012 97022 97032 -97060   {limit+1} -{limit+3}  vol=34.27310  $ compact holder: borated graphite
 """
-    elif cap == 5:
-        cells += f"""c
+        elif cap == 5:
+            cells += f"""c
 9{cap}080 9075 -1.7788     97012 97022 97032 -97060   {limit+1} -{limit+3}  vol=34.27310  $ compact holder: borated graphite
 """
-    elif cap == 6:
-        cells += f"""c
+        elif cap == 6:
+            cells += f"""c
 9{cap}080 9071 -1.7695     97012 97022 97032 -97060   {limit+1} -{limit+3}  vol=34.27310  $ compact holder: borated graphite
 """
 
-    cells += f"""c
+        cells += f"""c
 9{cap}081 905{cap} -0.95      -97060         {limit+3} -{limit+4}  vol=6.297955  $ upper graphite spacer: graphite
 9{cap}090 8902  1.2493e-4  97060 -97061  {limit} -{limit+4}  $ holder gas gap: he
 9{cap}091 901{cap} -8.03       97061 -97062  {limit} -{limit+4}  vol=4.052581  $ inner wall: ss316L
@@ -299,12 +348,12 @@ for cap, particle in capsule_particle.items():
 9{cap}098 902{cap} -8.03      -97064         {limit+4} -{limit+5}  vol=8.239939  $ top support: ss316L
 """
 
-    if cap < 6:
-        cells += f"""c
+        if cap < 6:
+            cells += f"""c
 9{cap}099 8902  1.2493e-4  -97064         {limit+5} -{limit+6}  $ capsule {cap}-{cap+1}: gas plenum: he
 """
 
-cells += f"""c
+    cells += f"""c
 99973 8900 -1.164e-03 -97064     98044 -98045 $ top air filler
 99980 9031 -8.03       97064 -97065  98000 -98090 vol=49.216462  $ capsule wall: ss316L
 99981 9032 -8.03       97064 -97065  98090 -98091 vol=22.532566  $ capsule wall: ss316L
@@ -314,7 +363,7 @@ cells += f"""c
 99985 9036 -8.03       97064 -97065  98094 -98045 vol=52.339826  $ capsule wall: ss316L
 99990 8901 -0.9853     97065 -97066  98000 -98045 $ ATR channel: h2o"""
 
-surfaces = """c
+    surfaces = """c
 97011 c/z   25.547039 -24.553123   0.63500  $ Stack 1 Compact outer R
 97012 c/z   25.547039 -24.553123   0.64135  $ Stack 1 Gas gap outer R
 97021 c/z   24.553123 -25.547039   0.63500  $ Stack 2 Compact outer R
@@ -393,181 +442,92 @@ c
 98043 pz  104.98328
 98044 pz  105.94848
 98045 pz  127.00000"""
-for cap, particle in capsule_particle.items():
-    for stack in range(1, 4):
-        for comp in range(1, 5):
-            s = int(9000 + cap*100 + stack*10 + comp)
-            surfaces += compact_surfaces(s, thick[particle], n_particles[particle])
+    for cap, particle in capsule_particle.items():
+        for stack in range(1, 4):
+            for comp in range(1, 5):
+                _, s, _, _ = compact_numbers(cap, stack, comp)
+                surfaces += compact_surfaces(s, thick[particle], n_particles[particle])
 
-materials = """c 
+    card = mcnp_materials.card
+    materials = f"""c 
 c air, density = -1.164e-03
-m8900
-      7014.80c -0.76
-      8016.80c -0.24
+{card(8900, air)}
 c
 c light water, 62 C, 2.5 MPa, density ~= 0.9853 g/mc3
-m8901
-      1001.00c  2
-      8016.00c  1
+{card(8901, light_water)}
 c
 c helium, NT = 1.24931E-04 a/b/cm
-m8902
-      2004.00c  1
-c"""
-
-materials_ss = """
-     24050.00c -0.00653131
-     24052.00c -0.14263466
-     24053.00c -0.01730730
-     24054.00c -0.00352673
-     25055.00c -0.02000000
-     26054.00c -0.03799186
-     26056.00c -0.60409084
-     26057.00c -0.01336731
-     28058.00c -0.08053185
-     28060.00c -0.03185216
-     28061.00c -0.00124553
-     28062.00c -0.00506366
-     28064.00c -0.00130679
-     42092.00c -0.00354458
-     42094.00c -0.00220235
-     42095.00c -0.00395701
-     42096.00c -0.00424858
-     42097.00c -0.00239899
-     42098.00c -0.00612312
-     42100.00c -0.00252537
-c"""
-
-materials += f"""\nc ss316l, density = 8.03 g/cm3
-m9000"""
-materials += materials_ss
-
-for idx in range(0, 4):
-    for cap, particle in capsule_particle.items():
-        materials += f"""\nc ss316l, density = 8.03 g/cm3
-m90{idx}{cap}"""
-        materials += materials_ss
+{card(8902, helium)}
+c"""
 
-materials_graph = """
-      6012.00c  0.9890
-      6013.00c  0.0110
+    materials += f"""\nc ss316l, density = 8.03 g/cm3
+{card(9000, ss316l)}
 c"""
 
-materials += f"""\nc pure graphite (lower spacer) density = 1.015 g/cm3
-m9040"""
-materials += materials_graph
+    for idx in range(0, 4):
+        for cap, particle in capsule_particle.items():
+            materials += f"""\nc ss316l, density = 8.03 g/cm3
+{card(f'90{idx}{cap}', ss316l)}
+c"""
 
-for cap, particle in capsule_particle.items():
     materials += f"""\nc pure graphite (lower spacer) density = 1.015 g/cm3
-m904{cap}"""
-    materials += materials_graph
-
-    materials += f"""\nc pure graphite (upper spacer) density = 0.95 g/cm3
-m905{cap}"""
-    materials += materials_graph
-
-materials += """\nc borated graphite holder, 4.76 atom percent boron, 1.7695 g/cm3, capsule 1,6
-m9070    
-      6012.00c  8.4900E-2
-      5010.20c  8.4496E-4
-      5011.00c  3.4003E-3
-m9071    
-      6012.00c  8.4900E-2
-      5010.20c  8.4496E-4
-      5011.00c  3.4003E-3
+{card(9040, graphite)}
+c"""
+
+    for cap, particle in capsule_particle.items():
+        materials += f"""\nc pure graphite (lower spacer) density = 1.015 g/cm3
+{card(f'904{cap}', graphite)}
+c"""
+
+        materials += f"""\nc pure graphite (upper spacer) density = 0.95 g/cm3
+{card(f'905{cap}', graphite)}
+c"""
+
+    materials += f"""\nc borated graphite holder, 4.76 atom percent boron, 1.7695 g/cm3, capsule 1,6
+{card(9070, borated_graphite[1])}
+{card(9071, borated_graphite[1])}
 c
 c borated graphite holder, 6.05 atom percent boron, 1.7788 g/cm3, capsule 2-5
-m9072    
-      6012.00c  8.4300E-2
-      5010.20c  1.0804E-3
-      5011.00c  4.3476E-3
-m9073    
-      6012.00c  8.4300E-2
-      5010.20c  1.0804E-3
-      5011.00c  4.3476E-3
-m9074    
-      6012.00c  8.4300E-2
-      5010.20c  1.0804E-3
-      5011.00c  4.3476E-3
-m9075    
-      6012.00c  8.4300E-2
-      5010.20c  1.0804E-3
-      5011.00c  4.3476E-3
-c"""
-
-materials_hf = """
-      8016.00c  1.3500E-4
-      6012.00c  4.4300E-5
-     14028.00c  6.3341E-6
-     14029.00c  3.2289E-7
-     14030.00c  2.1297E-7
-     40090.00c  1.0169E-3
-     40091.00c  2.2288E-4
-     40092.00c  3.4029E-4
-     40094.00c  3.4626E-4
-     40096.00c  5.5719E-5
-     72174.00c  6.7512E-5
-     72176.00c  2.1934E-3
-     72177.00c  7.8473E-3
-     72178.00c  1.1431E-2
-     72179.00c  5.7955E-3
-     72180.00c  1.4845E-2
-c"""
-
-for cap, particle in capsule_particle.items():
-    materials += f"""\nc hafnium shroud
-m908{cap}"""
-    materials += materials_hf
-
-
-materials +="""\nc
+{card(9072, borated_graphite[2])}
+{card(9073, borated_graphite[2])}
+{card(9074, borated_graphite[2])}
+{card(9075, borated_graphite[2])}
+c"""
+
+    for cap, particle in capsule_particle.items():
+        materials += f"""\nc hafnium shroud
+{card(f'908{cap}', hafnium)}
+c"""
+
+    materials += f"""\nc
 c TRISO
 c
 c buffer, density: 1.10 g/cm3
-m9090
-      6012.00c  0.9890  
-      6013.00c  0.0110
+{card(9090, graphite)}
 c
 c IPyc, density= baseline: 1.904, variant1: 1.853, variant2: 1.912, variant3: 1.904 g/cm3
-m9091
-      6012.00c  0.9890  
-      6013.00c  0.0110
+{card(9091, graphite)}
 c
 c SiC, density= baseline: 3.208, variant1: 3.206, variant2: 3.207, variant3: 3.205 g/cm3
-m9092
-     14028.00c  0.9220
-     14029.00c  0.0470
-     14030.00c  0.0310
-      6012.00c  0.9890  
-      6013.00c  0.0110
+{card(9092, silicon_carbide)}
 c
 c OPyc, density= baseline: 1.907, variant1: 1.898, variant2: 1.901, variant3: 1.911 g/cm3
-m9093
-      6012.00c  0.9890  
-      6013.00c  0.0110
+{card(9093, graphite)}
 c
 c matrix, density= baseline: 1.297, variant1: 1.219, variant2: 1.256, variant3: 1.344 g/cm3
-m9094
-      6012.00c  0.9890  
-      6013.00c  0.0110
+{card(9094, graphite)}
 c"""
 
-materials_uco = """
-     92234.00c  3.34179E-03
-     92235.00c  1.99636E-01
-     92236.00c  1.93132E-04
-     92238.00c  7.96829E-01
-      6012.00c  0.3217217
-      6013.00c  0.0035783
-      8016.00c  1.3613
+    for cap, particle in capsule_particle.items():
+        for stack in range(1, 4):
+            for comp in range(1, 5):
+                materials += f"""\nc kernel, UCO: density=10.924 g/cm3
+{card(f'9{cap}{stack}{comp}', uco)}
 c"""
 
-for cap, particle in capsule_particle.items():
-    for stack in range(1, 4):
-        for comp in range(1, 5):
-            materials += f"""\nc kernel, UCO: density=10.924 g/cm3
-m9{cap}{stack}{comp}"""
-            materials += materials_uco
+    materials = compact_transforms(capsule_particle.keys()) + '\n' + materials
+
+    return cells, surfaces, materials
 
 
 #
@@ -735,101 +695,9 @@ se_surfaces.append(surf)
 
 drum_surfaces['se'] = dict(zip(angles, se_surfaces))
 
-#
-# TIME
-#
-power_df = pd.read_csv('power.csv', index_col="Cumulative Timestep")
-cycles_by_timestep = power_df['Cycle'].to_list()
-time_interval = power_df["Time Interval(hrs)"].to_numpy()
-time_interval_by_cycle = {}
-cum_time = {}
-prev = 0
-for cycle in cycles:
-    time_steps = cycles_by_timestep.count(cycle)
-    time_interval_by_cycle[cycle] = time_interval[prev:prev+time_steps]
-    cum_time[cycle] = np.cumsum(time_interval_by_cycle[cycle])
-    prev += time_steps
-
-#
-# OSCC
-#
-oscc_df = pd.read_csv('oscc.csv', index_col="Cumulative Timestep")
-oscc = {}
-oscc['nw'] = oscc_df["NWOSCC(degrees)"].to_numpy()
-oscc['sw'] = oscc_df["SWOSCC(degrees)"].to_numpy()
-oscc['ne'] = oscc_df["NEOSCC(degrees)"].to_numpy()
-oscc['se'] = oscc_df["SEOSCC(degrees)"].to_numpy()
-
-oscc_by_cycle = {}
-prev = 0
-for cycle in cycles:
-    time_steps = cycles_by_timestep.count(cycle)
-    oscc_by_cycle[cycle] = {}
-    for key, values in oscc.items():
-        oscc_by_cycle[cycle][key] = values[prev:prev+time_steps]
-    prev += time_steps
-
-# Plot OSCC positions
-for cycle in cycles:
-    plt.figure()
-    time = np.roll(cum_time[cycle], 1)
-    time[0] = 0
-    width = cum_time[cycle] - time
-    for key, values in oscc_by_cycle[cycle].items():
-        plt.step(time, values, where='post', label=key.split('_')[0].upper())
-    plt.legend()
-    plt.ylabel(r'Rotation angle [$^\circ$]')
-    plt.xlabel('Time [h]')
-    plt.savefig(f'oscc_cycle_{cycle}')
-    plt.close()
-
-# get ave oscc degree by cycle for each group (ne, se)
-oscc_surfaces = {}
-for cycle, angle_by_group in oscc_by_cycle.items():
-    oscc_surfaces[cycle] = """"""
-    for group, angle in angle_by_group.items():
-        if group in useful_drums:
-            ave_angle = (angle * time_interval_by_cycle[cycle]).sum() / cum_time[cycle][-1]
-            angle = find_closest_value(angles, ave_angle)
-            # print(ave_angle, angle)
-            oscc_surfaces[cycle] += drum_surfaces[group][angle]
-
 #
 # Neck Shim Rods
 #
-neck_df = pd.read_csv('neck_shim.csv', index_col="Cumulative Timestep")
-neck = {}
-
-rods = [
-    "NE 1", "NE 2", "NE 3", "NE 4", "NE 5", "NE 6",
-    "SE 1", "SE 2", "SE 3", "SE 4", "SE 5", "SE 6",
-    ]
-for rod in rods:
-    neck[rod] = neck_df[rod].to_numpy()
-
-neck_by_cycle = {}
-prev = 0
-for cycle in cycles:
-    time_steps = cycles_by_timestep.count(cycle)
-    neck_by_cycle[cycle] = {}
-    for key, values in neck.items():
-        neck_by_cycle[cycle][key] = values[prev:prev+time_steps]
-    prev += time_steps
-
-# Plot Neck Shim insertion condition
-for cycle in cycles:
-    plt.figure()
-    time = np.roll(cum_time[cycle], 1)
-    time[0] = 0
-    width = cum_time[cycle] - time
-    for key, values in neck_by_cycle[cycle].items():
-        plt.step(time, values, where='post', label=key.split('_')[0])
-    plt.legend()
-    plt.ylabel(r'Insertion condition')
-    plt.xlabel('Time [h]')
-    plt.savefig(f'neck_cycle_{cycle}')
-    plt.close()
-
 neck_materials = {
     0: (10, 1.00276E-1),
     1: (71, 4.55926E-2),
@@ -850,6 +718,25 @@ neck_shim = {
     'SE 6': (817, 816, 817),
 }
 
+# history group: (file, {key: column})
+history_columns = {
+    'power': ('power.csv', {
+        'nw_lobe_power': 'NWLobePower(MW)',
+        'ne_lobe_power': 'NELobePower(MW)',
+        'c_lobe_power': 'CLobePower(MW)',
+        'sw_lobe_power': 'SWLobePower(MW)',
+        'se_lobe_power': 'SELobePower(MW)',
+        'total_power': 'TotalCorePower(MW)',
+    }),
+    'oscc': ('oscc.csv', {
+        'nw': 'NWOSCC(degrees)',
+        'sw': 'SWOSCC(degrees)',
+        'ne': 'NEOSCC(degrees)',
+        'se': 'SEOSCC(degrees)',
+    }),
+    'neck': ('neck_shim.csv', {rod: rod for rod in neck_shim}),
+}
+
 def get_neck_shim_cells(vals, mat, rod, condition):
     state = 'withdrawn' if condition == 0 else 'inserted'
 
@@ -859,13 +746,93 @@ def get_neck_shim_cells(vals, mat, rod, condition):
 c"""
     return neck_cells
 
-ne_cells = {}
-se_cells = {}
-for cycle, rod_insertion in neck_by_cycle.items():
-    ne_cells[cycle] = """"""
-    se_cells[cycle] = """"""
-    for rod, insertion in rod_insertion.items():
-        ave_insertion = (insertion * time_interval_by_cycle[cycle]).sum() / cum_time[cycle][-1]
+
+# --------------------
+#
+# --- TIME HISTORY
+#
+# --------------------
+def read_history(path=DATA_DIR):
+    """
+    Reads the ATR operating history (power.csv, oscc.csv and neck_shim.csv
+    in 'path') and splits it by cycle. The csv files are parsed once into
+    'history.npz' (see history_store.py), which is memory-mapped until a
+    file changes.
+
+    Returns
+    -------
+    history: dict
+        'time_interval': time step lengths [h] by cycle
+        'cum_time': cumulative time [h] by cycle
+        'oscc': OSCC rotation angles [deg] by cycle and drum group
+        'neck': neck shim insertion conditions by cycle and rod
+        'power': lobe powers [MW] by cycle and lobe
+    """
+    return HistoryStore.cached(path, history_columns).history(cycles)
+
+
+def cycle_average(values, history, cycle):
+    """ Returns the time averaged value of 'values' over 'cycle' """
+    return (values * history['time_interval'][cycle]).sum() / history['cum_time'][cycle][-1]
+
+
+def cycle_averages(history, cycle):
+    """
+    Returns the time averages of 'cycle': 'time', its length [h], and the
+    averaged 'oscc' angles, 'neck' shim insertions and 'power' by key (as
+    ingest.averages, from the state of the incremental ingest).
+    """
+    averages = {'time': history['cum_time'][cycle][-1]}
+    for group in ('oscc', 'neck', 'power'):
+        averages[group] = {key: cycle_average(values, history, cycle)
+                           for key, values in history[group][cycle].items()}
+    return averages
+
+
+def plot_history(history, cycles=cycles, path='.'):
+    """
+    Plots the OSCC positions, neck shim insertion conditions and lobe powers
+    of each cycle ('oscc_cycle_<cycle>', 'neck_cycle_<cycle>' and
+    'power_cycle_<cycle>' in 'path').
+    """
+    import matplotlib.pyplot as plt
+
+    plots = [
+        ('oscc', r'Rotation angle [$^\circ$]', True),
+        ('neck', r'Insertion condition', False),
+        ('power', 'Power [MW]', True),
+    ]
+    for cycle in cycles:
+        time = np.roll(history['cum_time'][cycle], 1)
+        time[0] = 0
+        for name, ylabel, upper in plots:
+            plt.figure()
+            for key, values in history[name][cycle].items():
+                if 'total' in key:
+                    continue
+                label = key.split('_')[0]
+                plt.step(time, values, where='post', label=label.upper() if upper else label)
+            plt.legend()
+            plt.ylabel(ylabel)
+            plt.xlabel('Time [h]')
+            plt.savefig(os.path.join(path, f'{name}_cycle_{cycle}'))
+            plt.close()
+
+
+def cycle_cards(averages):
+    """
+    Returns the OSCC surfaces and the NE and SE neck shim cells of a cycle,
+    from its averaged drum angles and rod insertions ('cycle_averages').
+    """
+    oscc_surfaces = """"""
+    for group, ave_angle in averages['oscc'].items():
+        if group in useful_drums:
+            angle = find_closest_value(angles, ave_angle)
+            oscc_surfaces += drum_surfaces[group][angle]
+
+    ne_cells = """"""
+    se_cells = """"""
+    for rod, ave_insertion in averages['neck'].items():
         condition = int(np.rint(ave_insertion))
         mat = neck_materials[condition]
         vals = neck_shim[rod]
@@ -875,118 +842,211 @@ for cycle, rod_insertion in neck_by_cycle.items():
             cell_value += '\n'
 
         if 'NE' in rod:
-            ne_cells[cycle] += cell_value
+            ne_cells += cell_value
         elif 'SE' in rod:
-            se_cells[cycle] += cell_value
-
-if 'mcnp' not in os.listdir('./'):
-    os.mkdir('mcnp')
+            se_cells += cell_value
+    return oscc_surfaces, ne_cells, se_cells
 
-filename = {cycle: f'bench_{cycle}' for cycle in cycles}
-env = Environment(loader=FileSystemLoader('./'))
 
-for cycle in cycles:
+def cycle_power(averages):
+    """ Returns the cycle averaged power of the NE, C and SE lobes [MW] """
+    add_power = 0
+    for lobe_long, power in averages['power'].items():
+        lobe = lobe_long.split('_')[0]
+        if lobe in useful_lobes:
+            add_power += power/3
+    return add_power
+
+
+def build_bench_decks(train, history, cycles=cycles, path=DATA_DIR, averages=None):
+    """
+    Renders the ATR bench deck of each cycle from 'bench.template' in 'path'.
+
+    Parameters
+    ----------
+    train: tuple of str
+        cells, surfaces and materials from 'build_train'
+    history: dict
+        from 'read_history'
+    averages: dict
+        keys: cycle, values: 'cycle_averages' of the cycle, used instead of
+        'history' (e.g. from the incremental ingest)
+
+    Returns
+    -------
+    decks: dict
+        keys: file name ('bench_<cycle>'), values: deck
+    """
+    from jinja2 import Environment, FileSystemLoader
+
+    cells, surfaces, materials = train
+    env = Environment(loader=FileSystemLoader(path))
     template = env.get_template('bench.template')
-    full_input = template.render(
-        cells=cells,
-        surfaces=surfaces,
-        materials=materials,
-        oscc_surfaces=oscc_surfaces[cycle],
-        ne_cells=ne_cells[cycle],
-        se_cells=se_cells[cycle],
-        )
-
-    with open(f'mcnp/{filename[cycle]}', 'w+') as f:
-        f.write(full_input)
-
-cells += """\nc
+
+    decks = {}
+    for cycle in cycles:
+        cycle_values = averages[cycle] if averages else cycle_averages(history, cycle)
+        oscc_surfaces, ne_cells, se_cells = cycle_cards(cycle_values)
+        decks[f'bench_{cycle}'] = template.render(
+            cells=cells,
+            surfaces=surfaces,
+            materials=materials,
+            oscc_surfaces=oscc_surfaces,
+            ne_cells=ne_cells,
+            se_cells=se_cells,
+            )
+    return decks
+
+
+def build_sdr_deck(train):
+    """ Returns the shutdown dose rate deck: the test train in a room of air """
+    cells, surfaces, materials = train
+    cells += """\nc
 99991 8900 -1.164e-03  (97066:-98000:98045)  -99000 $ Room
 99999 0                99000
 """
 
-surfaces += f"""\nc
+    surfaces += f"""\nc
 c Room
 99000 rpp  {(-100+25.337):.3f} {(100+25.337):.3f}  {(-100-25.337):.3f} {(100-25.337):.3f}   -2.54000 {(200-2.5):.3f}
 """
 
-moaa_xml = 'mcnp/sdr-agr.i'
-with open(moaa_xml, 'w+') as f:
-    f.write('AGR PIE MCNP model\nc\nc Cells\n')
-    f.write(cells)
-    f.write('\nc\nc Surfaces\n')
-    f.write(surfaces)
-    f.write('\nc\nc Materials\n')
-    f.write(materials)
-    f.write('\nimp:p   1  880r  0')
+    deck = 'AGR PIE MCNP model\nc\nc Cells\n'
+    deck += cells
+    deck += '\nc\nc Surfaces\n'
+    deck += surfaces
+    deck += '\nc\nc Materials\n'
+    deck += materials
+    deck += '\nimp:p   1  880r  0'
+    return deck
+
+
+def irradiation_schedule(history, cycles=cycles, averages=None):
+    """
+    Returns the MOAA power history as a list of cases: one irradiation case
+    per cycle and one shutdown case after each cycle but the last, each a
+    dict of 'cycle', 'kind' ('irradiation' or 'shutdown'), 'deck', 'time'
+    [days] and 'power' [MW]. 'averages' is used instead of 'history' as in
+    'build_bench_decks'.
+    """
+    schedule = []
+    for cycle in cycles:
+        cycle_values = averages[cycle] if averages else cycle_averages(history, cycle)
+        time = cycle_values['time'] / 24  # hours -> days
+        schedule.append({'cycle': cycle, 'kind': 'irradiation', 'deck': f'bench_{cycle}',
+                         'time': time, 'power': cycle_power(cycle_values)})
+        if cycle in shutdown_cycle:
+            schedule.append({'cycle': cycle, 'kind': 'shutdown', 'deck': f'bench_{cycle}',
+                             'time': shutdown_cycle[cycle], 'power': 0})
+    return schedule
+
+
+def irradiation_cases(history, cycles=cycles, averages=None):
+    """ Returns the MOAA power history (see 'irradiation_schedule') as MOAA text """
+    cases = """"""
+    for case in irradiation_schedule(history, cycles, averages):
+        if case['kind'] == 'shutdown':
+            cases += '\n'
+        cases += define_irrad_case(case['deck'], case['time'], case['power'])
+        if case['kind'] == 'shutdown':
+            cases += '\n'
+    return cases
+
+
+def fuel_cells(index):
+    """ Returns the MOAA fuel cell list of a CellIndex """
+    cells = """"""
+    for path in index.moaa_paths():
+        cells += f"""\n    cell number: {path}"""
+    return cells
 
 
-# --------------------
-#
-# --- DEPLETION
-#
-# --------------------
-#
-# POWER
-#
-power = {}
-power['nw_lobe_power'] = power_df["NWLobePower(MW)"].to_numpy()
-power['ne_lobe_power'] = power_df["NELobePower(MW)"].to_numpy()
-power['c_lobe_power'] = power_df["CLobePower(MW)"].to_numpy()
-power['sw_lobe_power'] = power_df["SWLobePower(MW)"].to_numpy()
-power['se_lobe_power'] = power_df["SELobePower(MW)"].to_numpy()
-power['total_power'] = power_df["TotalCorePower(MW)"].to_numpy()
-
-power_by_cycle = {}
-prev = 0
-for cycle in cycles:
-    time_steps = cycles_by_timestep.count(cycle)
-    power_by_cycle[cycle] = {}
-    for key, values in power.items():
-        power_by_cycle[cycle][key] = values[prev:prev+time_steps]
-    prev += time_steps
-
-# plot power vs time for all lobes
-for cycle in cycles:
-    plt.figure()
-    time = np.roll(cum_time[cycle], 1)
-    time[0] = 0
-    for key, values in power_by_cycle[cycle].items():
-        if 'total' not in key:
-            plt.step(time, values, where='post', label=key.split('_')[0].upper())
-    plt.legend()
-    plt.ylabel('Power [MW]')
-    plt.xlabel('Time [h]')
-    plt.savefig(f'power_cycle_{cycle}')
-    plt.close()
-
-# get ave power by cycle for each lobe
-e_power_by_cyle = {}
-for cycle, power_by_lobe in power_by_cycle.items():
-    add_power = 0
-    for lobe_long, power in power_by_lobe.items():
-        lobe = lobe_long.split('_')[0]
-        if lobe in useful_lobes:
-            ave_power = (power * time_interval_by_cycle[cycle]).sum() / cum_time[cycle][-1]
-            add_power += ave_power/3
-    e_power_by_cyle[cycle] = add_power
-
-irradiation_cases = """"""
-for cycle in cycles:
-    time = cum_time[cycle][-1] / 24  # hours -> days
-    irradiation_cases += define_irrad_case(filename[cycle], time, e_power_by_cyle[cycle])
-    if cycle is not cycles[-1]:
-        irradiation_cases += '\n'
-        irradiation_cases += define_irrad_case(filename[cycle], shutdown_cycle[cycle], 0)
-        irradiation_cases += '\n'
-
-cells = """"""
-for cap, particle in capsule_particle.items():
-    for stack in range(1, 4):
-        for comp in range(1, 5):
-            c = int(90000 + cap*1000 + stack*100 + 2*(comp-1)*10)
-            cells += f"""\n    cell number: {c+1}<{c+8}<{c+10}<{c+11}"""
-
-print("\nPower History:")
-print(irradiation_cases)
-print("\nFuel cells:")
-print(cells)
+def write_decks(decks, output='mcnp'):
+    """ Writes the decks ({file name: deck}) into the 'output' directory """
+    os.makedirs(output, exist_ok=True)
+    for name, deck in decks.items():
+        with open(os.path.join(output, name), 'w+') as f:
+            f.write(deck)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('command', nargs='?', default='all',
+                        choices=['all', 'bench', 'sdr', 'moaa', 'plots'],
+                        help='bench decks, SDR deck, MOAA power history and fuel cells, '
+                             'history plots, or all of them (default)')
+    parser.add_argument('--cycles', nargs='+', choices=cycles, default=cycles, metavar='CYCLE',
+                        help='ATR cycles (default: all)')
+    parser.add_argument('--data', default=DATA_DIR,
+                        help='directory with power.csv, oscc.csv, neck_shim.csv and bench.template')
+    parser.add_argument('--output', default='mcnp', help='directory for the decks and cell_index.json')
+    parser.add_argument('--plots', default='.', help='directory for the history plots')
+    parser.add_argument('--incremental', action='store_true',
+                        help='ingest only the timesteps appended to the history files since the last run '
+                             '(state in <output>/history_state.json) and write the bench decks and '
+                             'irradiation cases of their cycles; no plots')
+    parser.add_argument('--manifest', metavar='FILE',
+                        help='with moaa or all, also write the irradiation cases and depletion cells '
+                             '(.yaml or .xml) after checking them against the bench decks in --output')
+    args = parser.parse_args(argv)
+
+    command = args.command
+    selected = [cycle for cycle in cycles if cycle in args.cycles]
+    history, averages, state = None, None, None
+    if args.incremental and command in ('all', 'bench', 'moaa'):
+        import ingest
+
+        state_file = os.path.join(args.output, 'history_state.json')
+        state, affected = ingest.ingest(args.data, history_columns, ingest.load_state(state_file))
+        # cycles missing from 'cycles' are new ones, always written
+        selected = [cycle for cycle in affected if cycle in args.cycles or cycle not in cycles]
+        averages = {cycle: ingest.averages(state, cycle) for cycle in selected}
+        print(f"New timesteps up to {state['timestep']} in cycles: {' '.join(affected) or '-'}")
+    elif command != 'sdr':
+        history = read_history(args.data)
+
+    if command in ('all', 'plots') and history is not None:
+        plot_history(history, selected, args.plots)
+
+    decks = {}
+    if command in ('all', 'bench', 'sdr'):
+        train = build_train()
+        if command != 'sdr':
+            decks.update(build_bench_decks(train, history, selected, args.data, averages))
+        if command != 'bench':
+            decks['sdr-agr.i'] = build_sdr_deck(train)
+    if decks:
+        write_decks(decks, args.output)
+
+    if command in ('all', 'moaa'):
+        index = CellIndex(capsule_particle.keys())
+        os.makedirs(args.output, exist_ok=True)
+        index.save(os.path.join(args.output, 'cell_index.json'))
+
+        print("\nPower History:")
+        print(irradiation_cases(history, selected, averages))
+        print("\nFuel cells:")
+        print(fuel_cells(index))
+
+        if args.manifest:
+            import moaa_manifest
+
+            if state is not None:
+                # every cycle ingested so far, not only the updated ones
+                schedule = irradiation_schedule(None, list(state['cycles']),
+                                                {cycle: ingest.averages(state, cycle) for cycle in state['cycles']})
+            else:
+                schedule = irradiation_schedule(history, selected)
+            manifest = moaa_manifest.manifest(schedule, index)
+            problems = moaa_manifest.validate(manifest, args.output)
+            if problems:
+                sys.exit('\n'.join(problems))
+            moaa_manifest.write(manifest, args.manifest)
+
+    if state is not None:
+        os.makedirs(args.output, exist_ok=True)
+        ingest.save_state(state, state_file)
+
+
+if __name__ == "__main__":
+    main()
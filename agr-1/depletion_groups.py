@@ -0,0 +1,235 @@
+""" Clusters depletion cells into groups from a pilot burnup or heating result """
+import re
+import argparse
+import numpy as np
+from cell_index import CellIndex
+import mcnp_deck
+
+
+def cluster(values, budget):
+    """
+    Groups cells whose values stay within 'budget' of the group mean.
+
+    The cells are sorted by their mean value and swept once: a cell joins the
+    current group as long as every member, for every column, deviates from
+    the group mean by less than 'budget' (relative). Otherwise it starts a new
+    group.
+
+    Parameters
+    ----------
+    values: array of float
+        shape (n_cells,) or (n_cells, n_columns), e.g. burnup by time step or
+        heating by cell
+    budget: float
+        maximum relative deviation from the group mean, e.g. 0.02
+
+    Returns
+    -------
+    labels: np.ndarray
+        group id of each cell, groups numbered by increasing mean value
+    """
+    values = np.asarray(values, dtype=float)
+    if values.ndim == 1:
+        values = values[:, None]
+    order = np.argsort(values.mean(axis=1), kind='stable')
+    labels = np.empty(len(values), dtype=int)
+
+    group = 0
+    start = order[0]
+    total, lo, hi, count = values[start].copy(), values[start].copy(), values[start].copy(), 1
+    labels[start] = group
+    for i in order[1:]:
+        v = values[i]
+        n_total, n_count = total + v, count + 1
+        n_lo, n_hi = np.minimum(lo, v), np.maximum(hi, v)
+        mean = n_total / n_count
+        with np.errstate(divide='ignore', invalid='ignore'):
+            dev = np.maximum(n_hi - mean, mean - n_lo) / np.abs(mean)
+        dev = np.where(mean == 0, np.where(n_hi == n_lo, 0, np.inf), dev)
+        if dev.max() <= budget:
+            total, lo, hi, count = n_total, n_lo, n_hi, n_count
+        else:
+            group += 1
+            total, lo, hi, count = v.copy(), v.copy(), v.copy(), 1
+        labels[i] = group
+    return labels
+
+
+def _group_means(values, labels):
+    """ Returns the mean of each group, shape (n_groups, n_columns) """
+    n_groups = labels.max() + 1
+    sums = np.zeros((n_groups, values.shape[1]))
+    np.add.at(sums, labels, values)
+    return sums / np.bincount(labels, minlength=n_groups)[:, None]
+
+
+def _relative(values, ref):
+    """ Returns |values/ref - 1|, zero where they are equal """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        err = np.abs(values / ref - 1)
+    return np.where(values == ref, 0, err)
+
+
+def group_leads(values, labels):
+    """
+    Returns the lead of each group: the member closest to the group mean
+    (smallest largest relative deviation over the columns). MOAA depletes
+    the whole group with the flux and composition of its lead.
+
+    Returns
+    -------
+    leads: np.ndarray
+        index of the lead cell of each group, by group id
+    """
+    values = np.asarray(values, dtype=float)
+    if values.ndim == 1:
+        values = values[:, None]
+    deviation = _relative(values, _group_means(values, labels)[labels]).max(axis=1)
+    order = np.lexsort((deviation, labels))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = labels[order][1:] != labels[order][:-1]
+    return order[first]
+
+
+def group_error(values, labels, leads=None):
+    """
+    Returns the accuracy loss of depleting each cell with its group lead,
+    relative to the lead value.
+
+    Parameters
+    ----------
+    leads: array of int
+        lead of each group (see 'group_leads', the default)
+
+    Returns
+    -------
+    max_error: float
+        maximum relative error over all cells and columns
+    rms_error: float
+        root mean square relative error
+    """
+    values = np.asarray(values, dtype=float)
+    if values.ndim == 1:
+        values = values[:, None]
+    leads = group_leads(values, labels) if leads is None else np.asarray(leads)
+    err = _relative(values, values[leads][labels])
+    return err.max(), np.sqrt((err**2).mean())
+
+
+def fuel_groups(store, budget, time=None):
+    """
+    Clusters the kernel cells of a BurnupStore (those in its results).
+
+    Parameters
+    ----------
+    store: BurnupStore
+    budget: float
+        maximum relative deviation from the group mean
+    time: int, float or None
+        time used for the clustering, None uses the whole history
+
+    Returns
+    -------
+    groups: list of list of int
+        kernel cells by group, the first cell of each group is the lead
+        (see 'group_leads')
+    max_error, rms_error: float
+        error of the members against their lead, see 'group_error'
+    """
+    cells = np.array(store.kernel_cells())
+    values = store.at(cells, time)
+    labels = cluster(values, budget)
+    leads = group_leads(values, labels)
+    groups = [[cells[lead]] + [c for c in cells[labels == g].tolist() if c != cells[lead]]
+              for g, lead in enumerate(leads)]
+    return groups, *group_error(values, labels, leads)
+
+
+def regroup_deck(deck, groups, index=None):
+    """
+    Makes the kernels of each group share the material of the group lead.
+
+    The kernel cells of the other members are switched to the lead material
+    and their own material cards are removed.
+
+    Parameters
+    ----------
+    deck: str
+        MCNP input generated by create_inputs.py
+    groups: list of list of int
+        kernel cells by group, lead first
+    index: CellIndex
+
+    Returns
+    -------
+    deck: str
+    """
+    index = CellIndex() if index is None else index
+    material = {c: index.record(*index.location(c))['material'] for g in groups for c in g}
+
+    replace = {}
+    for group in groups:
+        for cell in group[1:]:
+            replace[cell] = material[group[0]]
+
+    title, cell_lines, surface_lines, data_lines = mcnp_deck.blocks(deck)
+    # the surfaces of the kernels share their numbers: only cell cards change
+    for n, line in enumerate(cell_lines):
+        fields = line.split()
+        if line[:1].isdigit() and int(fields[0]) in replace and len(fields) > 1:
+            cell, mat = fields[0], fields[1]
+            cell_lines[n] = re.sub(rf'^{cell}(\s+){mat}\b', rf'{cell}\g<1>{replace[int(cell)]}', line)
+
+    data = []
+    skip = False
+    dropped = {material[c] for c in replace}
+    for line in data_lines:
+        fields = line.split()
+        if skip and line[:1] == ' ' and fields:
+            continue
+        skip = False
+        if fields and re.fullmatch(r'm\d+', fields[0]) and int(fields[0][1:]) in dropped:
+            skip = True
+            continue
+        data.append(line)
+    # the block separators as they were (blank lines, possibly with spaces)
+    lines = deck.split('\n')
+    ends = [lines[len(cell_lines) + 1], lines[len(cell_lines) + len(surface_lines) + 2]]
+    return '\n'.join([title] + cell_lines + ends[:1] + surface_lines + ends[1:] + data)
+
+
+def moaa_cells(groups, index=None):
+    """ Returns the MOAA fuel cell list, one path per group """
+    index = CellIndex() if index is None else index
+    cells = """"""
+    for group in groups:
+        path = index.record(*index.location(group[0]))['path']
+        members = ' '.join(str(c) for c in group)
+        cells += f"""\n    cell number: {path}  # group: {members}"""
+    return cells
+
+
+if __name__ == "__main__":
+    from burnup import BurnupStore
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('results', help='pilot result csv (cells x time)')
+    parser.add_argument('--budget', type=float, default=0.02,
+                        help='maximum relative deviation from the group mean')
+    parser.add_argument('--deck', help='deck to regroup, written to <deck>_grouped')
+    args = parser.parse_args()
+
+    store = BurnupStore.cached(args.results)
+    groups, max_error, rms_error = fuel_groups(store, args.budget)
+    n_cells = sum(len(g) for g in groups)
+    print(f'{n_cells} cells -> {len(groups)} groups, '
+          f'max error: {max_error*100:.2f}%, rms error: {rms_error*100:.2f}%')
+
+    if args.deck:
+        with open(args.deck) as f:
+            deck = regroup_deck(f.read(), groups, store.index)
+        with open(f'{args.deck}_grouped', 'w+') as f:
+            f.write(deck)
+
+    print("\nFuel cells:")
+    print(moaa_cells(groups, store.index))
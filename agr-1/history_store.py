@@ -0,0 +1,207 @@
+""" Typed store of the ATR operating history, memory-mapped from an .npz cache rebuilt when the csv files change """
+import os
+import csv
+import zipfile
+import numpy as np
+
+
+TIMESTEP = 'Cumulative Timestep'
+# time step length, taken from the first file for every file (as read_history)
+INTERVAL = 'Time Interval(hrs)'
+
+
+def read_csv(filename):
+    """ Returns the header and rows (lists of text) of a history csv file, byte order mark removed """
+    with open(filename, newline='', encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        return header, [row for row in reader if row]
+
+
+def signature(filenames):
+    """ Returns the size and modification time [ns] of each file, to tell when a cache is stale """
+    return np.array([(os.stat(f).st_size, os.stat(f).st_mtime_ns) for f in filenames], dtype=np.int64)
+
+
+def load_mapped(filename):
+    """
+    Loads the arrays of an uncompressed .npz file as read-only memory maps
+    (np.load does not map the members of an .npz).
+
+    Returns
+    -------
+    arrays: dict
+        keys: array name, values: np.memmap
+    """
+    arrays = {}
+    with zipfile.ZipFile(filename) as archive, open(filename, 'rb') as f:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f'{filename} is compressed, it cannot be memory-mapped')
+            # local header: 30 bytes, then the name and extra fields
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = np.frombuffer(f.read(4), dtype='<u2')
+            f.seek(info.header_offset + 30 + int(name_length) + int(extra_length))
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+            name = info.filename[:-4] if info.filename.endswith('.npy') else info.filename
+            if dtype.hasobject:
+                raise ValueError(f'{name} in {filename} holds objects')
+            if 0 in shape:
+                arrays[name] = np.empty(shape, dtype=dtype)
+            else:
+                arrays[name] = np.memmap(filename, dtype=dtype, mode='r', shape=shape,
+                                         order='F' if fortran else 'C', offset=f.tell())
+    return arrays
+
+
+class HistoryStore:
+    """
+    The operating history as typed columns, one entry per timestep, with
+    cycle and timestep indexes.
+
+    Parameters
+    ----------
+    timestep: array of int
+        cumulative timestep of each row, increasing
+    cycle: array of int
+        index into 'cycles' of each row
+    cycles: array of str
+        cycle names, in order
+    interval: array of float
+        time step lengths [h]
+    values: dict
+        keys: history group ('power', 'oscc', 'neck'), values: dict of
+        key: array of float
+    signature: array of int
+        size and modification time of the csv files read (see 'signature')
+    """
+
+    def __init__(self, timestep, cycle, cycles, interval, values, signature=None):
+        self.timestep = timestep
+        self.cycle = cycle
+        self.cycles = [str(c) for c in cycles]
+        self.interval = interval
+        self.values = values
+        self.signature = np.zeros((0, 2), np.int64) if signature is None else signature
+
+        # the rows of a cycle are contiguous
+        starts = np.flatnonzero(np.diff(np.asarray(cycle), prepend=-1))
+        stops = np.append(starts[1:], len(cycle))
+        self._slices = {self.cycles[cycle[a]]: slice(int(a), int(b)) for a, b in zip(starts, stops)}
+
+    @classmethod
+    def from_csv(cls, path, columns):
+        """
+        Reads the history csv files.
+
+        Parameters
+        ----------
+        path: str
+            directory of the files
+        columns: dict
+            keys: history group, values: (file name, {key: column}); the
+            first file gives the cycle and the time step length
+        """
+        tables = {}
+        for name, _ in columns.values():
+            header, rows = read_csv(os.path.join(path, name))
+            tables[name] = (header, {int(row[header.index(TIMESTEP)]): row for row in rows})
+
+        first = next(iter(columns.values()))[0]
+        header, rows = tables[first]
+        timestep = np.array(sorted(rows), dtype=np.int64)
+        names = [rows[t][header.index('Cycle')] for t in timestep]
+        cycles = list(dict.fromkeys(names))
+        code = {c: n for n, c in enumerate(cycles)}
+        cycle = np.array([code[c] for c in names], dtype=np.int32)
+        interval = np.array([rows[t][header.index(INTERVAL)] for t in timestep], dtype=float)
+
+        values = {}
+        for group, (name, keys) in columns.items():
+            header, rows = tables[name]
+            missing = [t for t in timestep if t not in rows]
+            if missing:
+                raise ValueError(f'{name} has no row for timesteps {missing[:5]}')
+            index = [header.index(column) for column in keys.values()]
+            data = np.array([[rows[t][i] for i in index] for t in timestep], dtype=float).reshape(-1, len(keys))
+            # one contiguous array per column
+            values[group] = {key: np.ascontiguousarray(data[:, n]) for n, key in enumerate(keys)}
+        return cls(timestep, cycle, np.array(cycles), interval, values)
+
+    @classmethod
+    def load(cls, filename):
+        """ Loads (memory-maps) a store written by 'save' """
+        arrays = load_mapped(filename)
+        values = {}
+        for name, array in arrays.items():
+            if ':' in name:
+                group, key = name.split(':', 1)
+                values.setdefault(group, {})[key] = array
+        return cls(arrays['timestep'], arrays['cycle'], arrays['cycles'], arrays['interval'], values,
+                   arrays['signature'])
+
+    @classmethod
+    def cached(cls, path, columns, cache=None):
+        """
+        Reads the history through an .npz cache ('history.npz' in 'path'),
+        which is rebuilt whenever a csv file changed size or modification
+        time, or the columns changed.
+        """
+        if cache is None:
+            cache = os.path.join(path, 'history.npz')
+        files = [os.path.join(path, name) for name, _ in columns.values()]
+        current = signature(files)
+        names = sorted(f'{group}:{key}' for group, (_, keys) in columns.items() for key in keys)
+        if os.path.exists(cache):
+            store = cls.load(cache)
+            stored = store.signature
+            if (stored.shape == current.shape and (stored == current).all()
+                    and sorted(f'{g}:{k}' for g, keys in store.values.items() for k in keys) == names):
+                return store
+        store = cls.from_csv(path, columns)
+        store.signature = current
+        store.save(cache)
+        return store
+
+    def save(self, filename):
+        """ Writes the store as an uncompressed .npz file (so it can be memory-mapped) """
+        arrays = {'timestep': self.timestep, 'cycle': self.cycle, 'cycles': np.array(self.cycles),
+                  'interval': self.interval, 'signature': self.signature}
+        for group, keys in self.values.items():
+            for key, array in keys.items():
+                arrays[f'{group}:{key}'] = array
+        np.savez(filename, **arrays)
+
+    def cycle_rows(self, cycle):
+        """ Returns the slice of the rows of 'cycle' """
+        return self._slices[cycle]
+
+    def rows(self, timesteps):
+        """ Returns the row index of each cumulative timestep """
+        timesteps = np.asarray(timesteps)
+        index = np.searchsorted(self.timestep, timesteps).clip(0, len(self.timestep) - 1)
+        if (np.asarray(self.timestep)[index] != timesteps).any():
+            raise KeyError('timesteps not in the history')
+        return index
+
+    def series(self, group, key, cycle=None):
+        """ Returns the values of one column, over 'cycle' or the whole history """
+        values = self.values[group][key]
+        return values if cycle is None else values[self.cycle_rows(cycle)]
+
+    def history(self, cycles=None):
+        """ Returns the history split by cycle, in the format of create_inputs.read_history """
+        cycles = self.cycles if cycles is None else cycles
+        result = {'time_interval': {}, 'cum_time': {}}
+        result.update({group: {} for group in self.values})
+        for cycle in cycles:
+            rows = self.cycle_rows(cycle)
+            result['time_interval'][cycle] = self.interval[rows]
+            result['cum_time'][cycle] = np.cumsum(self.interval[rows])
+            for group, keys in self.values.items():
+                result[group][cycle] = {key: values[rows] for key, values in keys.items()}
+        return result
@@ -0,0 +1,155 @@
+""" Incremental ingest of the ATR operating history: new timesteps only update the sums of their cycle """
+import os
+import csv
+import json
+from history_store import TIMESTEP, INTERVAL
+
+
+# bytes kept before the end of the ingested rows, to notice a file changed other than by appending
+_TAIL = 64
+
+
+def new_rows(filename, offset=0):
+    """
+    Reads the rows of a history csv file after byte 'offset'.
+
+    Returns
+    -------
+    rows: list of (end, row)
+        end: byte offset after the line, row: dict of column: text
+    """
+    with open(filename, 'rb') as f:
+        header = next(csv.reader([f.readline().decode('utf-8-sig')]))
+        start = max(offset, f.tell())
+        f.seek(start)
+        data = f.read()
+    rows = []
+    end = start
+    for line in data.splitlines(keepends=True):
+        text = line.decode('utf-8').strip()
+        fields = next(csv.reader([text])) if text else []
+        # a last line without its newline may still be being written: it
+        # is taken only with all its fields
+        if not line.endswith(b'\n') and len(fields) < len(header):
+            break
+        if fields and len(fields) != len(header):
+            raise ValueError(f'{filename}: {len(fields)} fields after byte {end}, {len(header)} expected')
+        end += len(line)
+        if fields:
+            rows.append((end, dict(zip(header, fields))))
+    return rows
+
+
+def _tail(filename, offset):
+    """ Returns the bytes before 'offset' that the state keeps, as text """
+    with open(filename, 'rb') as f:
+        f.seek(max(offset - _TAIL, 0))
+        return f.read(min(offset, _TAIL)).decode('utf-8', errors='replace')
+
+
+def empty_state():
+    """ Returns the state of an empty history """
+    return {'files': {}, 'timestep': 0, 'cycles': {}}
+
+
+def load_state(filename):
+    """ Reads the state written by 'save_state', an empty state if there is none """
+    if not os.path.exists(filename):
+        return empty_state()
+    with open(filename) as f:
+        return json.load(f)
+
+
+def save_state(state, filename):
+    """ Writes the state as json """
+    with open(filename, 'w+') as f:
+        json.dump(state, f, indent=1)
+
+
+def appended(state, path):
+    """ True if the history files only grew since 'state' was saved """
+    for name, known in state['files'].items():
+        filename = os.path.join(path, name)
+        if not os.path.exists(filename) or os.path.getsize(filename) < known['offset']:
+            return False
+        if _tail(filename, known['offset']) != known['tail']:
+            return False
+    return True
+
+
+def ingest(path, columns, state=None):
+    """
+    Adds the timesteps appended to the history files since 'state' to the
+    time-weighted sums of their cycle.
+
+    A timestep is ingested once all the files have its row; rows ahead in
+    one file wait for the others. If a file is shorter than, or ends
+    differently from, what was ingested, the whole history is read again;
+    an edit further back in a file needs a run without the state.
+
+    Parameters
+    ----------
+    path: str
+        directory of the history files
+    columns: dict
+        keys: history group ('power', 'oscc', 'neck'), values: (file name,
+        {key: column}); the first file gives the cycle and time step length
+    state: dict
+        from a previous call or 'load_state', None to start from scratch
+
+    Returns
+    -------
+    state: dict
+        'files': offset and tail of the ingested part of each file
+        'timestep': last cumulative timestep ingested
+        'cycles': by cycle, 'steps', 'time' [h] and 'sums' of value * time
+        step by group and key
+    affected: list of str
+        cycles with new timesteps, in order
+    """
+    if state is None or not appended(state, path):
+        state = empty_state()
+
+    rows = {}
+    for group, (name, _) in columns.items():
+        offset = state['files'].get(name, {}).get('offset', 0)
+        rows[name] = {int(row[TIMESTEP]): (end, row) for end, row in new_rows(os.path.join(path, name), offset)}
+
+    first = next(iter(columns.values()))[0]
+    affected = []
+    ends = {}
+    for timestep in sorted(rows[first]):
+        if timestep <= state['timestep']:
+            continue
+        if any(timestep not in rows[name] for name, _ in columns.values()):
+            break
+        _, row = rows[first][timestep]
+        cycle, interval = row['Cycle'], float(row[INTERVAL])
+        totals = state['cycles'].setdefault(cycle, {
+            'steps': 0, 'time': 0., 'sums': {group: dict.fromkeys(keys, 0.) for group, (_, keys) in columns.items()}})
+        totals['steps'] += 1
+        totals['time'] += interval
+        for group, (name, keys) in columns.items():
+            end, values = rows[name][timestep]
+            ends[name] = end
+            for key, column in keys.items():
+                totals['sums'][group][key] += float(values[column]) * interval
+        state['timestep'] = timestep
+        if cycle not in affected:
+            affected.append(cycle)
+
+    for name, end in ends.items():
+        state['files'][name] = {'offset': end, 'tail': _tail(os.path.join(path, name), end)}
+    return state, affected
+
+
+def averages(state, cycle):
+    """
+    Returns the time averages of 'cycle': 'time' [h], the cycle length, and
+    by group and key the time-weighted average (as create_inputs.cycle_averages)
+    """
+    totals = state['cycles'][cycle]
+    result = {'time': totals['time']}
+    for group, sums in totals['sums'].items():
+        result[group] = {key: value / totals['time'] for key, value in sums.items()}
+    return result
@@ -0,0 +1,168 @@
+""" Columnar store of SDR photon source intensities by decay step and batch """
+import os
+import re
+import numpy as np
+
+
+def agr_groups(batches):
+    """
+    Returns the batch groups used for the AGR-1 photon source summary.
+
+    Batches 0-11 are the fuel, batch 12 is the bottom SS316L, and the last
+    batch is the bottom SS316L of the whole train, so it is added to batch
+    12. The other structures keep one group per batch.
+
+    Parameters
+    ----------
+    batches: list of int
+        batch ids of the store
+
+    Returns
+    -------
+    groups: dict
+        keys: group name, values: list of batch ids
+    """
+    last = int(max(batches))
+    groups = {
+        'fuel': list(range(12)),
+        'bottom SS316L': [12, last],
+    }
+    for batch in sorted(int(b) for b in batches):
+        if 12 < batch < last:
+            groups[f'batch {batch}'] = [batch]
+    return groups
+
+
+class IntensityStore:
+    """
+    Photon source intensities [gamma/s] as a (decay step x batch) array.
+
+    Parameters
+    ----------
+    values: array of float
+        shape (n_steps, n_batches)
+    steps: array of int
+        decay step ids, defaults to 0..n_steps-1
+    batches: array of int
+        batch ids, defaults to 0..n_batches-1
+    """
+
+    def __init__(self, values, steps=None, batches=None):
+        self.values = np.asarray(values, dtype=float)
+        if self.values.ndim != 2:
+            raise ValueError('values must have shape (n_steps, n_batches)')
+        n_steps, n_batches = self.values.shape
+        self.steps = np.arange(n_steps) if steps is None else np.asarray(steps)
+        self.batches = np.arange(n_batches) if batches is None else np.asarray(batches)
+
+    @classmethod
+    def from_nested(cls, values_by_step):
+        """
+        Builds the store from {decay step: {batch: intensity}}.
+        Missing entries are set to zero.
+        """
+        steps = sorted(values_by_step)
+        batches = sorted({b for v in values_by_step.values() for b in v})
+        col = {b: i for i, b in enumerate(batches)}
+        values = np.zeros((len(steps), len(batches)))
+        for i, step in enumerate(steps):
+            for batch, value in values_by_step[step].items():
+                values[i, col[batch]] = value
+        return cls(values, steps, batches)
+
+    @classmethod
+    def from_csv(cls, filename):
+        """
+        Reads a result file with a 'decay_step' column and one column per
+        batch ending in 'batch <id>' (e.g. 'H_gamma,Tr batch 0'). Batch ids
+        are non-negative: a negative one raises ValueError.
+        """
+        import pandas as pd
+
+        df = pd.read_csv(filename)
+        pattern = re.compile(r'batch\s+(-?\d+)$')
+        columns, batches = [], []
+        for name in df.columns:
+            match = pattern.search(name.strip())
+            if match:
+                if int(match.group(1)) < 0:
+                    raise ValueError(f'{filename}: negative batch id in column {name!r}')
+                columns.append(name)
+                batches.append(int(match.group(1)))
+        if not columns:
+            raise ValueError(f'{filename}: no batch columns found')
+        order = np.argsort(batches)
+        values = df[columns].to_numpy(dtype=float)[:, order]
+        return cls(values, df['decay_step'].to_numpy(), np.array(batches)[order])
+
+    @classmethod
+    def load(cls, filename):
+        """ Loads a store written by 'save' """
+        with np.load(filename) as data:
+            return cls(data['values'], data['steps'], data['batches'])
+
+    @classmethod
+    def cached(cls, filename, cache=None):
+        """
+        Reads 'filename' through an .npz cache, which is rebuilt whenever the
+        result file is newer than the cache.
+        """
+        if cache is None:
+            cache = os.path.splitext(filename)[0] + '.npz'
+        if os.path.exists(cache) and os.path.getmtime(cache) >= os.path.getmtime(filename):
+            return cls.load(cache)
+        store = cls.from_csv(filename)
+        store.save(cache)
+        return store
+
+    def save(self, filename):
+        """ Writes the store as an .npz file """
+        np.savez(filename, values=self.values, steps=self.steps, batches=self.batches)
+
+    def _columns(self, batch_ids):
+        position = {int(b): i for i, b in enumerate(self.batches)}
+        missing = [b for b in batch_ids if b not in position]
+        if missing:
+            raise KeyError(f'batches {missing} are not in the store')
+        return [position[b] for b in batch_ids]
+
+    def group_matrix(self, groups):
+        """
+        Returns the (n_batches x n_groups) 0/1 matrix that sums batches into
+        'groups'.
+        """
+        matrix = np.zeros((len(self.batches), len(groups)))
+        for j, batch_ids in enumerate(groups.values()):
+            matrix[self._columns(batch_ids), j] = 1
+        return matrix
+
+    def totals(self):
+        """ Returns the total intensity by decay step """
+        return self.values.sum(axis=1)
+
+    def group_sums(self, groups=None):
+        """
+        Returns the intensity of each group by decay step, shape
+        (n_steps, n_groups). Defaults to 'agr_groups'.
+        """
+        if groups is None:
+            groups = agr_groups(self.batches)
+        return self.values @ self.group_matrix(groups)
+
+    def fractions(self, groups=None):
+        """
+        Returns the contribution [%] of each group to the total intensity, by
+        decay step.
+        """
+        values = self.group_sums(groups)
+        return values / self.totals()[:, None] * 100
+
+    def ranking(self, groups=None):
+        """
+        Returns the group names sorted by decreasing intensity, one row per
+        decay step.
+        """
+        if groups is None:
+            groups = agr_groups(self.batches)
+        names = np.array(list(groups))
+        return names[np.argsort(-self.group_sums(groups), axis=1)]
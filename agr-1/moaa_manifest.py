@@ -0,0 +1,101 @@
+""" Writes the MOAA irradiation cases and depletion cell list as YAML or XML, checked against the decks """
+import os
+import mcnp_deck
+
+
+def manifest(schedule, index):
+    """
+    Returns the MOAA cases and depletion cells as one dict.
+
+    Parameters
+    ----------
+    schedule: list of dict
+        from create_inputs.irradiation_schedule
+    index: CellIndex
+
+    Returns
+    -------
+    manifest: dict
+        'cases': cycle, kind, deck, time [days] and power [MW] of each case,
+        rounded as in the MOAA text; 'cells': MOAA path, kernel cell and
+        material and location of each depleted kernel
+    """
+    cases = [{'cycle': case['cycle'], 'kind': case['kind'], 'deck': case['deck'],
+              'time': round(float(case['time']), 2), 'power': round(float(case['power']), 2)}
+             for case in schedule]
+    cells = []
+    for cap in index.capsules:
+        for stack in index.stacks:
+            for comp in index.compacts:
+                record = index.record(cap, stack, comp)
+                cells.append({'path': record['path'], 'cell': record['cell'], 'material': record['material'],
+                              'capsule': cap, 'stack': stack, 'compact': comp})
+    return {'cases': cases, 'cells': cells}
+
+
+def to_yaml(manifest):
+    """ Returns the manifest as YAML """
+    import yaml
+
+    return yaml.safe_dump(manifest, sort_keys=False, default_flow_style=False)
+
+
+def to_xml(manifest):
+    """ Returns the manifest as XML: <moaa> with <case> and <cell> elements, fields as attributes """
+    import xml.etree.ElementTree as ET
+
+    root = ET.Element('moaa')
+    for tag, entries in (('cases', 'case'), ('cells', 'cell')):
+        group = ET.SubElement(root, tag)
+        for entry in manifest[tag]:
+            ET.SubElement(group, entries, {key: str(value) for key, value in entry.items()})
+    ET.indent(root)
+    return ET.tostring(root, encoding='unicode', xml_declaration=True) + '\n'
+
+
+def write(manifest, filename):
+    """ Writes the manifest, as XML for a .xml file name and as YAML otherwise """
+    text = to_xml(manifest) if filename.lower().endswith('.xml') else to_yaml(manifest)
+    with open(filename, 'w+') as f:
+        f.write(text)
+
+
+def deck_cells(filename):
+    """ Returns the cell cards of a deck by cell number """
+    cell_lines = mcnp_deck.blocks(mcnp_deck.read_deck(filename))[1]
+    return {mcnp_deck.cell_number(card): card for card in mcnp_deck.cards(cell_lines)}
+
+
+def validate(manifest, directory):
+    """
+    Checks the manifest against the decks in 'directory': every deck of a
+    case exists and holds every cell of every MOAA path, the kernel cell
+    with its material, and each cell of a path is in a universe filling the
+    next one.
+
+    Returns
+    -------
+    problems: list of str
+        empty if the manifest is consistent
+    """
+    problems = []
+    for deck in dict.fromkeys(case['deck'] for case in manifest['cases']):
+        filename = os.path.join(directory, deck)
+        if not os.path.exists(filename):
+            problems.append(f'{deck}: missing')
+            continue
+        cards = deck_cells(filename)
+        for entry in manifest['cells']:
+            path = [int(cell) for cell in entry['path'].split('<')]
+            missing = [cell for cell in path if cell not in cards]
+            if missing:
+                problems.append(f"{deck}: {entry['path']} has no cell {' '.join(map(str, missing))}")
+                continue
+            material = mcnp_deck.cell_material(cards[entry['cell']])
+            if material != entry['material']:
+                problems.append(f"{deck}: cell {entry['cell']} has material {material}, {entry['material']} expected")
+            for inner, outer in zip(path, path[1:]):
+                if mcnp_deck.cell_universe(cards[inner]) not in mcnp_deck.cell_fill(cards[outer]):
+                    problems.append(f"{deck}: cell {inner} of {entry['path']} is not inside cell {outer}")
+    return problems
+
@@ -1,8 +1,11 @@
+""" Plots burnup vs axial location and calculates the contribution from each photon source """
 import os
-import sys
-import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
+import argparse
+from burnup import BurnupStore
+from intensity import IntensityStore
+
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
 
 
 # --------------------
@@ -10,27 +13,27 @@ import matplotlib.pyplot as plt
 # -- Burnup results --
 #
 # --------------------
-# PLOTS burnup vs z
-data = pd.read_csv("MOAA_burnup_FIMA.csv", index_col=[0])
+def plot_burnup_axial(data, figname='burnup_axial'):
+    """
+    Plots the burnup of each stack vs axial position, from the top.
 
-plt.figure()
-fima = {}
-for stack in range(1, 4):
-    fima[stack] = []
-    for cap in range(1, 7):
-        for comp in range(1, 5):
-            cell = int(90000 + cap*1000 + stack*100 + 2*(comp-1)*10 + 1)
-            values = data.loc[cell].to_numpy()
-            fima[stack].append(values[-1])
+    Parameters
+    ----------
+    data: BurnupStore
+    figname: str
+        name of the figure
+    """
+    import matplotlib.pyplot as plt
 
-for stack, values in fima.items():
-    plt.plot(fima[stack][::-1], label=f'stack: {stack}', marker='o')
+    plt.figure()
+    for stack in range(1, 4):
+        plt.plot(data.axial(stack)[::-1], label=f'stack: {stack}', marker='o')
 
-plt.ylabel(r'Burnup [\% FIMA]')
-plt.xlabel('Axial position [from the top]')
-plt.legend()
-plt.savefig("burnup_axial", dpi=300, bbox_inches="tight", transparent=True)
-plt.close()
+    plt.ylabel(r'Burnup [\% FIMA]')
+    plt.xlabel('Axial position [from the top]')
+    plt.legend()
+    plt.savefig(figname, dpi=300, bbox_inches="tight", transparent=True)
+    plt.close()
 
 
 # --------------------
@@ -214,23 +217,23 @@ values_by_step = {
     }
 }
 
-for d_step, values_by_batch in values_by_step.items():
-    intensities = []
-    fuel = 0
-    for batch, values in values_by_batch.items():
-        if batch < 12:
-            fuel += values
-        else:
-            intensities.append(fuel)
-            break
-
-    n_intens = list(values_by_batch.values())[12:]
-    for v in n_intens:
-        if v != n_intens[-1]:
-            intensities.append(v)
-        else:
-            intensities[1] += v
-
-    intensities = np.array(intensities)
-    print(f'd_step {d_step} tot: {intensities.sum()}')
-    print(intensities/intensities.sum()*100)
+
+def intensity_report(store):
+    """ Prints the total intensity and the fraction of each source group by decay step """
+    intensities = store.group_sums()
+    percent = store.fractions()
+    for idx, d_step in enumerate(store.steps):
+        print(f'd_step {d_step} tot: {intensities[idx].sum()}')
+        print(percent[idx])
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--burnup', default=os.path.join(DATA_DIR, 'MOAA_burnup_FIMA.csv'),
+                        help='MOAA burnup results')
+    parser.add_argument('--output', default='burnup_axial', help='figure name')
+    args = parser.parse_args()
+
+    plot_burnup_axial(BurnupStore.cached(args.burnup), args.output)
+    intensity_report(IntensityStore.from_nested(values_by_step))
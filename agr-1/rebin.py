@@ -0,0 +1,114 @@
+""" Rebins photon source spectra between energy group structures """
+import numpy as np
+
+
+_overlap_cache = {}
+
+
+def _check_bounds(bounds):
+    bounds = np.asarray(bounds, dtype=float)
+    if bounds.ndim != 1 or len(bounds) < 2:
+        raise ValueError('group bounds must be a 1D array with at least 2 values')
+    if np.any(np.diff(bounds) <= 0):
+        raise ValueError('group bounds must be strictly increasing')
+    return bounds
+
+
+def overlap_matrix(bounds_from, bounds_to, conserve='photons'):
+    """
+    Returns the matrix that maps a spectrum on 'bounds_from' onto 'bounds_to'.
+
+    The source is taken as flat in energy inside each group. A source group
+    is split over the target groups by the width of their overlap. With
+    conserve='photons' the photon count is preserved. With conserve='energy'
+    each piece is rescaled so that the emitted energy is preserved when the
+    photons of a target group are emitted at its mid-point energy.
+    Source energies outside of 'bounds_to' are dropped.
+
+    The matrices are cached by group-structure pair.
+
+    Parameters
+    ----------
+    bounds_from: array of float
+        source group bounds, increasing, length n_from + 1
+    bounds_to: array of float
+        target group bounds, increasing, length n_to + 1
+    conserve: str
+        'photons' or 'energy'
+
+    Returns
+    -------
+    matrix: np.ndarray
+        shape (n_from, n_to), read-only
+    """
+    if conserve not in ('photons', 'energy'):
+        raise ValueError(f"conserve must be 'photons' or 'energy', not {conserve!r}")
+    bounds_from = _check_bounds(bounds_from)
+    bounds_to = _check_bounds(bounds_to)
+
+    key = (bounds_from.tobytes(), bounds_to.tobytes(), conserve)
+    if key in _overlap_cache:
+        return _overlap_cache[key]
+
+    lo = np.maximum(bounds_from[:-1, None], bounds_to[None, :-1])
+    hi = np.minimum(bounds_from[1:, None], bounds_to[None, 1:])
+    overlap = np.clip(hi - lo, 0, None)
+    matrix = overlap / np.diff(bounds_from)[:, None]
+
+    if conserve == 'energy':
+        piece_mid = np.where(overlap > 0, (lo + hi) / 2, 0)
+        mid_to = (bounds_to[:-1] + bounds_to[1:]) / 2
+        matrix = matrix * piece_mid / mid_to[None, :]
+
+    matrix.setflags(write=False)
+    _overlap_cache[key] = matrix
+    return matrix
+
+
+def rebin(spectra, bounds_from, bounds_to, conserve='photons'):
+    """
+    Rebins any number of spectra at once.
+
+    All leading axes (e.g. decay step, batch, cell) are kept, only the last
+    axis is rebinned, so the whole set is a single matrix multiply.
+
+    Parameters
+    ----------
+    spectra: array of float
+        shape (..., n_from), photons/s by source group
+    bounds_from: array of float
+        source group bounds, length n_from + 1
+    bounds_to: array of float
+        target group bounds, length n_to + 1
+    conserve: str
+        'photons' or 'energy'
+
+    Returns
+    -------
+    rebinned: np.ndarray
+        shape (..., n_to)
+    """
+    spectra = np.asarray(spectra, dtype=float)
+    matrix = overlap_matrix(bounds_from, bounds_to, conserve)
+    if spectra.shape[-1] != matrix.shape[0]:
+        raise ValueError(
+            f'spectra have {spectra.shape[-1]} groups, '
+            f'bounds_from defines {matrix.shape[0]}')
+
+    flat = spectra.reshape(-1, matrix.shape[0])
+    return (flat @ matrix).reshape(spectra.shape[:-1] + (matrix.shape[1],))
+
+
+def total_energy(spectra, bounds):
+    """
+    Returns the emitted energy rate of 'spectra', with the photons of each
+    group at its mid-point energy (units of bounds x photons/s).
+    """
+    bounds = _check_bounds(bounds)
+    mid = (bounds[:-1] + bounds[1:]) / 2
+    return np.asarray(spectra, dtype=float) @ mid
+
+
+def clear_cache():
+    """ Drops all cached overlap matrices """
+    _overlap_cache.clear()
@@ -0,0 +1,247 @@
+""" Builds the micro core once and derives the burnup and SDR decks from it """
+import os
+import json
+import shutil
+import argparse
+import tempfile
+import functools
+import collections
+import contextlib
+import concurrent.futures
+import input_definition as indef
+
+
+# Extensions of the core, each one is a function of the layout returning the
+# (cells, surfaces, materials) text appended to the core blocks, in the
+# order they are listed in 'decks'.
+
+def burnup_layer(layout):
+     """ Closes the core with the outside world and adds the criticality source """
+     cells = """c
+9999 0                   9130:-9131:9132                 imp:n=0
+"""
+     return cells, """""", indef.source(layout)
+
+
+def sdr_layer(layout):
+     """ Places the core in the reactor building (air and concrete) """
+     surfaces = """c
+8000 c/z  0 0   175
+8001 c/z  0 0   325
+8002 c/z  0 0   425
+8003 c/z  0 186.6  11.535
+c
+8010 pz  834
+8011 pz  904
+8012 pz 1074
+"""
+
+     cells = """c
+c SDR
+8000 9996  -1.164e-03    9130 -8001 9131 -9132       imp:n=1
+8001 9996  -1.164e-03   -8001 9132 -8010             imp:n=1
+8002 9997  -2.3          8001 -8002 9131 -8010       imp:n=1
+c
+8003 9996  -1.164e-03   -8000 8010 -8011             imp:n=1
+8004 9997  -2.3          8000 -8002 8010 -8011       imp:n=1
+c
+8005 9996  -1.164e-03   -8003 8011 -8012             imp:n=1
+8006 9996  -1.164e-03    8003 -8002 8011 -8012       imp:n=1
+c
+9999 0                   8002:-9131:8012             imp:n=0
+"""
+
+     materials = """c
+c SDR calculation
+m9996  $ Air                  density = -1.164e-03
+     7014.80c -0.76
+     8016.80c -0.24
+m9997  $ Portland concrete
+     1001.00c  -0.01
+     6012.00c  -0.0009
+     6013.00c  -0.0001
+     8016.00c  -0.52911
+     11023.00c  -0.016
+     12024.00c  -0.001559
+     12025.00c  -0.000206
+     12026.00c  -0.000235
+     13027.00c  -0.033872
+     14028.00c  -0.309886
+     14029.00c  -0.016343
+     14030.00c  -0.010791
+     19039.00c  -0.012087
+     19041.00c  -0.000913
+     20040.00c  -0.042574
+     20042.00c  -0.000461
+     20044.00c  -0.000966
+     26054.00c  -0.000811
+     26056.00c  -0.012903
+     26057.00c  -0.000286
+mt9997 grph.25t
+"""
+     return cells, surfaces, materials
+
+
+decks = {
+     'micro.i': (burnup_layer,),
+     'sdr-ex.i': (sdr_layer,),
+}
+
+# generator sources whose changes make a cached core stale
+sources = tuple(os.path.abspath(f) for f in (indef.__file__, __file__, indef.mcnp_materials.__file__))
+
+
+def _assembly(task):
+     """ Returns the (cells, surfaces, materials) of one assembly (layer, id, layout) """
+     l, asse, layout = task
+     sp = asse.split('_')
+     if len(sp) == 2:
+          return indef.control(l, sp[0], layout)
+     return indef.fuel(l, sp[0], layout)
+
+
+def emit_core(layout=indef.layout, workers=1):
+     """
+     Yields the core piece by piece, as (cells, surfaces, materials): the
+     block headers, each assembly, then the reflector. The outside world is
+     left to the layers.
+
+     With 'workers' > 1 the assemblies are generated in a process pool and
+     yielded in the same order, so the result does not depend on 'workers'.
+     At most 2*workers assemblies are submitted ahead of the one yielded,
+     so the memory use stays bounded however large the core.
+     """
+     yield ("""c
+c Cells
+c
+""", """
+c
+c Surfaces
+c
+""", """
+c
+c Materials
+c
+c Helium
+m1000
+     2004.00c -1.00
+""" + indef.shared_materials())
+     tasks = (
+          (l, asse, layout)
+          for l, asse_list in indef.make_assemblies(layout).items() for asse in asse_list)
+     if workers > 1:
+          with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+               window = collections.deque()
+               for task in tasks:
+                    window.append(pool.submit(_assembly, task))
+                    if len(window) >= 2 * workers:
+                         yield window.popleft().result()
+               while window:
+                    yield window.popleft().result()
+     else:
+          yield from map(_assembly, tasks)
+
+     yield indef.reflector(layout)
+
+
+@functools.lru_cache(maxsize=None)
+def build_core(cache=None, layout=indef.layout, workers=1):
+     """
+     Returns the core (cells, surfaces, materials, see 'emit_core'), built
+     once per process and layout.
+
+     If 'cache' is given, the core is read from that json file when it was
+     written for the same layout and generator sources (see 'sources', by
+     size and modification time); otherwise it is rebuilt and written.
+     """
+     stamp = {'layout': layout._asdict(),
+              'sources': {os.path.basename(f): [os.stat(f).st_size, os.stat(f).st_mtime_ns] for f in sources}}
+     stamp = json.loads(json.dumps(stamp))
+     if cache and os.path.exists(cache):
+          with open(cache) as f:
+               data = json.load(f)
+          if isinstance(data, dict) and data.get('stamp') == stamp:
+               return tuple(data['core'])
+
+     pieces = list(zip(*emit_core(layout, workers)))
+     core = tuple(''.join(block) for block in pieces)
+     if cache:
+          with open(cache, 'w+') as f:
+               json.dump({'stamp': stamp, 'core': core}, f)
+     return core
+
+
+def _tails(name, layout=indef.layout):
+     """ Returns the text the layers of deck 'name' append to each block """
+     tails = ['', '', '']
+     for layer in decks[name]:
+          tails = [tail + text for tail, text in zip(tails, layer(layout))]
+     return tails
+
+
+def compose(core, name, layout=indef.layout):
+     """ Returns deck 'name' (see 'decks') built on the core, as a string """
+     deck = indef.comments
+     for block, tail in zip(core, _tails(name, layout)):
+          deck += block + tail
+     return deck
+
+
+def build_decks(names=None, cache=None, layout=indef.layout, workers=1):
+     """
+     Returns the decks ({file name: deck}) of 'names' (default: all of
+     'decks'), sharing one core build.
+     """
+     core = build_core(cache, layout, workers)
+     return {name: compose(core, name, layout) for name in names or decks}
+
+
+def write_decks(names=None, output='mcnp', cache=None, layout=indef.layout, workers=1):
+     """
+     Writes the decks and the cell index into the 'output' directory.
+
+     The core is generated once and spooled block by block to temporary
+     files, which are then copied into every deck. Without 'cache' the core is
+     never held in memory, so the memory use does not grow with the core size.
+     """
+     os.makedirs(output, exist_ok=True)
+     indef.write_cell_index(os.path.join(output, 'cell_index.json'), indef.make_assemblies(layout))
+
+     pieces = [build_core(cache, layout, workers)] if cache else emit_core(layout, workers)
+     with contextlib.ExitStack() as stack:
+          spools = [stack.enter_context(tempfile.TemporaryFile('w+')) for _ in range(3)]
+          for piece in pieces:
+               for spool, text in zip(spools, piece):
+                    spool.write(text)
+
+          for name in names or decks:
+               with open(os.path.join(output, name), 'w+') as f:
+                    f.write(indef.comments)
+                    for spool, tail in zip(spools, _tails(name, layout)):
+                         spool.seek(0)
+                         shutil.copyfileobj(spool, f)
+                         f.write(tail)
+
+
+if __name__ == "__main__":
+
+     parser = argparse.ArgumentParser(description=__doc__)
+     parser.add_argument('decks', nargs='*', help=f'decks: {", ".join(decks)} (default: all)')
+     parser.add_argument('--output', default='mcnp', help='output directory')
+     parser.add_argument('--cache', help='json file caching the core between runs')
+     parser.add_argument('--rings', type=int, default=indef.layout.rings,
+                         help='rings of assemblies around the central column')
+     parser.add_argument('--layers', type=int, default=indef.layout.layers, help='axial layers')
+     parser.add_argument('--height', type=float, default=indef.layout.height,
+                         help='block height [cm]')
+     parser.add_argument('--control', type=int, nargs='*', default=indef.layout.control,
+                         help='control assembly positions')
+     parser.add_argument('--workers', type=int, default=1,
+                         help='processes generating the assemblies')
+     args = parser.parse_args()
+     unknown = set(args.decks) - set(decks)
+     if unknown:
+          parser.error(f'unknown decks: {", ".join(sorted(unknown))}')
+
+     layout = indef.Layout(args.rings, args.layers, args.height, tuple(args.control))
+     write_decks(args.decks, args.output, args.cache, layout, args.workers)
@@ -1,52 +1,30 @@
+""" Creates the MCNP input file for the burnup calculation (only core) """
 import os
-import sys
+import argparse
 import input_definition as indef
+import core_builder
 
 
-cells = """c
-c Cells
-c
-"""
-surfaces = """
-c
-c Surfaces
-c
-"""
-materials = """
-c
-c Materials
-c
-c Helium
-m1000
-     2004.00c -1.00
-"""
-for l, asse_list in indef.assemblies.items():
-     for asse in asse_list:
-          sp = asse.split('_')
-          if len(sp) == 2:
-               cell, surface, material = indef.control(l, sp[0])
-          else:
-               cell, surface, material = indef.fuel(l, sp[0])
-          cells += cell
-          surfaces += surface
-          materials += material
-
-cell, surface, material = indef.reflector()
-cells += cell
-surfaces += surface
-materials += material
-
-cells += """c
-9999 0                   9130:-9131:9132                 imp:n=0
-"""
-
-if 'mcnp' not in os.listdir('.'):
-     os.mkdir('mcnp')
-
-filename = "mcnp/micro.i"
-with open(filename, 'w+') as f:
-    f.write(indef.comments)
-    f.write(cells)
-    f.write(surfaces)
-    f.write(materials)
-    f.write(indef.source)
+def build_deck():
+     """
+     Returns the deck as a string.
+     """
+     return core_builder.build_decks(['micro.i'])['micro.i']
+
+
+def main(argv=None):
+     parser = argparse.ArgumentParser(description=__doc__)
+     parser.add_argument('--output', default='mcnp/micro.i', help='deck file name')
+     args = parser.parse_args(argv)
+
+     output = os.path.dirname(args.output)
+     if output:
+          os.makedirs(output, exist_ok=True)
+     indef.write_cell_index(os.path.join(output, 'cell_index.json'), indef.assemblies)
+
+     with open(args.output, 'w+') as f:
+          f.write(build_deck())
+
+
+if __name__ == "__main__":
+     main()
@@ -0,0 +1,118 @@
+""" Reads the Shannon entropy of the fission source from MCNP outputs and suggests the inactive cycles """
+import re
+import math
+import argparse
+import numpy as np
+
+
+_kcode = re.compile(r'^\s*(?:\d+-\s+)?kcode\s+(\S+)\s+(\S+)\s+(\S+)\s+(\S+)', re.IGNORECASE | re.MULTILINE)
+
+
+def read_entropy(filename):
+     """
+     Reads the source entropy by cycle.
+
+     The cycle table of an MCNP output (the 'h(src)' column) is read; a file
+     without that table is read as two columns (cycle, entropy), so a
+     table written by hand or by another code can be used too.
+
+     Returns
+     -------
+     cycles: array of int
+     entropy: array of float
+     """
+     with open(filename, errors='replace') as f:
+          lines = f.read().split('\n')
+
+     from_table, from_columns = {}, {}
+     column = None
+     for line in lines:
+          fields = line.replace(',', ' ').split()
+          lower = [field.lower() for field in fields]
+          if 'h(src)' in lower and 'cycle' in lower:
+               # columns counted from the end, the header has multi-word entries
+               column = len(fields) - lower.index('h(src)')
+               continue
+          if not fields or not fields[0].isdigit():
+               continue
+          try:
+               if column is not None and len(fields) >= column:
+                    from_table[int(fields[0])] = float(fields[-column])
+               elif column is None and len(fields) == 2:
+                    from_columns[int(fields[0])] = float(fields[1])
+          except ValueError:
+               continue
+
+     table = from_table or from_columns
+     if not table:
+          raise ValueError(f'no source entropy found in {filename}')
+     keys = sorted(table)
+     return np.array(keys), np.array([table[k] for k in keys])
+
+
+def read_kcode(filename):
+     """ Returns the (histories, keff guess, inactive, total) of the kcode card echoed in an output, or None """
+     with open(filename, errors='replace') as f:
+          match = _kcode.search(f.read())
+     return match.groups() if match else None
+
+
+def converged_cycle(entropy, n_sigma=1.):
+     """
+     Returns the index of the first cycle whose entropy lies within 'n_sigma'
+     standard deviations of the mean entropy of the second half of the
+     cycles (the criterion printed by MCNP).
+     """
+     tail = entropy[len(entropy)//2:]
+     mean, std = tail.mean(), tail.std(ddof=1) if len(tail) > 1 else 0.
+     inside = np.nonzero(np.abs(entropy - mean) <= n_sigma*std)[0]
+     return int(inside[0]) if len(inside) else len(entropy) - 1
+
+
+def suggest_inactive(entropy, factor=2., minimum=10, n_sigma=1.):
+     """
+     Returns the suggested number of inactive cycles: 'factor' times the
+     cycle where the entropy converged, at least 'minimum'.
+     """
+     return max(minimum, math.ceil(factor * (converged_cycle(entropy, n_sigma) + 1)))
+
+
+def report(filenames, factor=2., minimum=10, n_sigma=1.):
+     """
+     Returns the convergence summary of each output and the suggested kcode
+     card (the largest inactive cycles of all outputs).
+     """
+     lines = []
+     inactive = minimum
+     kcode = None
+     for filename in filenames:
+          cycles, entropy = read_entropy(filename)
+          converged = converged_cycle(entropy, n_sigma)
+          suggested = suggest_inactive(entropy, factor, minimum, n_sigma)
+          inactive = max(inactive, suggested)
+          tail = entropy[len(entropy)//2:]
+          lines.append(
+               f'{filename}: {len(cycles)} cycles, H(src) = {tail.mean():.4f} +- {tail.std():.4f}, '
+               f'converged at cycle {cycles[converged]}, suggested inactive cycles: {suggested}')
+          kcode = kcode or read_kcode(filename)
+
+     if kcode:
+          histories, guess, old_inactive, total = kcode
+          active = int(total) - int(old_inactive)
+          lines.append(f'kcode   {histories}  {guess}  {inactive}  {inactive + active}'
+                       f'    (was {old_inactive} inactive of {total})')
+     else:
+          lines.append(f'suggested inactive cycles: {inactive}')
+     return '\n'.join(lines)
+
+
+if __name__ == "__main__":
+
+     parser = argparse.ArgumentParser(description=__doc__)
+     parser.add_argument('outputs', nargs='+', help='MCNP outputs (or cycle, entropy tables)')
+     parser.add_argument('--factor', type=float, default=2., help='margin on the convergence cycle')
+     parser.add_argument('--minimum', type=int, default=10, help='minimum inactive cycles')
+     parser.add_argument('--sigma', type=float, default=1., help='convergence band [standard deviations]')
+     args = parser.parse_args()
+
+     print(report(args.outputs, args.factor, args.minimum, args.sigma))
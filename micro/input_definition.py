@@ -1,460 +1,619 @@
-assemblies = {}
-# the _C indicates that it is a control assembly
-assemblies[1] = [
-     '201', '202', '203', '204', '205', '206', '211', '212_C', '213', '214_C',
-     '215', '216_C', '217', '218_C', '219', '220_C', '221', '222_C', '231_C',
-     '232', '233', '234_C', '235', '236', '237_C', '238', '239', '240_C', '241',
-     '242', '243_C', '244', '245', '246_C', '247', '248']
-
-assemblies[2] = [
-     '301', '302', '303', '304', '305', '306', '311', '312_C', '313', '314_C',
-     '315', '316_C', '317', '318_C', '319', '320_C', '321', '322_C', '331_C',
-     '332', '333', '334_C', '335', '336', '337_C', '338', '339', '340_C', '341',
-     '342', '343_C', '344', '345', '346_C', '347', '348']
-
-assemblies[3] = [
-     '401', '402', '403', '404', '405', '406', '411', '412_C', '413', '414_C',
-     '415', '416_C', '417', '418_C', '419', '420_C', '421', '422_C', '431_C',
-     '432', '433', '434_C', '435', '436', '437_C', '438', '439', '440_C', '441',
-     '442', '443_C', '444', '445', '446_C', '447', '448']
-
-assemblies[4] = [
-     '501', '502', '503', '504', '505', '506', '511', '512_C', '513', '514_C',
-     '515', '516_C', '517', '518_C', '519', '520_C', '521', '522_C', '531_C',
-     '532', '533', '534_C', '535', '536', '537_C', '538', '539', '540_C', '541',
-     '542', '543_C', '544', '545', '546_C', '547', '548']
+import json
+import math
+import collections
+import materials as mcnp_materials
+
+
+# Core layout: 'rings' of hexagonal assemblies around the central reflector
+# column, 'layers' axial layers of blocks 'height' cm tall, and the positions
+# of the control assemblies (the same in every layer)
+Layout = collections.namedtuple('Layout', ['rings', 'layers', 'height', 'control'])
+
+layout = Layout(
+     rings=3,
+     layers=4,
+     height=68,
+     control=(12, 14, 16, 18, 20, 22, 31, 34, 37, 40, 43, 46),
+     )
+
+# particle lattice pitch [cm] along the compact axis
+slab_pitch = 2*0.0508666
+
+# reference dimensions (3 rings, 68 cm blocks) from which the volumes are scaled
+reference_height = 68
+reference_core_apothem = 100
+reference_reflector_radius = 134
+assembly_pitch = 30
+
+
+def hex_positions(rings):
+     """
+     Yields the assembly positions ring by ring, counterclockwise from the +x
+     axis. Ring r holds the positions 1+5r(r-1) to 1+5r(r-1)+6r-1 (01-06,
+     11-22, 31-48, ...).
+
+     Yields
+     ------
+     position: int
+     i, j: int
+          indices in the core lattice
+     """
+     directions = [(-1, 1), (-1, 0), (0, -1), (1, -1), (1, 0), (0, 1)]
+     for r in range(1, rings + 1):
+          position = 1 + 5*r*(r-1)
+          i, j = r, 0
+          for di, dj in directions:
+               for _ in range(r):
+                    yield position, i, j
+                    position += 1
+                    i, j = i + di, j + dj
+
+
+def make_assemblies(layout):
+     """
+     Returns the assembly ids of each layer: '{layer+1}{position:02d}', with
+     '_C' for a control assembly.
+     """
+     # the reflector cells 9990 + layer + 1 must stay below the outside cell 9999
+     if not 1 <= layout.layers <= 7:
+          raise ValueError(f'number of layers must be 1 to 7, not {layout.layers}')
+     if layout.rings < 1:
+          raise ValueError(f'number of rings must be at least 1, not {layout.rings}')
+     positions = [p for p, _, _ in hex_positions(layout.rings)]
+     outside = set(layout.control) - set(positions)
+     if outside:
+          raise ValueError(f'control positions outside the core: {sorted(outside)}')
+
+     assemblies = {}
+     for l in range(1, layout.layers + 1):
+          assemblies[l] = [
+               f'{l+1}{p:02d}' + ('_C' if p in layout.control else '') for p in positions]
+     return assemblies
+
+
+def hex_center(i, j, pitch=assembly_pitch):
+     """
+     Returns the (x, y) centre of element (i, j) of a hexagonal lattice with
+     its flats facing y (rhp facet vector along y), 'pitch' cm between
+     neighbouring elements. Index i runs along +y and j along 150 deg.
+     """
+     return -pitch*math.sqrt(3)/2*j, pitch*(i + j/2)
+
+
+def layer_bottom(l, layout=layout):
+     """ Returns the bottom height [cm] of layer 'l' (1 is the top layer) """
+     return layout.height * (layout.layers - 2*l) / 2
+
+
+def core_apothem(layout=layout):
+     """ Returns the apothem [cm] of the hexagon holding the assemblies """
+     return reference_core_apothem + assembly_pitch*(layout.rings - 3)
+
+
+def reflector_radius(layout=layout):
+     """ Returns the outer radius [cm] of the radial reflector """
+     return reference_reflector_radius + assembly_pitch*(layout.rings - 3)
+
+
+assemblies = make_assemblies(layout)
+
+
+# Numbering of the regions of an assembly '{n}'
+# region: (cell suffix, surface suffix, material, universe suffix)
+# a material given as str is the suffix of m{n}*, an int is a shared material
+regions = {
+     'kernel': ('01', '01', '1', '4'),
+     'buffer': ('02', '02', 1001, '4'),
+     'ipyc': ('03', '03', 1001, '4'),
+     'sic': ('04', '04', 1002, '4'),
+     'opyc': ('05', '05', 1001, '4'),
+     'matrix': ('06', None, 1002, '4'),
+     'matrix cube': ('07', '06', 1002, '5'),
+     'particle lattice': ('08', '07', None, '6'),
+     'compact lattice': ('09', '08', None, '8'),
+     'fuel channel': ('10', '10', None, '1'),
+     'fuel channel block': ('11', '11', '5', '1'),
+     'block': ('12', '11', '6', '2'),
+     'coolant': ('13', '12', 1000, '3'),
+     'coolant channel block': ('14', '12', '7', '3'),
+     'assembly lattice': ('15', '13', None, '0'),
+     'matrix slab': ('20', '20', 1002, '7'),
+}
+
+control_regions = {
+     **regions,
+     'assembly lattice': ('15', '13', None, '9'),
+     'control hole': ('16', '14', 1000, '0'),
+     'control fill': ('17', '15', None, '0'),
+}
+
+
+# universes filling the cells of a region, by region
+region_fills = {
+     'particle lattice': ('kernel', 'matrix cube'),
+     'compact lattice': ('matrix slab', 'particle lattice'),
+     'fuel channel': ('compact lattice',),
+     'assembly lattice': ('fuel channel', 'block', 'coolant'),
+     'control fill': ('assembly lattice',),
+}
+
+# lattice fills: one character per element, the region whose universe fills it
+particle_lattice = [
+     'mmmmmmmmpppppppmmmmmmmm',
+     'mmmmmmpppppppppppmmmmmm',
+     'mmmmpppppppppppppppmmmm',
+     'mmmpppppppppppppppppmmm',
+     'mmpppppppppppppppppppmm',
+     'mmpppppppppppppppppppmm',
+     'mpppppppppppppppppppppm',
+     'mpppppppppppppppppppppm',
+     *['ppppppppppppppppppppppp']*7,
+     'mpppppppppppppppppppppm',
+     'mpppppppppppppppppppppm',
+     'mmpppppppppppppppppppmm',
+     'mmpppppppppppppppppppmm',
+     'mmmpppppppppppppppppmmm',
+     'mmmmpppppppppppppppmmmm',
+     'mmmmmmpppppppppppmmmmmm',
+     'mmmmmmmmpppppppmmmmmmmm',
+]
+particle_legend = {'p': 'kernel', 'm': 'matrix cube'}
+
+fuel_lattice = [
+     'ggggggggggggg',
+     'ggggggggffggg',
+     'ggggggffcffgg',
+     'ggggffcffcffg',
+     'gggfcffcffcfg',
+     'gggffcffcffgg',
+     'ggfcffcffcfgg',
+     'ggffcffcffggg',
+     'gfcffcffcfggg',
+     'gffcffcffgggg',
+     'ggffcffgggggg',
+     'gggffgggggggg',
+     'ggggggggggggg',
+]
+# the control hole replaces the channels around the centre
+control_lattice = fuel_lattice[:5] + [
+     'gggffcggcffgg',
+     'ggfcfgggfcfgg',
+     'ggffcggcffggg',
+] + fuel_lattice[8:]
+assembly_legend = {'f': 'fuel channel', 'g': 'block', 'c': 'coolant'}
+
+
+def lattice_rows(mask, legend, universes, shift=0, comment=''):
+     """
+     Returns the fill entries of a lattice card, one row of 'mask' per line:
+     each character is a region of 'legend' and the element is filled with
+     the universe of that region. Row k is indented by 5 + k*'shift' spaces
+     and 'comment' ends the first row.
+     """
+     rows = [' '*(5 + k*shift) + ' '.join(str(universes[legend[x]]) for x in row) for k, row in enumerate(mask)]
+     rows[0] += comment
+     return '\n'.join(rows)
+
+
+def core_cells(l):
+     """ Returns the cells of 'reflector' holding the assemblies of layer 'l': core lattice, then the cell it fills """
+     return 9901 + 2*(l-1), 9970 + l
+
+
+def assembly_numbers(n, numbering=regions):
+     """
+     Returns the cell, surface, material and universe numbers of assembly
+     'n', each a dict keyed by region (see 'regions').
+     """
+     cell, surface, material, universe = {}, {}, {}, {}
+     for region, (dc, ds, dm, du) in numbering.items():
+          cell[region] = int(f'{n}{dc}')
+          surface[region] = None if ds is None else int(f'{n}{ds}')
+          material[region] = dm if dm is None or isinstance(dm, int) else int(f'{n}{dm}')
+          universe[region] = int(f'{n}{du}')
+     return cell, surface, material, universe
+
+
+def moaa_path(l, n, region, numbering=regions):
+     """
+     Returns the MOAA path of a region of assembly 'n' in layer 'l': its cell,
+     the cells it is nested in up to the assembly, and the core cells.
+     """
+     cell, _, _, universe = assembly_numbers(n, numbering)
+     path = [cell[region]]
+     while universe[region] != int(f'{n}0'):
+          region = next(r for r, inside in region_fills.items()
+                        if r in numbering and universe[region] in {universe[i] for i in inside})
+          path.append(cell[region])
+     return '<'.join(str(c) for c in path + list(core_cells(l)))
+
+
+def cell_index(assemblies):
+     """
+     Returns the two-way map between a location (layer, assembly, region) and
+     the cell, surface, material, universe and MOAA path numbers, as
+     'fuel' and 'control' number the assemblies.
+
+     Parameters
+     ----------
+     assemblies: dict
+          keys: layer, values: list of assembly ids ('_C' for control)
+
+     Returns
+     -------
+     by_location: dict
+          keys: (layer, assembly, region), values: dict of numbers
+     by_cell: dict
+          keys: cell number, values: (layer, assembly, region)
+     """
+     by_location = {}
+     by_cell = {}
+     for l, asse_list in assemblies.items():
+          for asse in asse_list:
+               sp = asse.split('_')
+               n = sp[0]
+               numbering = control_regions if len(sp) == 2 else regions
+               cell, surface, material, universe = assembly_numbers(n, numbering)
+               for region in numbering:
+                    record = {
+                         'cell': cell[region],
+                         'surface': surface[region],
+                         'material': material[region],
+                         'universe': universe[region],
+                         'path': moaa_path(l, n, region, numbering),
+                    }
+                    by_location[(l, n, region)] = record
+                    by_cell[record['cell']] = (l, n, region)
+     return by_location, by_cell
+
+
+def write_cell_index(filename, assemblies):
+     """ Writes the cell index of 'assemblies' as json """
+     by_location, _ = cell_index(assemblies)
+     records = [
+          {'layer': l, 'assembly': n, 'region': region, **record}
+          for (l, n, region), record in by_location.items()
+     ]
+     with open(filename, 'w+') as f:
+          json.dump({'assemblies': assemblies, 'records': records}, f, indent=1)
+
+
+def read_cell_index(filename):
+     """
+     Reads an index written by 'write_cell_index' and returns (by_location,
+     by_cell). Raises ValueError if the file does not match the current
+     numbering scheme.
+     """
+     with open(filename) as f:
+          data = json.load(f)
+     assemblies = {int(l): v for l, v in data['assemblies'].items()}
+     by_location, by_cell = cell_index(assemblies)
+     for r in data['records']:
+          record = by_location[(r['layer'], r['assembly'], r['region'])]
+          if any(record[key] != r[key] for key in record):
+               raise ValueError(f'{filename} is out of sync with the numbering scheme')
+     return by_location, by_cell
 
 
 comments = """MicroHTGR MCNP Model
 c
 """
 
-source = """c
+
+def channel_lattice(kind='fuel'):
+     """
+     Returns the channel lattice of a fuel or control assembly: {(i, j):
+     universe suffix} with 1 fuel channel, 2 graphite and 3 coolant channel.
+     """
+     mask = control_lattice if kind == 'control' else fuel_lattice
+     return {(i, j): int(regions[assembly_legend[mask[j + 6][i + 6]]][3])
+             for j in range(-6, 7) for i in range(-6, 7)}
+
+
+def source_points(layout=layout):
+     """
+     Yields the (x, y, z) centre of every fuel channel of the core at the
+     mid-height of each layer, in fuel and control assemblies.
+
+     Every fuel channel holds the same compact, so the points are distributed
+     as the kernel volume (54 channels per fuel block and 48 per control
+     block, as their kernel volumes 948.35 and 842.98 cm3).
+     """
+     channels = {kind: [p for p, u in channel_lattice(kind).items() if u == 1]
+                 for kind in ('fuel', 'control')}
+     for l in range(1, layout.layers + 1):
+          z = layer_bottom(l, layout) + layout.height/2
+          for p, i, j in hex_positions(layout.rings):
+               x0, y0 = hex_center(i, j)
+               for ci, cj in channels['control' if p in layout.control else 'fuel']:
+                    x, y = hex_center(ci, cj, 2*1.6)
+                    yield x0 + x, y0 + y, z
+
+
+def source(layout=layout, points=None, histories=10000, inactive=100, active=1000):
+     """
+     Returns the criticality source cards.
+
+     Parameters
+     ----------
+     layout: Layout
+     points: list of (x, y, z)
+          initial source points, default: the fuel channel centres (see
+          'source_points')
+     histories: int
+          histories per cycle
+     inactive, active: int
+          number of cycles, see micro/entropy.py for the inactive cycles
+
+     The hsrc mesh (one bin per assembly pitch, two per layer) sets the
+     Shannon entropy of the fission source printed by MCNP.
+     """
+     points = [f'{x:.3f} {y:.3f} {z:.1f}' for x, y, z in (points or source_points(layout))]
+     ksrc = '\n       '.join('   '.join(points[k:k+3]) for k in range(0, len(points), 3))
+     radius = reflector_radius(layout)
+     bins = math.ceil(2*radius / assembly_pitch)
+     top = layout.height * layout.layers / 2
+     return f"""c
 c Source
 c
-ksrc   0.0   30.0  102.0
-       0.0  -30.0 -102.0
+ksrc   {ksrc}
+hsrc   {bins} {-radius} {radius}  {bins} {-radius} {radius}  {2*layout.layers} {-top:g} {top:g}
 mode   n
-kcode   10000  1.005  100  1100"""
+kcode   {histories}  1.005  {inactive}  {inactive + active}"""
 
 
-def fuel(l, n):
+# Compositions, as published (atom densities of the kernel, atom fractions)
+kernel = {92235: '4.816186e-03', 92238: '1.932238e-02', 8016: '4.827713e-02'}
+graphite = {6012: '0.9890', 6013: '0.0110'}
+silicon_carbide = {14028: '0.4612', 14029: '0.0234', 14030: '0.0154', 6012: '0.4945', 6013: '0.0055'}
 
-     h = 2*68 - 68*l
-     hm = 2*68 - 68*l + 68./2
+
+def shared_materials():
+     """
+     Returns the materials of the regions that are not depleted, shared by
+     all the assemblies (the density is on the cells): graphite of the
+     particle buffer and PyC layers and of the reflector inside the core
+     hexagon, and SiC of the particle layer and matrix.
+     """
+     return f"""c Graphite (not depleted)
+{mcnp_materials.card(1001, graphite, thermal='grph.25t', sep='  ')}
+c Silicon carbide (not depleted)
+{mcnp_materials.card(1002, silicon_carbide, thermal='grph.25t', sep='  ')}
+"""
+
+
+def assembly_materials(l, n):
+     """ Returns the materials depleted in assembly 'n' of layer 'l': kernel and block graphite """
+     _, _, m, _ = assembly_numbers(n)
+     cards = [mcnp_materials.card(m['kernel'], kernel, comment='Kernel', sep='  ')]
+     for region, name in (('fuel channel block', 'Fuel Ch'), ('block', 'Block'), ('coolant channel block', 'Coolant Ch')):
+          cards.append(mcnp_materials.card(
+               m[region], graphite, thermal='grph.25t', comment=f'Graphite Block - {name}', sep='  '))
+     return f"""c
+c Layer {l}, Assembly {n}
+""" + '\n'.join(cards) + '\n'
+
+
+def fuel(l, n, layout=layout):
+     """ Returns the cells, surfaces and materials of fuel assembly 'n' of layer 'l', numbered by 'assembly_numbers' """
+
+     h = layer_bottom(l, layout)
+     hm = h + layout.height/2
+     height = layout.height
+     # compact lattice: particle slabs along the block, 2 matrix slabs at each end
+     half = math.ceil(layout.height / 2 / slab_pitch)
+     scale = layout.height / reference_height
+     c, s, m, u = assembly_numbers(n, regions)
+     particles = lattice_rows(particle_lattice, particle_legend, u, comment=' $ Layer')
+     channels = lattice_rows(fuel_lattice, assembly_legend, u, shift=1)
 
      surfaces=f"""c
 c Layer {l}, Assembly {n}
-{n}01  so  0.0250                                         $ Kernel
-{n}02  so  0.0350                                         $ Buffer
-{n}03  so  0.0390                                         $ InnerPyC
-{n}04  so  0.0425                                         $ SiC
-{n}05  so  0.0465                                         $ OuterPyC
-{n}06  so  2.0
-c
-{n}07 rpp -0.0508666 0.0508666 -0.0508666 0.0508666 -0.06 0.06
-{n}08 rpp -1.160 1.160 -1.160 1.160 -0.0508666 0.0508666
-c
-{n}10 c/z  0 0    1.150                                   $ Fuel Ch
-{n}11 c/z  0 0    1.85
-{n}12 c/z  0 0    0.775                                   $ Coolant Ch
-{n}13 rhp  0 0 {h}     0 0 68     0  1.6  0
-{n}20 c/z  0 0    1.160
+{s['kernel']}  so  0.0250                                         $ Kernel
+{s['buffer']}  so  0.0350                                         $ Buffer
+{s['ipyc']}  so  0.0390                                         $ InnerPyC
+{s['sic']}  so  0.0425                                         $ SiC
+{s['opyc']}  so  0.0465                                         $ OuterPyC
+{s['matrix cube']}  so  2.0
+c
+{s['particle lattice']} rpp -0.0508666 0.0508666 -0.0508666 0.0508666 -0.06 0.06
+{s['compact lattice']} rpp -1.160 1.160 -1.160 1.160 -0.0508666 0.0508666
+c
+{s['fuel channel']} c/z  0 0    1.150                                   $ Fuel Ch
+{s['fuel channel block']} c/z  0 0    1.85
+{s['coolant']} c/z  0 0    0.775                                   $ Coolant Ch
+{s['assembly lattice']} rhp  0 0 {h:g}     0 0 {height:g}     0  1.6  0
+{s['matrix slab']} c/z  0 0    1.160
 """
 
      cells=f"""c
 c Layer {l}, Assembly {n}
 c Triso particles
-{n}01 {n}1 -10.8  -{n}01         u={n}4 vol=948.35     imp:n=1 $ Kernel
-{n}02 {n}2  -0.98  {n}01 -{n}02  u={n}4                imp:n=1 $ Buffer
-{n}03 {n}3  -1.85  {n}02 -{n}03  u={n}4                imp:n=1 $ IPyC
-{n}04 {n}4  -3.20  {n}03 -{n}04  u={n}4                imp:n=1 $ SiC
-{n}05 {n}3  -1.86  {n}04 -{n}05  u={n}4                imp:n=1 $ OPyC
-{n}06 {n}4  -3.20  {n}05         u={n}4                imp:n=1 $ SiC Matrix
-{n}07 {n}4  -3.20 -{n}06         u={n}5                imp:n=1 $ SiC Matrix
+{c['kernel']} {m['kernel']} -10.8  -{s['kernel']}         u={u['kernel']} vol={948.35*scale:.2f}     imp:n=1 $ Kernel
+{c['buffer']} {m['buffer']}  -0.98  {s['kernel']} -{s['buffer']}  u={u['buffer']}                imp:n=1 $ Buffer
+{c['ipyc']} {m['ipyc']}  -1.85  {s['buffer']} -{s['ipyc']}  u={u['ipyc']}                imp:n=1 $ IPyC
+{c['sic']} {m['sic']}  -3.20  {s['ipyc']} -{s['sic']}  u={u['sic']}                imp:n=1 $ SiC
+{c['opyc']} {m['opyc']}  -1.86  {s['sic']} -{s['opyc']}  u={u['opyc']}                imp:n=1 $ OPyC
+{c['matrix']} {m['matrix']}  -3.20  {s['opyc']}         u={u['matrix']}                imp:n=1 $ SiC Matrix
+{c['matrix cube']} {m['matrix cube']}  -3.20 -{s['matrix cube']}         u={u['matrix cube']}                imp:n=1 $ SiC Matrix
 c
-{n}08 0   -{n}07  u={n}6 lat=1 imp:n=1 fill=-11:11 -11:11 0:0  $ Lattice of Particles
-     {n}5 {n}5 {n}5 {n}5 {n}5 {n}5 {n}5 {n}5 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}5 {n}5 {n}5 {n}5 {n}5 {n}5 {n}5 {n}5 $ Layer
-     {n}5 {n}5 {n}5 {n}5 {n}5 {n}5 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}5 {n}5 {n}5 {n}5 {n}5 {n}5
-     {n}5 {n}5 {n}5 {n}5 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}5 {n}5 {n}5 {n}5
-     {n}5 {n}5 {n}5 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}5 {n}5 {n}5
-     {n}5 {n}5 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}5 {n}5
-     {n}5 {n}5 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}5 {n}5
-     {n}5 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}5
-     {n}5 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}5
-     {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4
-     {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4
-     {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4
-     {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4
-     {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4
-     {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4
-     {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4
-     {n}5 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}5
-     {n}5 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}5
-     {n}5 {n}5 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}5 {n}5
-     {n}5 {n}5 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}5 {n}5
-     {n}5 {n}5 {n}5 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}5 {n}5 {n}5
-     {n}5 {n}5 {n}5 {n}5 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}5 {n}5 {n}5 {n}5
-     {n}5 {n}5 {n}5 {n}5 {n}5 {n}5 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}5 {n}5 {n}5 {n}5 {n}5 {n}5
-     {n}5 {n}5 {n}5 {n}5 {n}5 {n}5 {n}5 {n}5 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}5 {n}5 {n}5 {n}5 {n}5 {n}5 {n}5 {n}5
+{c['particle lattice']} 0   -{s['particle lattice']}  u={u['particle lattice']} lat=1 imp:n=1 fill=-11:11 -11:11 0:0  $ Lattice of Particles
+{particles}
 c
-{n}20 {n}4  -3.20 -{n}20    u={n}7                imp:n=1 $ SiC Matrix
+{c['matrix slab']} {m['matrix slab']}  -3.20 -{s['matrix slab']}    u={u['matrix slab']}                imp:n=1 $ SiC Matrix
 c
-{n}09 0  -{n}08 u={n}8 lat=1 imp:n=1 fill=0:0 0:0 -335:335 {n}7 1R {n}6 666R {n}7 1R
+{c['compact lattice']} 0  -{s['compact lattice']} u={u['compact lattice']} lat=1 imp:n=1 fill=0:0 0:0 -{half}:{half} {u['matrix slab']} 1R {u['particle lattice']} {2*half-4}R {u['matrix slab']} 1R
 c Fuel/Coolant Channels + Moderator
-{n}10 0            -{n}10  u={n}1 fill={n}8  (0 0 {hm:.1f}) imp:n=1 $ Fuel Ch
-{n}11 {n}5  -1.75   {n}10 -{n}11  u={n}1 vol=17307.40   imp:n=1 $ Fuel Ch Hex cell
-{n}12 {n}6  -1.75  -{n}11         u={n}2 vol=8989.51    imp:n=1 $ Graphite Hex cell
-{n}13 1000  -1.5984e-03  -{n}12   u={n}3                imp:n=1 $ Coolant Ch (3MPa, 900K)
-{n}14 {n}7  -1.75   {n}12 -{n}11  u={n}3 vol=9019.69    imp:n=1 $ Coolant Ch Hex cell
-c
-{n}15 0                  -{n}13 u={n}0 lat=2 imp:n=1 fill=-6:6 -6:6 0:0
-     {n}2 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2
-      {n}2 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2 {n}1 {n}1 {n}2 {n}2 {n}2
-       {n}2 {n}2 {n}2 {n}2 {n}2 {n}2 {n}1 {n}1 {n}3 {n}1 {n}1 {n}2 {n}2
-        {n}2 {n}2 {n}2 {n}2 {n}1 {n}1 {n}3 {n}1 {n}1 {n}3 {n}1 {n}1 {n}2
-         {n}2 {n}2 {n}2 {n}1 {n}3 {n}1 {n}1 {n}3 {n}1 {n}1 {n}3 {n}1 {n}2
-          {n}2 {n}2 {n}2 {n}1 {n}1 {n}3 {n}1 {n}1 {n}3 {n}1 {n}1 {n}2 {n}2
-           {n}2 {n}2 {n}1 {n}3 {n}1 {n}1 {n}3 {n}1 {n}1 {n}3 {n}1 {n}2 {n}2
-            {n}2 {n}2 {n}1 {n}1 {n}3 {n}1 {n}1 {n}3 {n}1 {n}1 {n}2 {n}2 {n}2
-             {n}2 {n}1 {n}3 {n}1 {n}1 {n}3 {n}1 {n}1 {n}3 {n}1 {n}2 {n}2 {n}2
-              {n}2 {n}1 {n}1 {n}3 {n}1 {n}1 {n}3 {n}1 {n}1 {n}2 {n}2 {n}2 {n}2
-               {n}2 {n}2 {n}1 {n}1 {n}3 {n}1 {n}1 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2
-                {n}2 {n}2 {n}2 {n}1 {n}1 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2
-                 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2
+{c['fuel channel']} 0            -{s['fuel channel']}  u={u['fuel channel']} fill={u['compact lattice']}  (0 0 {hm:.1f}) imp:n=1 $ Fuel Ch
+{c['fuel channel block']} {m['fuel channel block']}  -1.75   {s['fuel channel']} -{s['fuel channel block']}  u={u['fuel channel block']} vol={17307.40*scale:.2f}   imp:n=1 $ Fuel Ch Hex cell
+{c['block']} {m['block']}  -1.75  -{s['block']}         u={u['block']} vol={8989.51*scale:.2f}    imp:n=1 $ Graphite Hex cell
+{c['coolant']} {m['coolant']}  -1.5984e-03  -{s['coolant']}   u={u['coolant']}                imp:n=1 $ Coolant Ch (3MPa, 900K)
+{c['coolant channel block']} {m['coolant channel block']}  -1.75   {s['coolant channel block']} -{s['fuel channel block']}  u={u['coolant channel block']} vol={9019.69*scale:.2f}    imp:n=1 $ Coolant Ch Hex cell
+c
+{c['assembly lattice']} 0                  -{s['assembly lattice']} u={u['assembly lattice']} lat=2 imp:n=1 fill=-6:6 -6:6 0:0
+{channels}
 """
 
-     materials=f"""c
-c Layer {l}, Assembly {n}
-m{n}1  $ Kernel
-     92235.00c   4.816186e-03
-     92238.00c   1.932238e-02
-      8016.00c   4.827713e-02
-m{n}2  $ Buffer
-      6012.00c   0.9890
-      6013.00c   0.0110
-mt{n}2 grph.25t
-m{n}3  $ Pyrolitic Carbon
-      6012.00c   0.9890
-      6013.00c   0.0110
-mt{n}3 grph.25t
-m{n}4  $ Silicon Carbide
-     14028.00c   0.4612
-     14029.00c   0.0234
-     14030.00c   0.0154
-      6012.00c   0.4945
-      6013.00c   0.0055
-mt{n}4 grph.25t
-m{n}5  $ Graphite Block - Fuel Ch
-      6012.00c   0.9890
-      6013.00c   0.0110
-mt{n}5 grph.25t
-m{n}6  $ Graphite Block - Block
-      6012.00c   0.9890
-      6013.00c   0.0110
-mt{n}6 grph.25t
-m{n}7  $ Graphite Block - Coolant Ch
-      6012.00c   0.9890
-      6013.00c   0.0110
-mt{n}7 grph.25t
-"""
+     materials = assembly_materials(l, n)
 
      return cells, surfaces, materials
 
 
-def control(l, n):
+def control(l, n, layout=layout):
+     """ Returns the cells, surfaces and materials of control assembly 'n' of layer 'l', numbered by 'assembly_numbers' """
 
-     h = 2*68 - 68*l
-     hm = 2*68 - 68*l + 68./2
+     h = layer_bottom(l, layout)
+     hm = h + layout.height/2
+     height = layout.height
+     # compact lattice: particle slabs along the block, 2 matrix slabs at each end
+     half = math.ceil(layout.height / 2 / slab_pitch)
+     scale = layout.height / reference_height
+     c, s, m, u = assembly_numbers(n, control_regions)
+     particles = lattice_rows(particle_lattice, particle_legend, u, comment=' $ Layer')
+     channels = lattice_rows(control_lattice, assembly_legend, u, shift=1)
 
      surfaces=f"""c
 c Layer {l}, Assembly {n}
-{n}01  so  0.0250                                         $ Kernel
-{n}02  so  0.0350                                         $ Buffer
-{n}03  so  0.0390                                         $ InnerPyC
-{n}04  so  0.0425                                         $ SiC
-{n}05  so  0.0465                                         $ OuterPyC
-{n}06  so  2.0
-c
-{n}07 rpp -0.0508666 0.0508666 -0.0508666 0.0508666 -0.06 0.06
-{n}08 rpp -1.160 1.160 -1.160 1.160 -0.0508666 0.0508666
-c
-{n}10 c/z  0 0    1.150                                   $ Fuel Ch
-{n}11 c/z  0 0    1.85
-{n}12 c/z  0 0    0.775                                   $ Coolant Ch
-{n}13 rhp  0 0  {h}   0 0 68     0   1.6  0
-{n}14 c/z  0 0    4
-{n}15 c/z  0 0   17.5
-{n}20 c/z  0 0    1.160
+{s['kernel']}  so  0.0250                                         $ Kernel
+{s['buffer']}  so  0.0350                                         $ Buffer
+{s['ipyc']}  so  0.0390                                         $ InnerPyC
+{s['sic']}  so  0.0425                                         $ SiC
+{s['opyc']}  so  0.0465                                         $ OuterPyC
+{s['matrix cube']}  so  2.0
+c
+{s['particle lattice']} rpp -0.0508666 0.0508666 -0.0508666 0.0508666 -0.06 0.06
+{s['compact lattice']} rpp -1.160 1.160 -1.160 1.160 -0.0508666 0.0508666
+c
+{s['fuel channel']} c/z  0 0    1.150                                   $ Fuel Ch
+{s['fuel channel block']} c/z  0 0    1.85
+{s['coolant']} c/z  0 0    0.775                                   $ Coolant Ch
+{s['assembly lattice']} rhp  0 0  {h:g}   0 0 {height:g}     0   1.6  0
+{s['control hole']} c/z  0 0    4
+{s['control fill']} c/z  0 0   17.5
+{s['matrix slab']} c/z  0 0    1.160
 """
 
      cells=f"""c
 c Layer {l}, Assembly {n}
 c Triso particles
-{n}01 {n}1 -10.8  -{n}01         u={n}4 vol=842.98     imp:n=1 $ Kernel
-{n}02 {n}2  -0.98  {n}01 -{n}02  u={n}4                imp:n=1 $ Buffer
-{n}03 {n}3  -1.85  {n}02 -{n}03  u={n}4                imp:n=1 $ IPyC
-{n}04 {n}4  -3.20  {n}03 -{n}04  u={n}4                imp:n=1 $ SiC
-{n}05 {n}3  -1.86  {n}04 -{n}05  u={n}4                imp:n=1 $ OPyC
-{n}06 {n}4  -3.20  {n}05         u={n}4                imp:n=1 $ SiC Matrix
-{n}07 {n}4  -3.20 -{n}06         u={n}5                imp:n=1 $ SiC Matrix
+{c['kernel']} {m['kernel']} -10.8  -{s['kernel']}         u={u['kernel']} vol={842.98*scale:.2f}     imp:n=1 $ Kernel
+{c['buffer']} {m['buffer']}  -0.98  {s['kernel']} -{s['buffer']}  u={u['buffer']}                imp:n=1 $ Buffer
+{c['ipyc']} {m['ipyc']}  -1.85  {s['buffer']} -{s['ipyc']}  u={u['ipyc']}                imp:n=1 $ IPyC
+{c['sic']} {m['sic']}  -3.20  {s['ipyc']} -{s['sic']}  u={u['sic']}                imp:n=1 $ SiC
+{c['opyc']} {m['opyc']}  -1.86  {s['sic']} -{s['opyc']}  u={u['opyc']}                imp:n=1 $ OPyC
+{c['matrix']} {m['matrix']}  -3.20  {s['opyc']}         u={u['matrix']}                imp:n=1 $ SiC Matrix
+{c['matrix cube']} {m['matrix cube']}  -3.20 -{s['matrix cube']}         u={u['matrix cube']}                imp:n=1 $ SiC Matrix
 c
-{n}08 0   -{n}07  u={n}6 lat=1 imp:n=1 fill=-11:11 -11:11 0:0  $ Lattice of Particles
-     {n}5 {n}5 {n}5 {n}5 {n}5 {n}5 {n}5 {n}5 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}5 {n}5 {n}5 {n}5 {n}5 {n}5 {n}5 {n}5 $ Layer
-     {n}5 {n}5 {n}5 {n}5 {n}5 {n}5 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}5 {n}5 {n}5 {n}5 {n}5 {n}5
-     {n}5 {n}5 {n}5 {n}5 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}5 {n}5 {n}5 {n}5
-     {n}5 {n}5 {n}5 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}5 {n}5 {n}5
-     {n}5 {n}5 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}5 {n}5
-     {n}5 {n}5 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}5 {n}5
-     {n}5 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}5
-     {n}5 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}5
-     {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4
-     {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4
-     {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4
-     {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4
-     {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4
-     {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4
-     {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4
-     {n}5 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}5
-     {n}5 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}5
-     {n}5 {n}5 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}5 {n}5
-     {n}5 {n}5 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}5 {n}5
-     {n}5 {n}5 {n}5 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}5 {n}5 {n}5
-     {n}5 {n}5 {n}5 {n}5 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}5 {n}5 {n}5 {n}5
-     {n}5 {n}5 {n}5 {n}5 {n}5 {n}5 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}5 {n}5 {n}5 {n}5 {n}5 {n}5
-     {n}5 {n}5 {n}5 {n}5 {n}5 {n}5 {n}5 {n}5 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}4 {n}5 {n}5 {n}5 {n}5 {n}5 {n}5 {n}5 {n}5
+{c['particle lattice']} 0   -{s['particle lattice']}  u={u['particle lattice']} lat=1 imp:n=1 fill=-11:11 -11:11 0:0  $ Lattice of Particles
+{particles}
 c
-{n}20 {n}4  -3.20 -{n}20    u={n}7                          imp:n=1 $ SiC Matrix
+{c['matrix slab']} {m['matrix slab']}  -3.20 -{s['matrix slab']}    u={u['matrix slab']}                          imp:n=1 $ SiC Matrix
 c
-{n}09 0  -{n}08 u={n}8 lat=1 imp:n=1 fill=0:0 0:0 -335:335 {n}7 1R {n}6 666R {n}7 1R
+{c['compact lattice']} 0  -{s['compact lattice']} u={u['compact lattice']} lat=1 imp:n=1 fill=0:0 0:0 -{half}:{half} {u['matrix slab']} 1R {u['particle lattice']} {2*half-4}R {u['matrix slab']} 1R
 c Fuel/Coolant Channels + Moderator
-{n}10 0            -{n}10  u={n}1 fill={n}8  (0 0 {hm:.1f}) imp:n=1 $ Fuel Ch
-{n}11 {n}5  -1.75   {n}10 -{n}11  u={n}1 vol=15384.35       imp:n=1 $ Fuel Ch Hex cell
-{n}12 {n}6  -1.75  -{n}11         u={n}2 vol=9782.67        imp:n=1 $ Graphite Hex cell
-{n}13 1000  -1.5984e-03  -{n}12   u={n}3                    imp:n=1 $ Coolant Ch (3MPa, 900K)
-{n}14 {n}7  -1.75   {n}12 -{n}11  u={n}3 vol=8544.97        imp:n=1 $ Coolant Ch Hex cell
+{c['fuel channel']} 0            -{s['fuel channel']}  u={u['fuel channel']} fill={u['compact lattice']}  (0 0 {hm:.1f}) imp:n=1 $ Fuel Ch
+{c['fuel channel block']} {m['fuel channel block']}  -1.75   {s['fuel channel']} -{s['fuel channel block']}  u={u['fuel channel block']} vol={15384.35*scale:.2f}       imp:n=1 $ Fuel Ch Hex cell
+{c['block']} {m['block']}  -1.75  -{s['block']}         u={u['block']} vol={9782.67*scale:.2f}        imp:n=1 $ Graphite Hex cell
+{c['coolant']} {m['coolant']}  -1.5984e-03  -{s['coolant']}   u={u['coolant']}                    imp:n=1 $ Coolant Ch (3MPa, 900K)
+{c['coolant channel block']} {m['coolant channel block']}  -1.75   {s['coolant channel block']} -{s['fuel channel block']}  u={u['coolant channel block']} vol={8544.97*scale:.2f}        imp:n=1 $ Coolant Ch Hex cell
 c
-{n}15 0                  -{n}13 u={n}9 lat=2 imp:n=1 fill=-6:6 -6:6 0:0
-     {n}2 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2
-      {n}2 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2 {n}1 {n}1 {n}2 {n}2 {n}2
-       {n}2 {n}2 {n}2 {n}2 {n}2 {n}2 {n}1 {n}1 {n}3 {n}1 {n}1 {n}2 {n}2
-        {n}2 {n}2 {n}2 {n}2 {n}1 {n}1 {n}3 {n}1 {n}1 {n}3 {n}1 {n}1 {n}2
-         {n}2 {n}2 {n}2 {n}1 {n}3 {n}1 {n}1 {n}3 {n}1 {n}1 {n}3 {n}1 {n}2
-          {n}2 {n}2 {n}2 {n}1 {n}1 {n}3 {n}2 {n}2 {n}3 {n}1 {n}1 {n}2 {n}2
-           {n}2 {n}2 {n}1 {n}3 {n}1 {n}2 {n}2 {n}2 {n}1 {n}3 {n}1 {n}2 {n}2
-            {n}2 {n}2 {n}1 {n}1 {n}3 {n}2 {n}2 {n}3 {n}1 {n}1 {n}2 {n}2 {n}2
-             {n}2 {n}1 {n}3 {n}1 {n}1 {n}3 {n}1 {n}1 {n}3 {n}1 {n}2 {n}2 {n}2
-              {n}2 {n}1 {n}1 {n}3 {n}1 {n}1 {n}3 {n}1 {n}1 {n}2 {n}2 {n}2 {n}2
-               {n}2 {n}2 {n}1 {n}1 {n}3 {n}1 {n}1 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2
-                {n}2 {n}2 {n}2 {n}1 {n}1 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2
-                 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2 {n}2
+{c['assembly lattice']} 0                  -{s['assembly lattice']} u={u['assembly lattice']} lat=2 imp:n=1 fill=-6:6 -6:6 0:0
+{channels}
 c
-{n}16 1000  -1.5984e-03   -{n}14        u={n}0         imp:n=1 $ He (3MPa, 900K)
-{n}17 0             {n}14 -{n}15  u={n}0 fill={n}9     imp:n=1
+{c['control hole']} {m['control hole']}  -1.5984e-03   -{s['control hole']}        u={u['control hole']}         imp:n=1 $ He (3MPa, 900K)
+{c['control fill']} 0             {s['control hole']} -{s['control fill']}  u={u['control fill']} fill={u['assembly lattice']}     imp:n=1
 """
 
-     materials=f"""c
-c Layer {l}, Assembly {n}
-m{n}1  $ Kernel
-     92235.00c   4.816186e-03
-     92238.00c   1.932238e-02
-      8016.00c   4.827713e-02
-m{n}2  $ Buffer
-      6012.00c   0.9890
-      6013.00c   0.0110
-mt{n}2 grph.25t
-m{n}3  $ Pyrolitic Carbon
-      6012.00c   0.9890
-      6013.00c   0.0110
-mt{n}3 grph.25t
-m{n}4  $ Silicon Carbide
-     14028.00c   0.4612
-     14029.00c   0.0234
-     14030.00c   0.0154
-      6012.00c   0.4945
-      6013.00c   0.0055
-mt{n}4 grph.25t
-m{n}5  $ Graphite Block - Fuel Ch
-      6012.00c   0.9890
-      6013.00c   0.0110
-mt{n}5 grph.25t
-m{n}6  $ Graphite Block - Block
-      6012.00c   0.9890
-      6013.00c   0.0110
-mt{n}6 grph.25t
-m{n}7  $ Graphite Block - Coolant Ch
-      6012.00c   0.9890
-      6013.00c   0.0110
-mt{n}7 grph.25t
-"""
+     materials = assembly_materials(l, n)
 
      return cells, surfaces, materials
 
 
-def reflector():
+def core_map(l, layout=layout):
+     """
+     Returns the fill array of the core lattice of layer 'l': the assemblies
+     (universe '{n}0') surrounded by the reflector universe 1000 + l.
+     """
+     N = layout.rings + 1
+     filler = f'{1000 + l}'
+     grid = {(i, j): f'{l+1}{p:02d}0' for p, i, j in hex_positions(layout.rings)}
+     rows = ''
+     for k, j in enumerate(range(-N, N + 1)):
+          row = ' '.join(grid.get((i, j), filler) for i in range(-N, N + 1))
+          rows += f"""{' '*(6 + k)}{row}\n"""
+     return rows
 
-     surfaces = """c
-c Layer 1, radial reflector
-9000 c/z  0 0  17.5
-9001 rhp  0 0  68   0 0  68     0  15  0
-c
-c Layer 2, radial reflector
-9002 c/z  0 0  17.5
-9003 rhp  0 0   0   0 0  68     0  15  0
-c
-c Layer 3, radial reflector
-9004 c/z  0 0  17.5
-9005 rhp  0 0 -68   0 0  68     0  15  0
-c
-c Layer 4, radial reflector
-9006 c/z  0 0  17.5
-9007 rhp  0 0 -136  0 0  68     0  15  0
-c
-9091 rhp  0 0   68   0 0  68   100   0  0
-9092 rhp  0 0    0   0 0  68   100   0  0
-9093 rhp  0 0  -68   0 0  68   100   0  0
-9094 rhp  0 0 -136   0 0  68   100   0  0
-9100 c/z  0 0    6
-9101 pz -136
-9102 pz  -68
-9103 pz    0
-9104 pz   68
-9105 pz  136
-9130 c/z  0 0   134
-9131 pz  -204
-9132 pz   204
+
+def reflector(layout=layout):
+
+     N = layout.rings + 1
+     top = layer_bottom(0, layout)
+     bottom = layer_bottom(layout.layers, layout)
+     apothem = core_apothem(layout)
+     radius = reflector_radius(layout)
+     # volumes scaled from the reference core
+     area = math.pi*radius**2 - 2*math.sqrt(3)*apothem**2
+     reference_area = (math.pi*reference_reflector_radius**2
+                       - 2*math.sqrt(3)*reference_core_apothem**2)
+     end_vol = 3835909.76 * (radius / reference_reflector_radius)**2
+     layer_vol = 1480320.66 * area / reference_area * layout.height / reference_height
+     # top and bottom reflectors are as thick as the reference blocks
+     top_end = top + reference_height
+     bottom_end = bottom - reference_height
+
+     surfaces = """"""
+     for l in range(1, layout.layers + 1):
+          h = f'{layer_bottom(l, layout):>3g}'
+          surfaces += f"""c
+c Layer {l}, radial reflector
+{9000 + 2*(l-1)} c/z  0 0  17.5
+{9001 + 2*(l-1)} rhp  0 0 {h:<4}  0 0  {layout.height:g}     0  15  0
+"""
+     surfaces += """c\n"""
+     for l in range(1, layout.layers + 1):
+          surfaces += f"""{9090 + l} rhp  0 0 {layer_bottom(l, layout):>4g}   0 0  {layout.height:g}  {apothem:>4g}   0  0\n"""
+     surfaces += """9100 c/z  0 0    6\n"""
+     for k in range(layout.layers + 1):
+          surfaces += f"""{9101 + k} pz {layer_bottom(layout.layers - k, layout):>4g}\n"""
+     surfaces += f"""9130 c/z  0 0 {radius:>5g}
+9131 pz {bottom_end:>5g}
+9132 pz {top_end:>5g}
 """
 
      cells = """c
 c Core
-9900 9901  -1.75        -9000   u=1001                  imp:n=1
-9901 0                  -9001   u=901 lat=2 imp:n=1 fill=-4:4 -4:4 0:0
-      1001 1001 1001 1001 1001 1001 1001 1001 1001
-       1001 1001 1001 1001 2430 2440 2450 2460 1001
-        1001 1001 1001 2420 2190 2200 2210 2470 1001
-         1001 1001 2410 2180 2050 2060 2220 2480 1001
-          1001 2400 2170 2040 1001 2010 2110 2310 1001
-           1001 2390 2160 2030 2020 2120 2320 1001 1001
-            1001 2380 2150 2140 2130 2330 1001 1001 1001
-             1001 2370 2360 2350 2340 1001 1001 1001 1001
-              1001 1001 1001 1001 1001 1001 1001 1001 1001
-c
-c
-9902 9902  -1.75        -9002   u=1002                  imp:n=1
-9903 0                  -9003   u=902 lat=2 imp:n=1 fill=-4:4 -4:4 0:0
-      1002 1002 1002 1002 1002 1002 1002 1002 1002
-       1002 1002 1002 1002 3430 3440 3450 3460 1002
-        1002 1002 1002 3420 3190 3200 3210 3470 1002
-         1002 1002 3410 3180 3050 3060 3220 3480 1002
-          1002 3400 3170 3040 1002 3010 3110 3310 1002
-           1002 3390 3160 3030 3020 3120 3320 1002 1002
-            1002 3380 3150 3140 3130 3330 1002 1002 1002
-             1002 3370 3360 3350 3340 1002 1002 1002 1002
-              1002 1002 1002 1002 1002 1002 1002 1002 1002
-c
-c
-9904 9903  -1.75        -9004   u=1003                  imp:n=1
-9905 0                  -9005   u=903 lat=2 imp:n=1 fill=-4:4 -4:4 0:0
-      1003 1003 1003 1003 1003 1003 1003 1003 1003
-       1003 1003 1003 1003 4430 4440 4450 4460 1003
-        1003 1003 1003 4420 4190 4200 4210 4470 1003
-         1003 1003 4410 4180 4050 4060 4220 4480 1003
-          1003 4400 4170 4040 1003 4010 4110 4310 1003
-           1003 4390 4160 4030 4020 4120 4320 1003 1003
-            1003 4380 4150 4140 4130 4330 1003 1003 1003
-             1003 4370 4360 4350 4340 1003 1003 1003 1003
-              1003 1003 1003 1003 1003 1003 1003 1003 1003
-c
-c
-9906 9904  -1.75        -9006   u=1004                  imp:n=1
-9907 0                  -9007   u=904 lat=2 imp:n=1 fill=-4:4 -4:4 0:0
-      1004 1004 1004 1004 1004 1004 1004 1004 1004
-       1004 1004 1004 1004 5430 5440 5450 5460 1004
-        1004 1004 1004 5420 5190 5200 5210 5470 1004
-         1004 1004 5410 5180 5050 5060 5220 5480 1004
-          1004 5400 5170 5040 1004 5010 5110 5310 1004
-           1004 5390 5160 5030 5020 5120 5320 1004 1004
-            1004 5380 5150 5140 5130 5330 1004 1004 1004
-             1004 5370 5360 5350 5340 1004 1004 1004 1004
-              1004 1004 1004 1004 1004 1004 1004 1004 1004
-c
-c
-9960 1000  -1.5984e-03  -9100  9101 -9105            imp:n=1
-9971 0                   9100 -9091 fill=901         imp:n=1
-9972 0                   9100 -9092 fill=902         imp:n=1
-9973 0                   9100 -9093 fill=903         imp:n=1
-9974 0                   9100 -9094 fill=904         imp:n=1
-c Top
-9990 9950  -1.75        -9130 9105 -9132        vol=3835909.76  imp:n=1
+"""
+     for l in range(1, layout.layers + 1):
+          lattice_cell, _ = core_cells(l)
+          cells += f"""{9900 + 2*(l-1)} 1001  -1.75        -{9000 + 2*(l-1)}   u={1000 + l}                  imp:n=1
+{lattice_cell} 0                  -{9001 + 2*(l-1)}   u={900 + l} lat=2 imp:n=1 fill=-{N}:{N} -{N}:{N} 0:0
+"""
+          cells += core_map(l, layout)
+          cells += """c\nc\n"""
+
+     top_plane = 9101 + layout.layers
+     cells += f"""{9960} 1000  -1.5984e-03  -9100  9101 -{top_plane}            imp:n=1\n"""
+     for l in range(1, layout.layers + 1):
+          _, assembly_cell = core_cells(l)
+          cells += f"""{assembly_cell} 0                   9100 -{9090 + l} fill={900 + l}         imp:n=1\n"""
+     cells += f"""c Top
+9990 9950  -1.75        -9130 {top_plane} -9132        vol={end_vol:.2f}  imp:n=1
 c Layers
-9991 9951  -1.75         9091 -9130 9104 -9105  vol=1480320.66  imp:n=1
-9992 9952  -1.75         9092 -9130 9103 -9104  vol=1480320.66  imp:n=1
-9993 9953  -1.75         9093 -9130 9102 -9103  vol=1480320.66  imp:n=1
-9994 9954  -1.75         9094 -9130 9101 -9102  vol=1480320.66  imp:n=1
-c Bottom
-9995 9955  -1.75        -9130 9131 -9101        vol=3835909.76  imp:n=1
+"""
+     for l in range(1, layout.layers + 1):
+          cells += f"""{9990 + l} {9950 + l}  -1.75         {9090 + l} -9130 {top_plane - l} -{top_plane + 1 - l}  vol={layer_vol:.2f}  imp:n=1\n"""
+     cells += f"""c Bottom
+{9991 + layout.layers} {9951 + layout.layers}  -1.75        -9130 9131 -9101        vol={end_vol:.2f}  imp:n=1
 """
 
-     materials = """c
-c Radial reflector - inside hexagon
-m9901  $ Graphite Block
-      6012.00c   0.9890
-      6013.00c   0.0110
-mt9901 grph.25t
-c
-c Radial reflector - inside hexagon
-m9902  $ Graphite Block
-      6012.00c   0.9890
-      6013.00c   0.0110
-mt9902 grph.25t
-c
-c Radial reflector - inside hexagon
-m9903  $ Graphite Block
-      6012.00c   0.9890
-      6013.00c   0.0110
-mt9903 grph.25t
-c
-c Radial reflector - inside hexagon
-m9904  $ Graphite Block
-      6012.00c   0.9890
-      6013.00c   0.0110
-mt9904 grph.25t
-c
-c Top reflector
-m9950  $ Graphite Block
-      6012.00c   0.9890
-      6013.00c   0.0110
-mt9950 grph.25t
-c
-c Radial reflector - Layer 1
-m9951  $ Graphite Block
-      6012.00c   0.9890
-      6013.00c   0.0110
-mt9951 grph.25t
-c
-c Radial reflector - top layer
-m9952  $ Graphite Block
-      6012.00c   0.9890
-      6013.00c   0.0110
-mt9952 grph.25t
-c
-c Radial reflector - top layer
-m9953  $ Graphite Block
-      6012.00c   0.9890
-      6013.00c   0.0110
-mt9953 grph.25t
-c
-c Radial reflector - Layer 1
-m9954  $ Graphite Block
-      6012.00c   0.9890
-      6013.00c   0.0110
-mt9954 grph.25t
-c
-c Bottom reflector
-m9955  $ Graphite Block
-      6012.00c   0.9890
-      6013.00c   0.0110
-mt9955 grph.25t
+     materials = """"""
+     reflectors = [(9950, 'Top reflector')]
+     reflectors += [(9950 + l, f'Radial reflector - Layer {l}') for l in range(1, layout.layers + 1)]
+     reflectors += [(9951 + layout.layers, 'Bottom reflector')]
+     for m, name in reflectors:
+          materials += f"""c
+c {name}
+{mcnp_materials.card(m, graphite, thermal='grph.25t', comment='Graphite Block', sep='  ')}
 """
 
-     return cells, surfaces, materials 
+     return cells, surfaces, materials
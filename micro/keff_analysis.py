@@ -0,0 +1,180 @@
+""" Finds the keff crossings and the core lifetime of many depletion cases at once """
+import os
+import re
+import argparse
+import numpy as np
+
+
+_sigma_names = ('sigma', 'std', 'keff std', 'std dev', 'keff_std', 'uncertainty')
+
+
+def read_case(filename, time_scale=1.):
+     """
+     Reads keff versus time of one case.
+
+     The first line naming both a 'time' and a 'keff' column is the header
+     (comma, tab or blank separated, so csv files and the burnup summary
+     table of an MCNP output are read alike; names of several words need
+     two blanks between columns); the rows of numbers that follow are the
+     data. A column named as one of '_sigma_names' is the 1-sigma keff
+     uncertainty, zero if there is none.
+
+     Returns
+     -------
+     time, keff, sigma: array of float
+          time in the file units times 'time_scale'
+     """
+     with open(filename, errors='replace') as f:
+          lines = f.read().split('\n')
+
+     columns = None
+     rows = []
+     for line in lines:
+          if columns is None:
+               for fields in (re.split(r',|\s{2,}|\t', line.strip()), line.split()):
+                    fields = [field.strip().lower() for field in fields]
+                    if 'keff' in fields and any(field.startswith('time') for field in fields):
+                         columns = fields
+                         break
+               continue
+          fields = line.replace(',', ' ').split()
+          try:
+               values = [float(v) for v in fields]
+          except ValueError:
+               if rows:
+                    break
+               continue
+          if len(values) >= len(columns):
+               rows.append(values)
+          elif rows:
+               break
+
+     if not rows:
+          raise ValueError(f'no keff versus time table in {filename}')
+     data = np.array([row[:len(columns)] for row in rows])
+     time = data[:, [k for k, c in enumerate(columns) if c.startswith('time')][0]] * time_scale
+     keff = data[:, columns.index('keff')]
+     sigma_columns = [k for k, c in enumerate(columns) if c in _sigma_names]
+     sigma = data[:, sigma_columns[0]] if sigma_columns else np.zeros_like(keff)
+     return time, keff, sigma
+
+
+def load_cases(filenames, time_scale=1.):
+     """
+     Reads many cases into one array, shorter cases padded with NaN.
+
+     Returns
+     -------
+     names: list of str
+     time, keff, sigma: np.ndarray
+          shape (n_cases, n_steps)
+     """
+     cases = [read_case(f, time_scale) for f in filenames]
+     steps = max(len(case[0]) for case in cases)
+     data = np.full((3, len(cases), steps), np.nan)
+     for n, case in enumerate(cases):
+          data[:, n, :len(case[0])] = case
+     names = [os.path.splitext(os.path.basename(f))[0] for f in filenames]
+     return names, data[0], data[1], data[2]
+
+
+def crossings(time, keff, sigma=None, target=1.):
+     """
+     Finds every crossing of keff = 'target' of every case, by linear
+     interpolation between the steps. keff does not need to be monotonic,
+     a curve going up and down again gives all its crossings.
+
+     Parameters
+     ----------
+     time, keff, sigma: array of float
+          shape (n_cases, n_steps), NaN padded, or (n_steps,) shared by
+          all cases
+     target: float
+
+     Returns
+     -------
+     case: array of int
+          case of each crossing
+     t: array of float
+          crossing time
+     t_sigma: array of float
+          1-sigma uncertainty of the crossing time, from the keff
+          uncertainty of the two steps around it
+     direction: array of int
+          -1 where keff drops below 'target', +1 where it rises above
+     """
+     keff = np.atleast_2d(keff)
+     time = np.broadcast_to(time, keff.shape)
+     sigma = np.zeros_like(keff) if sigma is None else np.broadcast_to(sigma, keff.shape)
+     d = keff - target
+     d0, d1 = d[:, :-1], d[:, 1:]
+     n_cases, n_steps = d.shape
+     # first step off target from each step on (NaN padding counts as off)
+     off = np.where(d != 0, np.arange(n_steps), n_steps)
+     off = np.minimum.accumulate(off[:, ::-1], axis=1)[:, ::-1]
+     after = np.concatenate([off[:, 2:], np.full((n_cases, 1), n_steps)], axis=1)
+     after = np.take_along_axis(np.concatenate([d, np.full((n_cases, 1), np.nan)], axis=1), after, axis=1)
+     # a step exactly on target is counted once, with the interval it ends,
+     # unless keff goes back to the side it came from (a touch)
+     touch = (d1 == 0) & (np.sign(after) == np.sign(d0))
+     found = ((d0 > 0) & (d1 <= 0) & ~touch) | ((d0 < 0) & (d1 >= 0) & ~touch)
+     found |= (d0 == 0) & (np.arange(d0.shape[1]) == 0)[None, :] & (d1 != 0)
+     case, step = np.nonzero(found)
+
+     t0, t1 = time[case, step], time[case, step + 1]
+     k0, k1 = d0[case, step], d1[case, step]
+     s0, s1 = sigma[case, step], sigma[case, step + 1]
+     dk = k0 - k1
+     with np.errstate(divide='ignore', invalid='ignore'):
+          fraction = np.where(dk != 0, k0 / dk, 0.)
+          t = t0 + (t1 - t0) * fraction
+          # dt/dk0 = -(t1 - t0) k1 / dk^2, dt/dk1 = (t1 - t0) k0 / dk^2
+          t_sigma = np.abs(t1 - t0) / dk**2 * np.hypot(k1*s0, k0*s1)
+     direction = np.where(k1 < k0, -1, 1)
+     return case, t, np.where(dk != 0, t_sigma, 0.), direction
+
+
+def lifetime(time, keff, sigma=None, target=1.):
+     """
+     Returns the first time keff drops to 'target' in each case, and its
+     uncertainty (NaN for a case that stays above).
+     """
+     n_cases = np.atleast_2d(keff).shape[0]
+     case, t, t_sigma, direction = crossings(time, keff, sigma, target)
+     down = direction < 0
+     case, t, t_sigma = case[down], t[down], t_sigma[down]
+     # first crossing of each case: crossings come sorted by case and step
+     first = np.ones(len(case), dtype=bool)
+     first[1:] = case[1:] != case[:-1]
+     result = np.full((2, n_cases), np.nan)
+     result[0, case[first]] = t[first]
+     result[1, case[first]] = t_sigma[first]
+     return result[0], result[1]
+
+
+def lifetime_table(names, time, keff, sigma=None, target=1.):
+     """ Returns the lifetime of every case as csv text (case, lifetime, uncertainty, crossings) """
+     life, life_sigma = lifetime(time, keff, sigma, target)
+     case, _, _, _ = crossings(time, keff, sigma, target)
+     count = np.bincount(case, minlength=len(names))
+     lines = ['case,lifetime,lifetime std,crossings']
+     for name, t, s, c in zip(names, life, life_sigma, count):
+          lines.append(f'{name},{t:.5g},{s:.3g},{c}')
+     return '\n'.join(lines)
+
+
+if __name__ == "__main__":
+
+     parser = argparse.ArgumentParser(description=__doc__)
+     parser.add_argument('cases', nargs='+', help='keff versus time files, one per case')
+     parser.add_argument('--target', type=float, default=1., help='keff of the crossing')
+     parser.add_argument('--time-scale', type=float, default=1.,
+                         help='factor on the file times (1/365.25 for days to years)')
+     parser.add_argument('--output', help='csv file of the lifetime table')
+     args = parser.parse_args()
+
+     table = lifetime_table(*load_cases(args.cases, args.time_scale), target=args.target)
+     print(table)
+     if args.output:
+          with open(args.output, 'w+') as f:
+               f.write(table + '\n')
@@ -1,6 +1,7 @@
+""" Plots keff versus irradiation time and the core exit time """
+import argparse
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.ticker import ScalarFormatter
+import keff_analysis
 
 
 # my results
@@ -8,14 +9,41 @@ time = np.array([1e-05, 1.0, 1.5, 2.5, 2.5, 2.5, 2.5, 2.5, 2.5, 2.5])
 time = np.cumsum(time)
 keff = np.array([1.26797, 1.23563, 1.20865, 1.16463, 1.12299, 1.08451, 1.04860, 1.01426, 0.98096, 0.94877])
 
-time_burn = np.interp([1.0], keff[::-1], time[::-1])[0]
-print(f"Core life time: {time}")
-
-plt.figure()
-plt.plot(time, keff, marker='o', label='simplified')
-micro = u"\u03bc"
-# plt.legend()
-plt.title(f'Exit time: {time_burn:.2f} years')
-plt.ylabel('Keff [-]')
-plt.xlabel('Time [years]')
-plt.savefig('keff-irrad-time', dpi=300, bbox_inches="tight")
+
+def exit_time(time, keff):
+     """ Returns the time at which keff first drops to 1 (NaN if it stays above) """
+     return keff_analysis.lifetime(time, keff)[0][0]
+
+
+def plot_keff(time, keff, figname='keff-irrad-time'):
+     """
+     Plots keff versus irradiation time.
+
+     Parameters
+     ----------
+     time: array of float
+          irradiation time [years]
+     keff: array of float
+     figname: str
+          name of the figure
+     """
+     import matplotlib.pyplot as plt
+
+     time_burn = exit_time(time, keff)
+     plt.figure()
+     plt.plot(time, keff, marker='o', label='simplified')
+     plt.title(f'Exit time: {time_burn:.2f} years')
+     plt.ylabel('Keff [-]')
+     plt.xlabel('Time [years]')
+     plt.savefig(figname, dpi=300, bbox_inches="tight")
+     plt.close()
+
+
+if __name__ == "__main__":
+
+     parser = argparse.ArgumentParser(description=__doc__)
+     parser.add_argument('--output', default='keff-irrad-time', help='figure name')
+     args = parser.parse_args()
+
+     print(f"Core life time: {time}")
+     plot_keff(time, keff, args.output)
@@ -0,0 +1,201 @@
+""" Sweeps control assembly loading patterns of the micro core, one deck per pattern up to symmetry """
+import os
+import json
+import random
+import hashlib
+import argparse
+import itertools
+import concurrent.futures
+import input_definition as indef
+import core_builder
+import symmetry
+
+
+# Symmetries a pattern can be required to have, as generators (see
+# symmetry.elements); the rotations alone need periodic boundaries for a
+# sector model but are fine for the full core.
+constraints = {
+     'D6': [(1, 0), (0, 1)],
+     'D3': [(2, 0), (0, 1)],
+     "D3'": [(2, 0), (1, 1)],
+     'C6': [(1, 0)],
+     'C3': [(2, 0)],
+     'C2': [(3, 0)],
+     'none': [],
+}
+
+
+def position_maps(rings):
+     """
+     Returns the images of every position under the 12 operations of the
+     hexagon: {(k, m): {position: image}}.
+     """
+     index = {(i, j): p for p, i, j in indef.hex_positions(rings)}
+     maps = {}
+     for k, m in symmetry.elements(constraints['D6']):
+          op = symmetry.operation(k, m)
+          maps[(k, m)] = {p: index[tuple(int(v) for v in op @ ij)] for ij, p in index.items()}
+     return maps
+
+
+def orbits(rings, candidates=None, constraint='none'):
+     """
+     Returns the orbits of the candidate positions under 'constraint': a
+     pattern with that symmetry is a union of orbits. Orbits reaching outside
+     of the candidates are left out.
+     """
+     maps = position_maps(rings)
+     ops = symmetry.elements(constraints[constraint])
+     candidates = set(candidates or [p for p, _, _ in indef.hex_positions(rings)])
+     found, seen = [], set()
+     for p in sorted(candidates):
+          if p in seen:
+               continue
+          orbit = tuple(sorted({maps[op][p] for op in ops}))
+          seen.update(orbit)
+          if set(orbit) <= candidates:
+               found.append(orbit)
+     return found
+
+
+def canonical(pattern, maps):
+     """ Returns the representative of the pattern among its 12 images: the smallest sorted tuple """
+     return min(tuple(sorted(m[p] for p in pattern)) for m in maps.values())
+
+
+def patterns(rings, count, candidates=None, constraint='none'):
+     """
+     Yields every pattern of 'count' control positions with the symmetry
+     'constraint', as sorted tuples (equivalent patterns included).
+     """
+     found = orbits(rings, candidates, constraint)
+
+     def combine(start, left, chosen):
+          if left == 0:
+               yield tuple(sorted(itertools.chain(*chosen)))
+               return
+          for n in range(start, len(found)):
+               if len(found[n]) <= left:
+                    yield from combine(n + 1, left - len(found[n]), chosen + [found[n]])
+
+     yield from combine(0, count, [])
+
+
+def sample(rings, count, n_samples, candidates=None, constraint='none', seed=1):
+     """
+     Returns up to 'n_samples' random distinct patterns of 'count' positions
+     with the symmetry 'constraint', for sweeps too large to enumerate.
+     """
+     found = orbits(rings, candidates, constraint)
+     rng = random.Random(seed)
+     result = set()
+     for _ in range(50*n_samples):
+          if len(result) == n_samples:
+               break
+          chosen, left = [], count
+          for orbit in rng.sample(found, len(found)):
+               if len(orbit) <= left:
+                    chosen.append(orbit)
+                    left -= len(orbit)
+          if left == 0:
+               result.add(tuple(sorted(itertools.chain(*chosen))))
+     return sorted(result)
+
+
+def source_digest():
+     """ Returns the sha256 of the deck generator sources (see core_builder.sources) """
+     digest = hashlib.sha256()
+     for filename in core_builder.sources:
+          with open(filename, 'rb') as f:
+               digest.update(f.read())
+     return digest.hexdigest()
+
+
+def cache_key(layout, digest=None):
+     """
+     Returns the content address of a deck: the sha256 of the layout and of
+     the generator sources, the same for every run of the same deck.
+     """
+     text = json.dumps([list(layout), digest or source_digest()])
+     return hashlib.sha256(text.encode()).hexdigest()
+
+
+def _generate(task):
+     """ Writes the decks of one layout (layout, directory), returns the directory """
+     layout, directory = task
+     core_builder.write_decks(['micro.i'], directory, layout=layout)
+     with open(os.path.join(directory, 'layout.json'), 'w+') as f:
+          json.dump(layout._asdict(), f)
+     return directory
+
+
+def sweep(pattern_list, base=indef.layout, cache='sweep', workers=1):
+     """
+     Writes one deck per pattern up to symmetry into the content-addressed
+     'cache' directory (cache/<key>/micro.i) and returns the manifest.
+
+     Patterns equivalent by symmetry share the deck of their canonical
+     pattern, and decks already in the cache are not generated again, so a
+     run left in a cache directory is reused by every later sweep.
+
+     Returns
+     -------
+     manifest: list of dict
+          pattern, canonical pattern, key, directory and whether the deck was
+          generated by this sweep
+     """
+     maps = position_maps(base.rings)
+     digest = source_digest()
+     manifest, tasks = [], {}
+     for pattern in pattern_list:
+          unique = canonical(pattern, maps)
+          layout = base._replace(control=unique)
+          key = cache_key(layout, digest)
+          directory = os.path.join(cache, key[:16])
+          if not os.path.exists(os.path.join(directory, 'micro.i')):
+               tasks[key] = (layout, directory)
+          manifest.append({'pattern': list(pattern), 'canonical': list(unique), 'key': key,
+                           'directory': directory, 'generated': key in tasks})
+
+     if workers > 1:
+          with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+               list(pool.map(_generate, tasks.values()))
+     else:
+          list(map(_generate, tasks.values()))
+     return manifest
+
+
+if __name__ == "__main__":
+
+     parser = argparse.ArgumentParser(description=__doc__)
+     parser.add_argument('--count', type=int, nargs='+', default=[len(indef.layout.control)],
+                         help='numbers of control assemblies')
+     parser.add_argument('--symmetry', default='D6', choices=list(constraints),
+                         help='symmetry required of the patterns')
+     parser.add_argument('--positions', type=int, nargs='*', help='candidate positions (default: all)')
+     parser.add_argument('--sample', type=int, help='random patterns per count instead of all')
+     parser.add_argument('--seed', type=int, default=1)
+     parser.add_argument('--cache', default='sweep', help='content-addressed deck directory')
+     parser.add_argument('--workers', type=int, default=1, help='processes generating the decks')
+     parser.add_argument('--rings', type=int, default=indef.layout.rings)
+     parser.add_argument('--layers', type=int, default=indef.layout.layers)
+     parser.add_argument('--height', type=float, default=indef.layout.height)
+     args = parser.parse_args()
+
+     base = indef.Layout(args.rings, args.layers, args.height, ())
+     pattern_list = []
+     for count in args.count:
+          if args.sample:
+               pattern_list += sample(args.rings, count, args.sample, args.positions, args.symmetry, args.seed)
+          else:
+               pattern_list += list(patterns(args.rings, count, args.positions, args.symmetry))
+
+     manifest = sweep(pattern_list, base, args.cache, args.workers)
+     os.makedirs(args.cache, exist_ok=True)
+     with open(os.path.join(args.cache, 'manifest.json'), 'w+') as f:
+          json.dump(manifest, f, indent=1)
+
+     unique = {entry['key'] for entry in manifest}
+     generated = {entry['key'] for entry in manifest if entry['generated']}
+     print(f'{len(manifest)} patterns, {len(unique)} unique up to symmetry, '
+           f'{len(generated)} generated, {len(unique) - len(generated)} from the cache')
@@ -0,0 +1,370 @@
+""" Finds the symmetry of the micro core layout and writes the reflective sector model """
+import os
+import re
+import math
+import argparse
+import numpy as np
+import input_definition as indef
+import core_builder
+import mcnp_deck
+
+
+# Symmetry operations on the indices (i, j) of the hexagonal lattices (i along
+# +y, j along 150 deg, see indef.hex_center): 'rotation' turns by 60 deg
+# counterclockwise, 'mirror' reflects about the y axis.
+rotation = np.array([[0, -1], [1, 1]])
+mirror = np.array([[1, 1], [0, -1]])
+
+# surfaces of the reflecting planes of the sector
+planes = (9140, 9141)
+
+# Subgroups with reflecting boundaries: generators as (rotations k, mirror)
+# for rotation^k @ mirror^m, the sector between two neighbouring mirror lines
+# [deg] and the number of sectors in the core.
+groups = {
+     'D6': {'generators': [(1, 0), (0, 1)], 'sector': (60, 90), 'order': 12},
+     'D3': {'generators': [(2, 0), (0, 1)], 'sector': (30, 90), 'order': 6},
+     "D3'": {'generators': [(2, 0), (1, 1)], 'sector': (0, 60), 'order': 6},
+}
+
+
+def operation(k, m):
+     """ Returns the index matrix of rotation^k @ mirror^m """
+     return np.linalg.matrix_power(rotation, k) @ np.linalg.matrix_power(mirror, m)
+
+
+def cartesian(k, m):
+     """
+     Returns the (x, y) matrix of rotation^k @ mirror^m: a turn of 60k deg,
+     or for m = 1 a reflection about the line at 90 + 30k deg.
+     """
+     if m == 0:
+          a = math.radians(60*k)
+          return np.array([[math.cos(a), -math.sin(a)], [math.sin(a), math.cos(a)]])
+     a = math.radians(2*(90 + 30*k))
+     return np.array([[math.cos(a), math.sin(a)], [math.sin(a), -math.cos(a)]])
+
+
+def elements(generators):
+     """ Returns all the (k, m) of the group spanned by 'generators' """
+     found = {(0, 0)}
+     while True:
+          new = set()
+          for k1, m1 in found:
+               for k2, m2 in generators:
+                    # R^k1 M^m1 R^k2 M^m2 = R^(k1 +- k2) M^(m1 + m2)
+                    k = (k1 + (-k2 if m1 else k2)) % 6
+                    new.add((k, (m1 + m2) % 2))
+          if new <= found:
+               return sorted(found)
+          found |= new
+
+
+def hex_distance(i, j):
+     """ Returns the ring of element (i, j) """
+     return np.maximum(np.maximum(np.abs(i), np.abs(j)), np.abs(i + j))
+
+
+def locate(x, y, pitch):
+     """
+     Returns the indices (i, j) of the hexagonal lattice element holding each
+     point, and the coordinates relative to its centre.
+     """
+     x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+     j = -2*x / (pitch*math.sqrt(3))
+     i = y/pitch - j/2
+     # round in cube coordinates (i, j, -i-j)
+     s = -i - j
+     ri, rj, rs = np.rint(i), np.rint(j), np.rint(s)
+     di, dj, ds = np.abs(ri - i), np.abs(rj - j), np.abs(rs - s)
+     fix_i = (di > dj) & (di > ds)
+     fix_j = ~fix_i & (dj > ds)
+     ri = np.where(fix_i, -rj - rs, ri)
+     rj = np.where(fix_j, -ri - rs, rj)
+     ri, rj = ri.astype(int), rj.astype(int)
+     cx, cy = indef.hex_center(ri, rj, pitch)
+     return ri, rj, x - cx, y - cy
+
+
+def control_positions(layout=indef.layout):
+     """ Returns the core lattice indices of the control assemblies """
+     return {(i, j) for p, i, j in indef.hex_positions(layout.rings) if p in layout.control}
+
+
+def _invariant(op, points):
+     """ True if 'op' maps 'points' onto itself (a set, or a dict keeping its values) """
+     for i, j in points:
+          image = tuple(int(v) for v in op @ (i, j))
+          if isinstance(points, dict):
+               if points.get(image) != points[(i, j)]:
+                    return False
+          elif image not in points:
+               return False
+     return True
+
+
+def find_symmetry(layout=indef.layout):
+     """
+     Returns the largest symmetry of the core that a sector with reflecting
+     boundaries can use: the control positions and the channel lattices of
+     the assemblies must be invariant.
+
+     Returns
+     -------
+     name: str
+          'D6' (1/12 model) or 'D3' / "D3'" (1/6 model, mirror lines through
+          or between the assembly centres)
+
+     Raises
+     ------
+     ValueError
+          if there is no such symmetry
+     """
+     control = control_positions(layout)
+     maps = [indef.channel_lattice('fuel'), indef.channel_lattice('control')]
+     # the lattice corners beyond the assembly hexagon are never reached
+     maps = [{p: v for p, v in m.items() if hex_distance(*p) <= 6} for m in maps]
+
+     def symmetric(k, m):
+          op = operation(k, m)
+          return _invariant(op, control) and all(_invariant(op, c) for c in maps)
+
+     for name, group in groups.items():
+          if all(symmetric(k, m) for k, m in group['generators']):
+               return name
+     rotational = [k for k in (1, 2) if symmetric(k, 0)]
+     hint = ' (only rotational symmetry, which needs periodic boundaries)' if rotational else ''
+     raise ValueError(f'the control layout has no 3-fold mirror symmetry{hint}')
+
+
+def classify(x, y, layout=indef.layout, maps=None):
+     """
+     Returns an integer class of the material at each point of the core
+     plane: 0 reflector, 10 * (1 fuel, 2 control assembly) + channel type,
+     24 control hole.
+     """
+     maps = maps or {kind: indef.channel_lattice(kind) for kind in ('fuel', 'control')}
+     i, j, lx, ly = locate(x, y, indef.assembly_pitch)
+     ci, cj, _, _ = locate(lx, ly, 2*1.6)
+
+     ring = hex_distance(i, j)
+     control = np.zeros(len(i), dtype=bool)
+     for ip, jp in control_positions(layout):
+          control |= (i == ip) & (j == jp)
+
+     channel = np.array([maps['fuel'].get(p, 2) for p in zip(ci, cj)])
+     channel_c = np.array([maps['control'].get(p, 2) for p in zip(ci, cj)])
+     result = np.where(control, 20 + channel_c, 10 + channel)
+     result = np.where(control & (lx**2 + ly**2 < 4**2), 24, result)
+     return np.where((ring == 0) | (ring > layout.rings), 0, result)
+
+
+def check_points(name, layout=indef.layout, n_points=20000, seed=1):
+     """
+     Checks the symmetry on the geometry itself: the material class of random
+     points of the core is compared to the class at every image of the points.
+
+     Returns
+     -------
+     mismatch: int
+          number of (point, operation) pairs with a different class
+     """
+     rng = np.random.default_rng(seed)
+     radius = (layout.rings + 1) * indef.assembly_pitch
+     x, y = rng.uniform(-radius, radius, (2, n_points))
+     maps = {kind: indef.channel_lattice(kind) for kind in ('fuel', 'control')}
+     reference = classify(x, y, layout, maps)
+     mismatch = 0
+     for k, m in elements(groups[name]['generators']):
+          xi, yi = cartesian(k, m) @ np.stack([x, y])
+          mismatch += int(np.sum(classify(xi, yi, layout, maps) != reference))
+     return mismatch
+
+
+def sector_fractions(name, layout=indef.layout):
+     """
+     Returns the fraction of each assembly position inside the sector (1, or
+     1/2 for an assembly cut by a reflecting plane), positions outside are
+     left out.
+     """
+     a, b = groups[name]['sector']
+     fractions = {}
+     for p, i, j in indef.hex_positions(layout.rings):
+          x, y = indef.hex_center(i, j)
+          angle = round(math.degrees(math.atan2(y, x)) % 360, 6)
+          if a < angle < b:
+               fractions[p] = 1.
+          elif angle in (a, b):
+               fractions[p] = 0.5
+     return fractions
+
+
+def _planes(name):
+     """ Returns the cards of the reflecting planes, normals pointing into the sector """
+     a, b = (math.radians(angle) for angle in groups[name]['sector'])
+     normals = [(-math.sin(a), math.cos(a)), (math.sin(b), -math.cos(b))]
+     cards = """c
+c Sector: reflecting planes
+"""
+     for surface, (nx, ny) in zip(planes, normals):
+          nx, ny = round(nx, 9) + 0., round(ny, 9) + 0.
+          cards += f"""*{surface} p  {nx:.9f} {ny:.9f} 0  0\n"""
+     return cards
+
+
+def sector_source(name, layout=indef.layout, histories=None):
+     """
+     Returns the source cards of the sector: the fuel channel centres of the
+     full core source (see indef.source_points) inside the sector, points on
+     a reflecting plane moved 0.01 cm into the sector.
+     """
+     a, b = (math.radians(angle) for angle in groups[name]['sector'])
+     normals = [(-math.sin(a), math.cos(a)), (math.sin(b), -math.cos(b))]
+     points = []
+     for x, y, z in indef.source_points(layout):
+          distances = [nx*x + ny*y for nx, ny in normals]
+          if min(distances) < -1e-6:
+               continue
+          for (nx, ny), d in zip(normals, distances):
+               if d < 1e-6:
+                    x, y = x + 0.01*nx, y + 0.01*ny
+          points.append((x, y, z))
+     histories = histories or math.ceil(10000 / groups[name]['order'])
+     return indef.source(layout, points, histories)
+
+
+_cell_geometry = re.compile(
+     r'^(\s*\d+\s+(?:0|\d+\s+\S+)\s+)(.*?)(\s+(?:\*?fill|vol|imp|u|lat|tmp|trcl)\b.*)$',
+     re.IGNORECASE)
+
+
+def _sector_cell(line, order):
+     """ Intersects a real world cell card line with the sector """
+     body, dollar, comment = line.partition('$')
+     prefix, geometry, rest = _cell_geometry.match(body).groups()
+     inside = ' '.join(f'{s}' for s in planes)
+     if re.search(r'imp:n\s*=\s*0\b', rest, re.IGNORECASE):
+          geometry = f'{geometry}:' + ':'.join(f'-{s}' for s in planes)
+     elif ':' in geometry:
+          geometry = f'({geometry}) {inside}'
+     else:
+          geometry = f'{geometry} {inside}'
+     rest = re.sub(r'vol=([\d.eE+-]+)', lambda m: f'vol={float(m.group(1))/order:.2f}', rest)
+     return prefix + geometry + rest + dollar + comment
+
+
+def sector_deck(name, layout=indef.layout, histories=None):
+     """
+     Returns the burnup deck reduced to the sector of symmetry 'name'.
+
+     The real world cells are intersected with the sector between two
+     reflecting planes and their volumes divided by the group order; the
+     universes are unchanged.
+     """
+     order = groups[name]['order']
+     full = core_builder.build_decks(['micro.i'], layout=layout)['micro.i']
+     lines = full.split('\n')
+     blank = [n for n, line in enumerate(lines) if not line.strip()]
+     cells_end, surfaces_end = blank[0], blank[1]
+
+     start = None
+     card_lines = []
+     for n in range(1, cells_end + 1):
+          line = lines[n] if n < cells_end else ''
+          if line.startswith('     ') and start is not None:
+               card_lines.append(line)
+               continue
+          if start is not None:
+               card = mcnp_deck.cards(card_lines)
+               if card and mcnp_deck.cell_universe(card[0]) == 0:
+                    lines[start] = _sector_cell(lines[start], order)
+          start, card_lines = None, []
+          if line[:1].isdigit():
+               start, card_lines = n, [line]
+
+     surfaces = _planes(name).rstrip('\n').split('\n')
+     lines = lines[:surfaces_end] + surfaces + lines[surfaces_end:]
+     deck = '\n'.join(lines)
+     return deck.replace(indef.source(layout), sector_source(name, layout, histories))
+
+
+def compare_decks(full, sector, order):
+     """
+     Checks the sector deck against the full core deck: same universes and
+     materials, every real world cell bounded by the planes, the reflecting
+     planes added and the volumes divided by 'order'.
+
+     Returns
+     -------
+     problems: list of str
+     """
+     problems = []
+     parts = []
+     for text in (full, sector):
+          _, cells, surfaces, data = mcnp_deck.blocks(text)
+          parts.append((mcnp_deck.cards(cells), mcnp_deck.cards(surfaces), mcnp_deck.cards(data)))
+     (f_cells, f_surf, f_data), (s_cells, s_surf, s_data) = parts
+
+     f_by_number = {mcnp_deck.cell_number(c): c for c in f_cells}
+     s_by_number = {mcnp_deck.cell_number(c): c for c in s_cells}
+     if f_by_number.keys() != s_by_number.keys():
+          problems.append('the cells differ')
+     for number, card in f_by_number.items():
+          other = s_by_number.get(number, '')
+          if mcnp_deck.cell_universe(card) != 0:
+               if other != card:
+                    problems.append(f'cell {number} changed')
+          elif not all(re.search(rf'-?{s}\b', other) for s in planes):
+               problems.append(f'cell {number} is not bounded by the sector')
+          else:
+               vols = [re.search(r'vol=([\d.eE+-]+)', c) for c in (card, other)]
+               if vols[0] and not math.isclose(float(vols[0].group(1)),
+                                               order*float(vols[1].group(1)), rel_tol=1e-5):
+                    problems.append(f'cell {number} volume is not 1/{order}')
+
+     names = [mcnp_deck.card_name(c).lstrip('*') for c in s_surf]
+     if sorted(names) != sorted([mcnp_deck.card_name(c) for c in f_surf] + [str(s) for s in planes]):
+          problems.append('the surfaces differ by more than the reflecting planes')
+     if mcnp_deck.material_numbers(f_data) != mcnp_deck.material_numbers(s_data):
+          problems.append('the materials differ')
+     return problems
+
+
+def report(name, layout=indef.layout, mismatch=0, problems=()):
+     """ Returns the summary of the sector model: size, normalization and checks """
+     order = groups[name]['order']
+     fractions = sector_fractions(name, layout)
+     cut = [f'{p:02d}' for p, f in fractions.items() if f < 1]
+     a, b = groups[name]['sector']
+     return f"""symmetry: {name}, sector {a}-{b} deg, 1/{order} of the core
+assemblies per layer in the sector: {sum(fractions.values()):g} of {3*layout.rings*(layout.rings + 1)}
+positions cut in half by a reflecting plane: {' '.join(cut) or 'none'}
+tally normalization: full core = sector tally per source particle, with real world volumes already divided by {order}; universe volumes are per instance, a cut position holds half of each
+histories per cycle: 1/{order} of the full core for the same statistics by assembly
+self-check: {mismatch} point mismatches, deck comparison: {'; '.join(problems) or 'ok'}"""
+
+
+if __name__ == "__main__":
+
+     parser = argparse.ArgumentParser(description=__doc__)
+     parser.add_argument('--output', default='mcnp/micro-sector.i', help='sector deck file name')
+     parser.add_argument('--histories', type=int, help='histories per cycle (default: full core / order)')
+     parser.add_argument('--rings', type=int, default=indef.layout.rings)
+     parser.add_argument('--layers', type=int, default=indef.layout.layers)
+     parser.add_argument('--height', type=float, default=indef.layout.height)
+     parser.add_argument('--control', type=int, nargs='*', default=indef.layout.control)
+     args = parser.parse_args()
+
+     layout = indef.Layout(args.rings, args.layers, args.height, tuple(args.control))
+     name = find_symmetry(layout)
+     deck = sector_deck(name, layout, args.histories)
+     full = core_builder.build_decks(['micro.i'], layout=layout)['micro.i']
+     mismatch = check_points(name, layout)
+     problems = compare_decks(full, deck, groups[name]['order'])
+
+     output = os.path.dirname(args.output)
+     if output:
+          os.makedirs(output, exist_ok=True)
+     with open(args.output, 'w+') as f:
+          f.write(deck)
+     print(report(name, layout, mismatch, problems))
@@ -0,0 +1,554 @@
+""" Merges independently generated MCNP sub-models into a host deck, renumbered without collisions """
+import os
+import re
+import json
+import argparse
+from collections import defaultdict
+import mcnp_deck
+
+
+KINDS = ('cells', 'surfaces', 'materials', 'universes', 'transforms')
+# largest number MCNP accepts of each kind
+LIMITS = {'cells': 99999999, 'surfaces': 99999999, 'materials': 99999999,
+          'universes': 99999999, 'transforms': 999}
+
+# data cards giving one value per cell, in the order of the cell cards, and
+# the cell card keywords of the same names
+CELL_CARDS = ('imp', 'vol', 'area', 'pwt', 'ext', 'fcl', 'elpt', 'nonu', 'pd', 'dxc', 'wwn',
+              'tmp', 'u', 'lat', 'fill', 'trcl', 'cosy', 'bflcl', 'unc')
+
+_data_number = re.compile(r'^(\*?)(m|mt|mx|tr)(\d+)$', re.IGNORECASE)
+_cell_card = re.compile(r'^\*?([a-z]+)(\d*)(?::([a-z#|,/*-]+))?$', re.IGNORECASE)
+_letter = re.compile(r'[a-z]', re.IGNORECASE)
+_geometry_number = re.compile(r'(#?)([+-]?)(\d+)((?:\.\d+)?)')
+_integer = re.compile(r'^[+-]?\d+$')
+
+
+def _tokens(text):
+    """
+    Returns the (start, end) of the fields of a card, with its comment lines,
+    '$' comments and '&' left out.
+    """
+    masked = []
+    for line in text.split('\n'):
+        if mcnp_deck._comment.match(line):
+            masked.append(' ' * len(line))
+            continue
+        body = line.split('$')[0]
+        masked.append((body + ' ' * (len(line) - len(body))).replace('&', ' '))
+    return [m.span() for m in re.finditer(r'\S+', '\n'.join(masked))]
+
+
+def _replace(text, replacements):
+    """ Applies {(start, end): new text} to a card """
+    for (start, end), new in sorted(replacements.items(), reverse=True):
+        text = text[:start] + new + text[end:]
+    return text
+
+
+def card_texts(lines):
+    """
+    Returns the text of each card of a block; the comment lines ahead of a
+    card (and inside it) belong to it, those after the last card to the last.
+    """
+    texts, pending = [], []
+    cont = False
+    for line in lines:
+        if mcnp_deck._comment.match(line):
+            pending.append(line)
+            continue
+        body = line.split('$')[0].rstrip()
+        if not body.strip():
+            pending.append(line)
+            cont = False
+            continue
+        if texts and (cont or line.startswith('     ')):
+            texts[-1] += '\n' + '\n'.join(pending + [line])
+        else:
+            texts.append('\n'.join(pending + [line]))
+        pending = []
+        cont = body.endswith('&')
+    while pending and not pending[-1].strip():
+        pending.pop()
+    if pending:
+        if texts:
+            texts[-1] += '\n' + '\n'.join(pending)
+        else:
+            texts.append('\n'.join(pending))
+    return texts
+
+
+def _last_line(card):
+    """ Returns the index of the last line of a card that is not a comment line """
+    lines = card.split('\n')
+    return lines, max(n for n, line in enumerate(lines) if not mcnp_deck._comment.match(line))
+
+
+def _joined(text):
+    """ Returns a card text as one line, comments left out """
+    return ' '.join(mcnp_deck.cards(text.split('\n')))
+
+
+def numbers(text):
+    """
+    Returns the numbers a deck defines of each kind.
+
+    Returns
+    -------
+    used: dict
+        keys: KINDS, values: set of int
+    """
+    _, cell_lines, surface_lines, data_lines = mcnp_deck.blocks(text)
+    used = {kind: set() for kind in KINDS}
+    for card in mcnp_deck.cards(cell_lines):
+        used['cells'].add(mcnp_deck.cell_number(card))
+        used['universes'].add(mcnp_deck.cell_universe(card))
+    for card in mcnp_deck.cards(surface_lines):
+        used['surfaces'].add(int(card.split()[0].lstrip('*+')))
+    for card in mcnp_deck.cards(data_lines):
+        match = _data_number.match(mcnp_deck.card_name(card))
+        if match:
+            kind = 'transforms' if match.group(2).lower() == 'tr' else 'materials'
+            used[kind].add(int(match.group(3)))
+    used['universes'].discard(0)
+    return used
+
+
+def offset_map(numbers_in, used, limit):
+    """
+    Returns {old: new} moving 'numbers_in' clear of 'used'.
+
+    The numbers are shifted by a multiple of the next power of ten above the
+    largest of them, so 91101 becomes 191101 and the digits keep their
+    meaning; when no shift fits under 'limit', each number takes the next
+    free one. Either way the map is built in O(n).
+    """
+    if not numbers_in:
+        return {}
+    step = 10**len(str(max(numbers_in)))
+    k = 0
+    while max(numbers_in) + k*step <= limit:
+        if not any(n + k*step in used for n in numbers_in):
+            return {n: n + k*step for n in numbers_in}
+        k += 1
+    mapping, free = {}, 1
+    for n in sorted(numbers_in):
+        while free in used:
+            free += 1
+        if free > limit:
+            raise ValueError(f'no free numbers left under {limit}')
+        mapping[n] = free
+        free += 1
+    return mapping
+
+
+def _expand(fields):
+    """ Expands the values of a cell-ordered data card ('1 880r 0') """
+    values = []
+    for field in fields:
+        low = field.lower()
+        if low.endswith('r') and values:
+            values += [values[-1]] * int(low[:-1] or 1)
+        elif low.endswith('j'):
+            values += [None] * int(low[:-1] or 1)
+        else:
+            values.append(field)
+    return values
+
+
+def _compress(values):
+    """ Writes values with 'r' repeats ('1 880r 0'), None as 'j' """
+    fields, n = [], 0
+    while n < len(values):
+        count = 1
+        while n + count < len(values) and values[n + count] == values[n]:
+            count += 1
+        if values[n] is None:
+            fields.append(f'{count}j')
+        else:
+            fields.append(values[n] + (f' {count - 1}r' if count > 1 else ''))
+        n += count
+    return ' '.join(fields)
+
+
+def _keys(name):
+    """
+    Returns the cell quantities named by a cell keyword or a cell-ordered
+    data card ('imp:n,p' -> ['imp:n', 'imp:p'], 'tmp' -> ['tmp1']), none for
+    other names.
+    """
+    match = _cell_card.match(name)
+    if not match or match.group(1).lower() not in CELL_CARDS:
+        return []
+    base = match.group(1).lower()
+    base += match.group(2) or ('1' if base == 'tmp' else '')
+    if match.group(3):
+        return [f'{base}:{particle}' for particle in match.group(3).lower().split(',')]
+    return [base]
+
+
+def _keywords(text):
+    """
+    Returns the keywords of a cell card as (name, value, (start, end)), the
+    value with every field up to the next keyword ('fill=0:1 0:1 0:0 1 2 ...',
+    'trcl=(0 0 5)').
+    """
+    spans = _tokens(text)
+    fields = [text[a:b] for a, b in spans]
+    if fields[1].lower() == 'like':
+        n = 4
+    else:
+        n = 3 if int(fields[1]) else 2
+        while n < len(fields) and not _letter.search(fields[n]):
+            n += 1
+    keywords = []
+    for (start, end), field in zip(spans[n:], fields[n:]):
+        if '=' in field or not keywords:
+            name, _, value = field.partition('=')
+            keywords.append([name, value, start, end])
+        else:
+            keywords[-1][1] += ' ' + field
+            keywords[-1][3] = end
+    return [(name, value, (start, end)) for name, value, start, end in keywords]
+
+
+class Deck:
+    """
+    The blocks of a deck, as card texts.
+
+    Parameters
+    ----------
+    text: str
+    """
+
+    def __init__(self, text):
+        title, cell_lines, surface_lines, data_lines = mcnp_deck.blocks(text)
+        self.title = title
+        self.cells = card_texts(cell_lines)
+        self.surfaces = card_texts(surface_lines)
+        self.data = card_texts(data_lines)
+
+    def vector(self, index):
+        """ Returns the values of a cell-ordered data card, None for a 'j' """
+        fields = _joined(self.data[index]).split()[1:]
+        # vol no 1 2 ...
+        return _expand(fields[1:] if fields and fields[0].lower() == 'no' else fields)
+
+    def cell_vectors(self):
+        """ Returns {quantity: index of its data card} of the cell quantities given in the data block (see _keys) """
+        vectors = {}
+        for n, card in enumerate(self.data):
+            for key in _keys(mcnp_deck.card_name(_joined(card))):
+                if self.vector(n):
+                    vectors[key] = n
+        return vectors
+
+    def cell_values(self):
+        """ Returns the quantities of each cell, from its keywords and the data cards: list of {quantity: value} """
+        result = [{} for _ in self.cells]
+        for n, card in enumerate(self.cells):
+            for name, value, _ in _keywords(card):
+                for key in _keys(name):
+                    result[n][key] = value
+        for key, index in self.cell_vectors().items():
+            for n, value in enumerate(self.vector(index)[:len(self.cells)]):
+                result[n][key] = value
+        return result
+
+    def text(self):
+        """ Returns the deck """
+        return '\n'.join([self.title] + self.cells + [''] + self.surfaces + [''] + self.data) + '\n'
+
+
+def renumber_cell(text, maps):
+    """ Returns a cell card with its cells, surfaces, materials, universes and transforms renumbered """
+    cells, surfaces, materials, universes, transforms = (maps[kind] for kind in KINDS)
+    spans = _tokens(text)
+    fields = [text[a:b] for a, b in spans]
+    new = {}
+
+    def put(n, value):
+        new[spans[n]] = value
+
+    put(0, str(cells.get(int(fields[0]), int(fields[0]))))
+    if fields[1].lower() == 'like':
+        put(2, str(cells.get(int(fields[2]), int(fields[2]))))
+        n = 4
+    else:
+        material = int(fields[1])
+        put(1, str(materials.get(material, material)))
+        n = 3 if material else 2
+
+    def geometry(match):
+        table = cells if match.group(1) else surfaces
+        number = int(match.group(3))
+        return match.group(1) + match.group(2) + str(table.get(number, number)) + match.group(4)
+
+    while n < len(fields) and not _letter.search(fields[n]):
+        put(n, _geometry_number.sub(geometry, fields[n]))
+        n += 1
+
+    while n < len(fields):
+        key, _, value = fields[n].partition('=')
+        low = key.lower().lstrip('*')
+        if low == 'u' and value:
+            sign = '-' if value.startswith('-') else ''
+            put(n, f'{key}={sign}{universes.get(abs(int(value)), abs(int(value)))}')
+        elif low == 'trcl' and _integer.match(value or ''):
+            put(n, f'{key}={transforms.get(int(value), int(value))}')
+        elif low == 'fill' and value:
+            if ':' in value:
+                # fill=i1:i2 j1:j2 k1:k2 and the array up to the next keyword
+                n += 3
+                while n < len(fields) and not ('=' in fields[n] or fields[n].lower().startswith('imp')):
+                    field = fields[n]
+                    if _integer.match(field):
+                        put(n, str(universes.get(int(field), int(field))))
+                    elif re.fullmatch(r'\(\d+\)', field):
+                        put(n, f'({transforms.get(int(field[1:-1]), int(field[1:-1]))})')
+                    n += 1
+                continue
+            put(n, f'{key}={universes.get(int(value), int(value))}')
+            if n + 1 < len(fields) and re.fullmatch(r'\(\d+\)', fields[n + 1]):
+                n += 1
+                put(n, f'({transforms.get(int(fields[n][1:-1]), int(fields[n][1:-1]))})')
+        n += 1
+    return _replace(text, new)
+
+
+def renumber_surface(text, maps):
+    """ Returns a surface card with its number, transform or periodic surface renumbered """
+    spans = _tokens(text)
+    fields = [text[a:b] for a, b in spans]
+    prefix = fields[0][:len(fields[0]) - len(fields[0].lstrip('*+'))]
+    number = int(fields[0][len(prefix):])
+    new = {spans[0]: prefix + str(maps['surfaces'].get(number, number))}
+    if _integer.match(fields[1]):
+        value = int(fields[1])
+        if value < 0:
+            new[spans[1]] = str(-maps['surfaces'].get(-value, -value))
+        else:
+            new[spans[1]] = str(maps['transforms'].get(value, value))
+    return _replace(text, new)
+
+
+def renumber_data(text, maps):
+    """ Returns a material, mt, mx or tr card with its number changed, None for other cards """
+    spans = _tokens(text)
+    match = _data_number.match(text[slice(*spans[0])])
+    if not match:
+        return None
+    kind = 'transforms' if match.group(2).lower() == 'tr' else 'materials'
+    number = int(match.group(3))
+    return _replace(text, {spans[0]: match.group(1) + match.group(2) + str(maps[kind].get(number, number))})
+
+
+def _renumber_value(key, value, maps):
+    """ Returns a universe (u, fill) or transform (trcl) number of a data card renumbered """
+    if value is None or not _integer.match(value):
+        return value
+    base, number = key.split(':')[0], int(value)
+    if base == 'u':
+        return ('-' if number < 0 else '') + str(maps['universes'].get(abs(number), abs(number)))
+    if base == 'fill':
+        return str(maps['universes'].get(number, number))
+    if base == 'trcl':
+        return str(maps['transforms'].get(number, number))
+    return value
+
+
+def _set_keyword(card, key, value):
+    """ Adds the keyword of one cell quantity (see _keys) at the end of a cell card """
+    lines, last = _last_line(card)
+    body, dollar, comment = lines[last].partition('$')
+    name = 'tmp' if key == 'tmp1' else key
+    lines[last] = f'{body.rstrip()} {name}={value}' + (f'  ${comment}' if dollar else '')
+    return '\n'.join(lines)
+
+
+def _drop_keywords(card, keys):
+    """ Removes the quantities 'keys' from the keywords of a cell card, keeping the other particles of a keyword """
+    new = {}
+    for name, value, span in _keywords(card):
+        found = _keys(name)
+        if not set(found) & keys:
+            continue
+        left = [key.split(':')[1] for key in found if key not in keys and ':' in key]
+        if left:
+            new[span] = f'{name.split(":")[0]}:{",".join(left)}={value}'
+        else:
+            # with the blanks ahead of it
+            start, end = span
+            new[(len(card[:start].rstrip(' ')), end)] = ''
+    return _replace(card, new)
+
+
+def place(host, cells, filled, into, transform, universe, transforms, name):
+    """
+    Fills host cell 'into' with 'universe' (moved by host 'transform', or
+    None). 'cells' gives the index of every host cell card, 'filled' the
+    host cells filled so far, 'transforms' the host tr numbers.
+    """
+    if into not in cells:
+        raise ValueError(f'{name}: the host has no cell {into}')
+    if into in filled:
+        raise ValueError(f'{name}: host cell {into} is already filled with {filled[into]}')
+    index = cells[into]
+    if mcnp_deck.cell_material(_joined(host.cells[index])) != 0:
+        raise ValueError(f'{name}: host cell {into} is not void')
+    if host.cell_values()[index].get('fill') is not None:
+        raise ValueError(f'{name}: host cell {into} is already filled')
+    if transform is not None and transform not in transforms:
+        raise ValueError(f'{name}: the host has no transform {transform}')
+    filled[into] = name
+
+    vectors = host.cell_vectors()
+    if 'fill' in vectors:
+        if transform is not None:
+            raise ValueError(f'{name}: the fill data card of the host takes no transform')
+        values = host.vector(vectors['fill'])
+        values[index] = str(universe)
+        host.data[vectors['fill']] = mcnp_deck.card_name(_joined(host.data[vectors['fill']])) + ' ' + _compress(values)
+    else:
+        host.cells[index] = _set_keyword(host.cells[index], 'fill',
+                                         str(universe) + (f' ({transform})' if transform is not None else ''))
+
+
+def merge(host_text, parts):
+    """
+    Merges sub-models into a host deck.
+
+    The host keeps its numbers. Each sub-model is renumbered clear of the
+    host and of the sub-models before it (see offset_map): cells, surfaces,
+    materials (m, mt, mx cards), universes and transforms (tr cards,
+    surface transforms, fill and trcl). Its cells, surfaces and material and
+    transform cards are added at the end of the blocks of the host; its
+    other data cards (mode, kcode, tallies, ...) and its outside cells
+    (importance 0 in the real world) are left out. Its real-world cells go
+    to a new universe, which fills the void host cell 'into' (moved by the
+    host transform, if given): the sub-model takes the place of that cell,
+    which must lie inside the real world of the sub-model.
+
+    Importances are moved between cell cards and data cards to follow the
+    host, as are the other cell quantities (vol, tmp, pwt, u, fill, ...):
+    the cell-ordered data cards of the host are extended over the new cells,
+    with the values of the sub-model or the default ('j', importance 1).
+
+    Parameters
+    ----------
+    host_text: str
+    parts: list of (name, text, into)
+        'into' is the host cell to fill and its transform (None for none),
+        as (cell, transform)
+
+    Returns
+    -------
+    text: str
+        merged deck
+    translation: dict
+        keys: sub-model name, values: {kind: {old: new}}, the cells and
+        data cards left out and the placement (host cell, universe and
+        transform)
+    """
+    host = Deck(host_text)
+    used = numbers(host_text)
+    vectors = host.cell_vectors()
+    on_cards = {key for values in host.cell_values() for key in values if key.startswith('imp:')} - set(vectors)
+    vector_values = defaultdict(list)
+    translation = {}
+    host_cells = {mcnp_deck.cell_number(_joined(card)): n for n, card in enumerate(host.cells)}
+    host_transforms = set(used['transforms'])
+    filled = {}
+
+    for name, text, (into, transform) in parts:
+        # the same sub-model can be merged several times
+        name = name if name not in translation else f'{name}#{len(translation) + 1}'
+        part = Deck(text)
+        sub = numbers(text)
+        maps = {kind: offset_map(sub[kind], used[kind], LIMITS[kind]) for kind in KINDS}
+        maps['universes'][0] = 0
+        maps['materials'][0] = 0
+        for kind in KINDS:
+            used[kind].update(maps[kind].values())
+        universe = max(used['universes'] | {0}) + 1
+        if universe > LIMITS['universes']:
+            raise ValueError(f'no free universe left for {name}')
+        used['universes'].add(universe)
+        place(host, host_cells, filled, into, transform, universe, host_transforms, name)
+
+        dropped = []
+        for card, values in zip(part.cells, part.cell_values()):
+            number = mcnp_deck.cell_number(_joined(card))
+            imp = [value for key, value in values.items() if key.startswith('imp:')]
+            outside = imp and all(v is not None and float(v) == 0 for v in imp)
+            if outside and mcnp_deck.cell_universe(_joined(card)) == 0:
+                dropped.append(number)
+                continue
+            values = {key: _renumber_value(key, value, maps) for key, value in values.items()}
+            if mcnp_deck.cell_universe(_joined(card)) == 0:
+                values['u'] = str(universe)
+            card = _drop_keywords(renumber_cell(card, maps), set(vectors))
+            present = {key for name, _, _ in _keywords(card) for key in _keys(name)}
+            # the quantities of the sub-model data cards the host gives on the cell cards
+            for key in sorted(set(values) | on_cards):
+                if key not in vectors and key not in present:
+                    value = values.get(key, '1' if key in on_cards else None)
+                    if value is not None:
+                        card = _set_keyword(card, key, value)
+            for key in vectors:
+                value = values.get(key, '1' if key.startswith('imp:') else None)
+                if value is not None and ' ' in value:
+                    raise ValueError(f'{name}: the {key} of cell {number} ({value}) does not fit a data card')
+                vector_values[key].append(value)
+            host.cells.append(card)
+        host.surfaces += [renumber_surface(card, maps) for card in part.surfaces]
+        left_out = []
+        for card in part.data:
+            renumbered = renumber_data(card, maps)
+            if renumbered is None:
+                if not _keys(mcnp_deck.card_name(_joined(card))):
+                    left_out.append(mcnp_deck.card_name(_joined(card)))
+            else:
+                host.data.append(renumbered)
+
+        translation[name] = {kind: {str(k): v for k, v in sorted(maps[kind].items()) if k}
+                             for kind in KINDS}
+        translation[name]['left out cells'] = dropped
+        translation[name]['left out cards'] = sorted(set(left_out))
+        translation[name]['placement'] = {'cell': into, 'universe': universe, 'transform': transform}
+
+    for index in sorted(set(vectors.values())):
+        key = min(k for k, n in vectors.items() if n == index)
+        if vector_values[key]:
+            lines, last = _last_line(host.data[index])
+            lines.insert(last + 1, '     ' + _compress(vector_values[key]))
+            host.data[index] = '\n'.join(lines)
+    return host.text(), translation
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('host', help='host deck (a rendered template, e.g. an ATR bench deck)')
+    parser.add_argument('parts', nargs='+', help='sub-model decks, merged in this order')
+    parser.add_argument('--into', nargs='+', required=True, metavar='CELL[:TR]',
+                        help='void host cell filled by each sub-model, with an optional host transform')
+    parser.add_argument('--output', default='merged.i', help='merged deck')
+    parser.add_argument('--map', default='translation.json',
+                        help='old to new numbers of every sub-model, for the post-processing')
+    args = parser.parse_args()
+    if len(args.into) != len(args.parts):
+        parser.error(f'--into needs one host cell per sub-model ({len(args.parts)})')
+
+    into = [(int(cell), int(tr) if tr else None) for cell, _, tr in (v.partition(':') for v in args.into)]
+    text, translation = merge(mcnp_deck.read_deck(args.host),
+                              [(os.path.basename(p), mcnp_deck.read_deck(p), i) for p, i in zip(args.parts, into)])
+    with open(args.output, 'w+') as f:
+        f.write(text)
+    with open(args.map, 'w+') as f:
+        json.dump(translation, f, indent=1)
+    for name, maps in translation.items():
+        moved = ', '.join(f'{len([k for k, v in maps[kind].items() if int(k) != v])} {kind}' for kind in KINDS)
+        print(f'{name}: renumbered {moved}; left out {len(maps["left out cells"])} cells and '
+              f'the cards {" ".join(maps["left out cards"]) or "-"}; universe {maps["placement"]["universe"]} '
+              f'fills cell {maps["placement"]["cell"]}')
@@ -0,0 +1,309 @@
+""" Collapses the universe levels of MCNP decks that do not change the geometry, and reports the nesting depth """
+import re
+import argparse
+from collections import defaultdict, Counter
+import mcnp_deck
+
+
+_keyword = re.compile(r'(\*?[a-z]+)(?::[a-z,/]+)?\s*=', re.IGNORECASE)
+_fill_card = re.compile(r'(\*?fill\s*=\s*)(\d+)(\s*\([^)]*\))?', re.IGNORECASE)
+_fill_keyword = re.compile(r'\*?\bfill\s*=', re.IGNORECASE)
+_single_lattice = re.compile(r'(\*?fill\s*=\s*)0:0\s+0:0\s+0:0\s+', re.IGNORECASE)
+_lat = re.compile(r'\blat\s*=\s*\d+\s*', re.IGNORECASE)
+_void = re.compile(r'^(\s*\d+\s+)0(?=\s)')
+_tally = re.compile(r'^\*?(f|sd|fs|cf)\d+$')
+
+# keywords a collapsed cell may carry: the others (vol, tmp, trcl, ...) would be lost
+_plain = {'u', 'imp', 'fill', '*fill'}
+
+
+def card_spans(lines):
+    """
+    Returns the line range [first, last) of each card of a block, in the
+    order of mcnp_deck.cards; comment lines inside a card belong to it.
+    """
+    spans = []
+    cont = False
+    for n, line in enumerate(lines):
+        if mcnp_deck._comment.match(line):
+            continue
+        body = line.split('$')[0].rstrip()
+        if not body.strip():
+            cont = False
+            continue
+        if spans and (cont or line.startswith('     ')):
+            spans[-1][1] = n + 1
+        else:
+            spans.append([n, n + 1])
+        cont = body.endswith('&')
+    return spans
+
+
+def read_cells(lines):
+    """
+    Reads the cell block.
+
+    Returns
+    -------
+    cells: list of dict
+        number, universe, material, density, fill (universes), lattice,
+        keywords, card (joined) and span (line range in 'lines')
+    """
+    cells = []
+    for card, span in zip(mcnp_deck.cards(lines), card_spans(lines)):
+        fields = card.split()
+        like = fields[1].lower() == 'like'
+        material = None if like else int(fields[1])
+        cells.append({
+            'number': mcnp_deck.cell_number(card),
+            'universe': mcnp_deck.cell_universe(card),
+            'material': material,
+            'density': fields[2] if material else None,
+            'fill': mcnp_deck.cell_fill(card),
+            'lattice': mcnp_deck.is_lattice(card),
+            'like': int(fields[2]) if like else None,
+            'keywords': {k.lower() for k in _keyword.findall(card)},
+            'card': card,
+            'span': span,
+        })
+    return cells
+
+
+def referenced_cells(cells, data_cards):
+    """ Returns the cells that must stay: named by a 'like n but' card or by a tally card """
+    keep = {c['like'] for c in cells if c['like'] is not None}
+    for card in data_cards:
+        if _tally.match(mcnp_deck.card_name(card)):
+            keep.update(int(v) for v in re.findall(r'(?<![\w.])\d+(?![\w.])', card.split(None, 1)[-1]))
+    return keep
+
+
+def nesting(cells):
+    """
+    Returns the level of each cell: 1 in the real world, n + 1 in a universe
+    filling a cell of level n (the deepest, for a universe used at several
+    levels). A lattice element filled with the universe of the lattice
+    itself is not a level.
+    """
+    parents = defaultdict(set)
+    for c in cells:
+        for u in set(c['fill']) - {c['universe']}:
+            parents[u].add(c['universe'])
+    level = {0: 1}
+
+    def universe_level(u):
+        if u not in level:
+            level[u] = 1 + max((universe_level(p) for p in parents[u]), default=0)
+        return level[u]
+
+    return {c['number']: universe_level(c['universe']) for c in cells}
+
+
+def depth_report(cells):
+    """
+    Returns the nesting of a deck: deepest level, material cells by level and
+    lattice elements that enter another universe.
+    """
+    levels = nesting(cells)
+    by_level = Counter(levels[c['number']] for c in cells if not c['fill'])
+    entries = sum(sum(u != c['universe'] for u in c['fill']) for c in cells if c['lattice'])
+    return {
+        'depth': max(levels.values(), default=0),
+        'material cells by level': dict(sorted(by_level.items())),
+        'universes': len({c['universe'] for c in cells} - {0}),
+        'lattice elements entering a universe': entries,
+    }
+
+
+def _collapsible(cell, keep, allowed=_plain):
+    """ True for a cell that can be folded into the cell it fills """
+    return (cell['material'] is not None and not cell['lattice'] and cell['number'] not in keep
+            and cell['keywords'] <= allowed)
+
+
+def _replace_entries(text, old, new):
+    """ Replaces universe 'old' by 'new' in the fill of a cell card, lines kept """
+    match = _fill_keyword.search(text)
+    head, tail = text[:match.end()], text[match.end():]
+    return head + re.sub(rf'(?<![\w.:=(-]){old}(?![\w.:)])', str(new), tail)
+
+
+def _set_material(text, material, density):
+    """ Gives a void cell card a material """
+    return _void.sub(rf'\g<1>{material} {density}', text, count=1)
+
+
+def single_element_lattices(cells, texts):
+    """ Turns lattices of one element (fill=0:0 0:0 0:0 u) into plain fills """
+    changed = 0
+    for c in cells:
+        if c['lattice'] and len(c['fill']) == 1 and _single_lattice.search(c['card']):
+            text = _single_lattice.sub(r'\1', _lat.sub('', texts[c['number']], count=1), count=1)
+            texts[c['number']] = text
+            changed += 1
+    return changed
+
+
+def pass_through_fills(cells, texts, keep):
+    """
+    Folds a universe of one cell into the cell it fills: the filled cell
+    takes the material, or the fill, of that cell. In a valid deck a
+    universe of one cell is seen everywhere in the cells it fills, so the
+    geometry is the same.
+    """
+    by_universe = defaultdict(list)
+    for c in cells:
+        by_universe[c['universe']].append(c)
+    changed = 0
+    for p in cells:
+        if p['lattice'] or p['material'] != 0 or len(p['fill']) != 1 or p['number'] not in texts:
+            continue
+        u = p['fill'][0]
+        if u == 0 or len(by_universe[u]) != 1:
+            continue
+        c = by_universe[u][0]
+        if not _collapsible(c, keep) or c['number'] not in texts:
+            continue
+        outer = _fill_card.search(texts[p['number']])
+        if c['fill']:
+            inner = _fill_card.search(c['card'])
+            if outer.group(3) and inner.group(3):
+                continue
+            fill = inner.group(0) if inner.group(3) else outer.group(1) + inner.group(2) + (outer.group(3) or '')
+            text = texts[p['number']].replace(outer.group(0), fill, 1)
+        else:
+            text = _set_material(texts[p['number']].replace(outer.group(0), '', 1), c['material'], c['density'])
+        texts[p['number']] = text
+        changed += 1
+    return changed
+
+
+def lattice_backgrounds(cells, texts, keep):
+    """
+    Fills the lattice elements holding a universe of one material cell with
+    the lattice cell itself: an element filled with the universe of its
+    lattice takes the material of the lattice card. Of the material
+    universes of a lattice, the most used one (by material and density) is
+    folded.
+    """
+    by_universe = defaultdict(list)
+    for c in cells:
+        by_universe[c['universe']].append(c)
+    changed = 0
+    for lat in cells:
+        if not lat['lattice'] or lat['material'] != 0:
+            continue
+        counts = Counter(lat['fill'])
+        groups = defaultdict(list)
+        for u in counts:
+            if u == lat['universe'] or len(by_universe[u]) != 1:
+                continue
+            c = by_universe[u][0]
+            if _collapsible(c, keep, _plain - {'fill', '*fill'}) and c['material'] > 0:
+                groups[(c['material'], c['density'])].append(u)
+        if not groups:
+            continue
+        (material, density), universes = max(groups.items(), key=lambda g: sum(counts[u] for u in g[1]))
+        text = texts[lat['number']]
+        for u in universes:
+            text = _replace_entries(text, u, lat['universe'])
+        texts[lat['number']] = _set_material(text, material, density)
+        changed += sum(counts[u] for u in universes)
+    return changed
+
+
+def _unused(cells, texts):
+    """ Removes the cells of the universes that no longer fill any cell, returns how many """
+    before, after = set(), set()
+    for c in cells:
+        before.update(c['fill'])
+        if c['number'] in texts:
+            after.update(*(mcnp_deck.cell_fill(card) for card in mcnp_deck.cards(texts[c['number']].split('\n'))))
+    removed = [c['number'] for c in cells if c['universe'] in before - after]
+    for number in removed:
+        del texts[number]
+    return len(removed)
+
+
+def _rebuild(lines, cells, texts):
+    """ Returns the lines of the cell block with the cards of 'texts' (dropped when missing) """
+    out, start = [], 0
+    for c in cells:
+        first, last = c['span']
+        out += lines[start:first]
+        if c['number'] in texts:
+            out += texts[c['number']].split('\n')
+        start = last
+    return out + lines[start:]
+
+
+def flatten(text, keep=()):
+    """
+    Collapses the universe levels of a deck that do not change its geometry:
+    lattices of one element, universes of one cell filling a cell, and
+    lattice elements holding a universe of one material cell. Cells named
+    in 'keep', by tallies or by 'like but' cards, and cells with other
+    keywords than u, imp and fill (vol, tmp, trcl, ...) are left.
+
+    Returns
+    -------
+    text: str
+        flattened deck
+    changes: dict
+        number of changes of each kind
+    """
+    title, cell_lines, surface_lines, data_lines = mcnp_deck.blocks(text)
+    passes = {
+        'single element lattices': lambda cells, texts, keep: single_element_lattices(cells, texts),
+        'pass-through fills': pass_through_fills,
+        'lattice elements': lattice_backgrounds,
+    }
+    changes = Counter()
+    changed = True
+    while changed:
+        changed = False
+        # one pass at a time, on the cards as the previous pass left them
+        for name, collapse in passes.items():
+            cells = read_cells(cell_lines)
+            keep = set(keep) | referenced_cells(cells, mcnp_deck.cards(data_lines))
+            texts = {c['number']: '\n'.join(cell_lines[slice(*c['span'])]) for c in cells}
+            n = collapse(cells, texts, keep)
+            if n:
+                changes[name] += n
+                changes['removed cells'] += _unused(cells, texts)
+                cell_lines = _rebuild(cell_lines, cells, texts)
+                changed = True
+    return '\n'.join([title] + cell_lines + [''] + surface_lines + [''] + data_lines), dict(changes)
+
+
+def report(before, after, changes):
+    """ Returns the nesting of the deck before and after as text """
+    old = depth_report(read_cells(mcnp_deck.blocks(before)[1]))
+    new = depth_report(read_cells(mcnp_deck.blocks(after)[1]))
+    lines = [f'{"":38} {"before":>10} {"after":>10}']
+    for key in ('depth', 'universes', 'lattice elements entering a universe'):
+        lines.append(f'{key:38} {old[key]:10d} {new[key]:10d}')
+    levels = sorted(set(old['material cells by level']) | set(new['material cells by level']))
+    for level in levels:
+        lines.append(f'{f"material cells at level {level}":38} '
+                     f'{old["material cells by level"].get(level, 0):10d} '
+                     f'{new["material cells by level"].get(level, 0):10d}')
+    lines += [f'{key}: {n}' for key, n in changes.items()]
+    return '\n'.join(lines)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('deck', help='MCNP deck')
+    parser.add_argument('--output', help='flattened deck (default: report only)')
+    parser.add_argument('--keep', type=int, nargs='*', default=[],
+                        help='cells to leave as they are (depleted cells, tallied cells, ...)')
+    args = parser.parse_args()
+
+    before = mcnp_deck.read_deck(args.deck)
+    after, changes = flatten(before, args.keep)
+    print(report(before, after, changes))
+    if args.output:
+        with open(args.output, 'w+') as f:
+            f.write(after)
@@ -0,0 +1,177 @@
+""" Material compositions and MCNP material cards, shared by the deck generators """
+import re
+import argparse
+import functools
+
+
+AVOGADRO = 0.6022140857  # 1e24 / mol, so densities come out in atoms/(barn cm)
+
+# natural isotopes: {element: (Z, {A: (atom abundance, mass [u])})}
+ELEMENTS = {
+    'H': (1, {1: (0.999885, 1.007825), 2: (0.000115, 2.014102)}),
+    'He': (2, {3: (1.34e-6, 3.016029), 4: (0.99999866, 4.002603)}),
+    'B': (5, {10: (0.199, 10.012937), 11: (0.801, 11.009305)}),
+    'C': (6, {12: (0.9893, 12.0), 13: (0.0107, 13.003355)}),
+    'N': (7, {14: (0.99636, 14.003074), 15: (0.00364, 15.000109)}),
+    'O': (8, {16: (0.99757, 15.994915), 17: (0.00038, 16.999132), 18: (0.00205, 17.99916)}),
+    'Na': (11, {23: (1., 22.98977)}),
+    'Mg': (12, {24: (0.7899, 23.985042), 25: (0.1, 24.985837), 26: (0.1101, 25.982593)}),
+    'Al': (13, {27: (1., 26.981538)}),
+    'Si': (14, {28: (0.92223, 27.976927), 29: (0.04685, 28.976495), 30: (0.03092, 29.97377)}),
+    'K': (19, {39: (0.932581, 38.963707), 40: (0.000117, 39.963999), 41: (0.067302, 40.961826)}),
+    'Ca': (20, {40: (0.96941, 39.962591), 42: (0.00647, 41.958618), 43: (0.00135, 42.958767),
+                44: (0.02086, 43.955481), 46: (0.00004, 45.953693), 48: (0.00187, 47.952534)}),
+    'Cr': (24, {50: (0.04345, 49.94605), 52: (0.83789, 51.940512), 53: (0.09501, 52.940654),
+                54: (0.02365, 53.938885)}),
+    'Mn': (25, {55: (1., 54.93805)}),
+    'Fe': (26, {54: (0.05845, 53.939615), 56: (0.91754, 55.934942), 57: (0.02119, 56.935399),
+                58: (0.00282, 57.933281)}),
+    'Ni': (28, {58: (0.680769, 57.935348), 60: (0.262231, 59.930791), 61: (0.011399, 60.93106),
+                62: (0.036345, 61.928349), 64: (0.009256, 63.92797)}),
+    'Zr': (40, {90: (0.5145, 89.904704), 91: (0.1122, 90.905645), 92: (0.1715, 91.90504),
+                94: (0.1738, 93.906316), 96: (0.028, 95.908276)}),
+    'Mo': (42, {92: (0.1484, 91.90681), 94: (0.0925, 93.905088), 95: (0.1592, 94.905841),
+                96: (0.1668, 95.904679), 97: (0.0955, 96.906021), 98: (0.2413, 97.905408),
+                100: (0.0963, 99.907477)}),
+    'Hf': (72, {174: (0.0016, 173.94004), 176: (0.0526, 175.941402), 177: (0.186, 176.94322),
+                178: (0.2728, 177.943698), 179: (0.1362, 178.945815), 180: (0.3508, 179.946549)}),
+    'U': (92, {234: (0.000054, 234.040946), 235: (0.007204, 235.043923), 238: (0.992742, 238.050783)}),
+}
+
+_symbols = {z: symbol for symbol, (z, _) in ELEMENTS.items()}
+_nuclide = re.compile(r'^([A-Z][a-z]?)-?(\d+)$')
+
+
+def nuclide_mass(za):
+    """ Returns the mass [u] of nuclide ZA (Z*1000 + A), A if it is not tabulated """
+    z, a = divmod(za, 1000)
+    isotopes = ELEMENTS.get(_symbols.get(z), (z, {}))[1]
+    return isotopes[a][1] if a in isotopes else float(a)
+
+
+def element_mass(symbol):
+    """ Returns the natural atomic mass [u] of an element """
+    return sum(abundance*mass for abundance, mass in ELEMENTS[symbol][1].values())
+
+
+def _za(key):
+    """ Returns the ZA of a nuclide given as ZA or as 'U235' / 'U-235' """
+    if isinstance(key, int):
+        return key
+    symbol, a = _nuclide.match(key).groups()
+    return ELEMENTS[symbol][0]*1000 + int(a)
+
+
+def weight_fractions(composition, enrichment=None):
+    """
+    Expands a composition into the weight fraction of each nuclide.
+
+    Parameters
+    ----------
+    composition: dict
+        keys: element symbol ('Fe', natural isotopes), nuclide ('U235' or
+        ZA 92235); values: weight fractions, normalized here
+    enrichment: float
+        weight fraction of U-235 in the uranium given as 'U' (the rest is
+        U-238), natural uranium if None
+
+    Returns
+    -------
+    fractions: dict
+        keys: ZA, values: weight fraction
+    """
+    total = sum(composition.values())
+    fractions = {}
+    for key, weight in composition.items():
+        weight /= total
+        if key in ELEMENTS:
+            z, isotopes = ELEMENTS[key]
+            if key == 'U' and enrichment is not None:
+                parts = {235: enrichment, 238: 1 - enrichment}
+            else:
+                mass = element_mass(key)
+                parts = {a: abundance*m/mass for a, (abundance, m) in isotopes.items()}
+            for a, part in parts.items():
+                fractions[z*1000 + a] = fractions.get(z*1000 + a, 0.) + weight*part
+        else:
+            za = _za(key)
+            fractions[za] = fractions.get(za, 0.) + weight
+    return fractions
+
+
+def atom_fractions(composition, enrichment=None):
+    """ Returns the atom fraction of each nuclide (ZA) of a composition given in weight fractions """
+    moles = {za: w/nuclide_mass(za) for za, w in weight_fractions(composition, enrichment).items()}
+    total = sum(moles.values())
+    return {za: n/total for za, n in moles.items()}
+
+
+def atom_densities(composition, density, enrichment=None):
+    """
+    Returns the atom density [atoms/(barn cm)] of each nuclide (ZA) of a
+    composition given in weight fractions, at 'density' [g/cm3].
+    """
+    return {za: density*AVOGADRO*w/nuclide_mass(za)
+            for za, w in weight_fractions(composition, enrichment).items()}
+
+
+@functools.lru_cache(maxsize=None)
+def _body(entries, library, sep):
+    """ Returns the nuclide lines of a card, built once per composition """
+    lines = []
+    for key, value in entries:
+        zaid = key if isinstance(key, str) else f'{key}.{library}'
+        value = value if isinstance(value, str) else f'{value:.6e}'
+        pad = '' if value.startswith('-') else ' '
+        lines.append(f'{zaid:>14}{sep}{pad}{value}')
+    return '\n'.join(lines)
+
+
+def card(number, composition, library='00c', thermal=None, comment=None, sep=' '):
+    """
+    Returns an MCNP material card.
+
+    Parameters
+    ----------
+    number: int or str
+    composition: dict
+        keys: ZA (written with 'library') or a full zaid ('5010.20c');
+        values: atom fractions or densities (positive) or weight fractions
+        (negative). Values given as text are written as they are, so
+        published compositions keep their digits.
+    thermal: str
+        S(a,b) table of an 'mt' card
+    comment: str
+        written after '$' on the card name
+    sep: str
+        blanks between a zaid and the sign of its value
+
+    The nuclide lines are cached by composition, so a composition repeated
+    under many material numbers is formatted once.
+    """
+    head = f'm{number}' + (f'  $ {comment}' if comment else '')
+    text = f'{head}\n' + _body(tuple(composition.items()), library, sep)
+    if thermal:
+        text += f'\nmt{number} {thermal}'
+    return text
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Writes the material card of a composition given in weight fractions')
+    parser.add_argument('number', help='material number')
+    parser.add_argument('composition', nargs='+',
+                        help="pairs of element or nuclide and weight fraction: Fe 0.655 Cr 0.17 ...")
+    parser.add_argument('--density', type=float, help='[g/cm3], atom densities instead of fractions')
+    parser.add_argument('--enrichment', type=float, help='U-235 weight fraction of the uranium')
+    parser.add_argument('--library', default='00c')
+    parser.add_argument('--thermal', help='S(a,b) table')
+    args = parser.parse_args()
+
+    pairs = args.composition
+    composition = {(int(k) if k.isdigit() else k): float(v) for k, v in zip(pairs[::2], pairs[1::2])}
+    if args.density:
+        values = atom_densities(composition, args.density, args.enrichment)
+    else:
+        values = atom_fractions(composition, args.enrichment)
+    print(card(args.number, values, args.library, args.thermal))
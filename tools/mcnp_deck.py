@@ -0,0 +1,151 @@
+""" Minimal reader for MCNP input decks, shared by the post-processing tools """
+import re
+
+
+_comment = re.compile(r'^ {0,4}c( |$)', re.IGNORECASE)
+_universe = re.compile(r'\bu\s*=\s*(-?\d+)', re.IGNORECASE)
+_lattice = re.compile(r'\blat\s*=\s*(\d+)', re.IGNORECASE)
+_fill = re.compile(r'\*?\bfill\s*=\s*(-?\d+)\b(?!\s*:)', re.IGNORECASE)
+_fill_array = re.compile(r'\*?\bfill\s*=\s*-?\d+\s*:', re.IGNORECASE)
+
+
+def read_deck(filename):
+    """ Returns the text of an MCNP input file """
+    with open(filename) as f:
+        return f.read()
+
+
+def blocks(text):
+    """
+    Splits a deck into its title, cell, surface and data blocks.
+
+    Returns
+    -------
+    title: str
+    cells, surfaces, data: list of str
+        lines of each block
+    """
+    lines = text.split('\n')
+    title, rest = lines[0], lines[1:]
+    parts = [[]]
+    for line in rest:
+        if line.strip() == '' and len(parts) < 3:
+            parts.append([])
+        else:
+            parts[-1].append(line)
+    while len(parts) < 3:
+        parts.append([])
+    return title, parts[0], parts[1], parts[2]
+
+
+def cards(lines):
+    """
+    Joins the lines of a block into cards.
+
+    Comment lines and '$' comments are dropped. A line starting with 5 or
+    more blanks, or following a line ending in '&', continues the previous
+    card.
+
+    Returns
+    -------
+    cards: list of str
+    """
+    out = []
+    cont = False
+    for line in lines:
+        if _comment.match(line):
+            continue
+        body = line.split('$')[0].rstrip()
+        if not body.strip():
+            cont = False
+            continue
+        amp = body.endswith('&')
+        if amp:
+            body = body[:-1]
+        if out and (cont or line.startswith('     ')):
+            out[-1] += ' ' + body.strip()
+        else:
+            out.append(body.strip())
+        cont = amp
+    return out
+
+
+def card_name(card):
+    """ Returns the first field of a card, lower case ('m101', '990', 'kcode') """
+    return card.split(None, 1)[0].lower()
+
+
+def cell_number(card):
+    """ Returns the number of a cell card """
+    return int(card.split(None, 1)[0])
+
+
+def cell_material(card):
+    """ Returns the material number of a cell card (0 for void, None for 'like but') """
+    fields = card.split()
+    if fields[1].lower() == 'like':
+        return None
+    return int(fields[1])
+
+
+def cell_universe(card):
+    """ Returns the universe of a cell card, 0 if it is in the real world """
+    match = _universe.search(card)
+    return abs(int(match.group(1))) if match else 0
+
+
+def cell_fill(card):
+    """
+    Returns the universes filling a cell card: one for a simple fill, all the
+    entries of a lattice fill array.
+    """
+    match = _fill.search(card)
+    if match:
+        return [int(match.group(1))]
+    match = _fill_array.search(card)
+    if not match:
+        return []
+    fields = card[match.start():].split()
+    # fill=i1:i2 j1:j2 k1:k2, then the array up to the next keyword
+    fields[0] = fields[0].split('=', 1)[1]
+    values = []
+    previous = None
+    for field in fields[3:]:
+        if '=' in field or field.lower().startswith(('imp', 'vol', 'tmp', 'trcl')):
+            break
+        if field.lower().endswith('r') and previous is not None:
+            values += [previous] * int(field[:-1])
+            continue
+        if field.startswith('('):
+            break
+        previous = int(field)
+        values.append(previous)
+    return values
+
+
+def is_lattice(card):
+    """ Returns True for a lattice cell card """
+    return _lattice.search(card) is not None
+
+
+def material_numbers(data_cards):
+    """ Returns the material numbers defined in the data block """
+    return [int(card_name(c)[1:]) for c in data_cards if re.fullmatch(r'm\d+', card_name(c))]
+
+
+def summary(text):
+    """
+    Returns a dict with the size of a deck: number of lines, cells,
+    surfaces, materials, universes and lattices.
+    """
+    _, cell_lines, surface_lines, data_lines = blocks(text)
+    cell_cards = cards(cell_lines)
+    universes = {cell_universe(c) for c in cell_cards} - {0}
+    return {
+        'lines': len(text.split('\n')),
+        'cells': len(cell_cards),
+        'surfaces': len(cards(surface_lines)),
+        'materials': len(material_numbers(cards(data_lines))),
+        'universes': len(universes),
+        'lattices': sum(is_lattice(c) for c in cell_cards),
+    }
@@ -0,0 +1,34 @@
+""" Stands in for MCNP when testing the runner: reads the deck, waits and writes an output with the run time """
+import os
+import sys
+import time
+import argparse
+import mcnp_deck
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('keywords', nargs='*', help='MCNP style i=<deck> and n=<prefix>')
+    parser.add_argument('--seconds', type=float, default=1., help='run time')
+    parser.add_argument('--fail', nargs='*', default=[], help='deck file names to fail')
+    args = parser.parse_args()
+
+    keywords = dict(k.split('=', 1) for k in args.keywords if '=' in k)
+    deck = keywords.get('i', 'inp')
+    start = time.perf_counter()
+    try:
+        summary = ', '.join(f'{key} {n}' for key, n in mcnp_deck.summary(mcnp_deck.read_deck(deck)).items())
+    except (OSError, ValueError, IndexError) as error:
+        sys.exit(f'bad trouble in subroutine reading {deck}: {error}')
+    print(f'stub run of {deck}: {summary}')
+    if os.path.basename(deck) in {os.path.basename(name) for name in args.fail}:
+        sys.exit(f'fatal error in {deck}')
+    time.sleep(args.seconds)
+
+    output = keywords['n'] + 'o' if 'n' in keywords else 'outp'
+    line = f'     computer time = {(time.perf_counter() - start) / 60:10.2f} minutes'
+    # also on stdout, so the run log carries it (see verification/benchmark.py)
+    print(line)
+    with open(output, 'w+') as f:
+        f.write(f'stub run of {deck}\n{summary}\n{line}\n')
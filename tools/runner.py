@@ -0,0 +1,221 @@
+""" Runs the transport decks of a manifest, a given number at a time, resuming interrupted campaigns from a state file """
+import os
+import json
+import time
+import shlex
+import argparse
+import subprocess
+import concurrent.futures
+
+
+COMMAND = 'mcnp6 i={deck} n={name}.'
+STATE_FILE = 'runner_state.json'
+LOG_FILE = 'run.log'
+
+# transport processes in progress, stopped on an interruption
+_running = set()
+
+
+def read_manifest(filename):
+    """
+    Reads the decks to run: a json list of deck paths or of dicts with
+    'deck' (and optional 'name'), or a text file with one deck per line
+    (# starts a comment). Relative paths are taken from the manifest
+    directory.
+
+    Returns
+    -------
+    jobs: dict
+        keys: job name (the deck file name unless given, made unique), values:
+        absolute deck path
+    """
+    with open(filename) as f:
+        text = f.read()
+    try:
+        entries = json.loads(text)
+    except json.JSONDecodeError:
+        entries = [line.split('#')[0].strip() for line in text.splitlines()]
+        entries = [line for line in entries if line]
+    base = os.path.dirname(os.path.abspath(filename))
+    jobs = {}
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {'deck': entry}
+        deck = os.path.join(base, entry['deck'])
+        name = entry.get('name') or os.path.basename(deck)
+        unique, n = name, 1
+        while unique in jobs:
+            n += 1
+            unique = f'{name}#{n}'
+        jobs[unique] = os.path.normpath(deck)
+    return jobs
+
+
+def deck_signature(deck):
+    """ Returns the size and modification time [ns] of a deck, to tell when a finished run is out of date """
+    stat = os.stat(deck)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def load_state(filename):
+    """ Reads the state written by 'save_state', an empty state if there is none """
+    if not os.path.exists(filename):
+        return {}
+    with open(filename) as f:
+        return json.load(f)
+
+
+def save_state(state, filename):
+    """ Writes the state as json, through a temporary file so an interruption leaves the previous state """
+    with open(filename + '.tmp', 'w+') as f:
+        json.dump(state, f, indent=1)
+    os.replace(filename + '.tmp', filename)
+
+
+def pending(jobs, state):
+    """ Returns the jobs without a successful run of the current deck in 'state' """
+    todo = {}
+    for name, deck in jobs.items():
+        run = state.get(name, {})
+        if (run.get('status') != 'done' or run.get('deck') != deck
+                or not os.path.exists(deck) or run.get('signature') != deck_signature(deck)):
+            todo[name] = deck
+    return todo
+
+
+def run_deck(name, deck, directory, command=COMMAND, timeout=None):
+    """
+    Runs one deck in 'directory' (created if needed) with 'command', a
+    template of {deck} (absolute path) and {name}; stdout and stderr go to
+    run.log in 'directory'. Arguments naming a file of the current directory
+    (a script, an xsdir) are made absolute, as the run starts in 'directory'.
+
+    Returns
+    -------
+    run: dict
+        deck, status ('done', 'failed' or 'timeout'), return code, start
+        (epoch seconds) and wall time [s]
+    """
+    os.makedirs(directory, exist_ok=True)
+    args = [os.path.abspath(a) if os.path.isfile(a) else a for a in shlex.split(command.format(deck=deck, name=name))]
+    start = time.time()
+    clock = time.perf_counter()
+    with open(os.path.join(directory, LOG_FILE), 'w+') as log:
+        try:
+            process = subprocess.Popen(args, cwd=directory, stdout=log, stderr=subprocess.STDOUT)
+        except OSError as error:
+            log.write(f'{error}\n')
+            return {'deck': deck, 'status': 'failed', 'returncode': None, 'start': start, 'wall': 0.}
+        _running.add(process)
+        try:
+            returncode = process.wait(timeout)
+            status = 'done' if returncode == 0 else 'failed'
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+            returncode, status = None, 'timeout'
+        finally:
+            _running.discard(process)
+    return {'deck': deck, 'status': status, 'returncode': returncode, 'start': start,
+            'wall': time.perf_counter() - clock}
+
+
+def run(jobs, runs='runs', command=COMMAND, workers=1, timeout=None, state_file=None, rerun=False):
+    """
+    Runs the jobs not finished in the state file, at most 'workers' at a
+    time, each in runs/<name>. The state is written after every run, so a
+    campaign stopped at any point is resumed by running it again: finished
+    decks that did not change since are skipped, the others run again.
+
+    Every run is a process of its own; the pool only waits on them, so it
+    is a pool of threads, and an interruption stops the runs in progress.
+
+    Parameters
+    ----------
+    jobs: dict
+        keys: job name, values: deck path (see 'read_manifest')
+    runs: str
+        directory of the run directories
+    command: str
+        executable and arguments, {deck} and {name} are replaced
+    workers: int
+        runs at a time
+    timeout: float
+        seconds after which a run is stopped, None for no limit
+    state_file: str
+        default: runs/runner_state.json
+    rerun: bool
+        run every job again
+
+    Returns
+    -------
+    state: dict
+        keys: job name, values: the last run (see 'run_deck'), with the
+        deck signature of the successful ones
+    """
+    os.makedirs(runs, exist_ok=True)
+    state_file = state_file or os.path.join(runs, STATE_FILE)
+    state = load_state(state_file)
+    todo = dict(jobs) if rerun else pending(jobs, state)
+    with concurrent.futures.ThreadPoolExecutor(max(workers, 1)) as pool:
+        futures = {}
+        for name, deck in todo.items():
+            if not os.path.exists(deck):
+                state[name] = {'deck': deck, 'status': 'missing'}
+                continue
+            signature = deck_signature(deck)
+            future = pool.submit(run_deck, name, deck, os.path.join(runs, name), command, timeout)
+            futures[future] = (name, signature)
+        save_state(state, state_file)
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                name, signature = futures[future]
+                state[name] = future.result()
+                if state[name]['status'] == 'done':
+                    state[name]['signature'] = signature
+                save_state(state, state_file)
+        except KeyboardInterrupt:
+            # the runs in progress are not recorded: they run again on resume
+            pool.shutdown(wait=False, cancel_futures=True)
+            for process in list(_running):
+                process.terminate()
+            raise
+    return state
+
+
+def report(jobs, state, skipped=()):
+    """ Returns the status and wall time of each job, and the totals, as text """
+    lines = [f'{"job":30} {"status":>8} {"wall [s]":>10}']
+    total = 0.
+    for name in jobs:
+        run = state.get(name, {})
+        wall = run.get('wall')
+        total += wall or 0.
+        status = 'skipped' if name in skipped else run.get('status', '-')
+        lines.append(f'{name:30} {status:>8} {"" if wall is None else f"{wall:10.1f}":>10}')
+    done = sum(state.get(name, {}).get('status') == 'done' for name in jobs)
+    lines.append(f'{done} of {len(jobs)} done, {total:.1f} s of run time')
+    return '\n'.join(lines)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('manifest', help='json list or text file of decks')
+    parser.add_argument('--command', default=COMMAND,
+                        help=f'executable and arguments, {{deck}} and {{name}} are replaced (default: "{COMMAND}"); '
+                             'e.g. "python tools/mcnp_stub.py i={deck} n={name}. --seconds 2" for a dry run')
+    parser.add_argument('--workers', type=int, default=1, help='decks run at a time')
+    parser.add_argument('--runs', default='runs', help='directory of the run directories and the state file')
+    parser.add_argument('--state', help=f'state file (default: <runs>/{STATE_FILE})')
+    parser.add_argument('--timeout', type=float, help='seconds after which a run is stopped')
+    parser.add_argument('--rerun', action='store_true', help='run the finished decks again')
+    args = parser.parse_args()
+
+    jobs = read_manifest(args.manifest)
+    state_file = args.state or os.path.join(args.runs, STATE_FILE)
+    skipped = set() if args.rerun else set(jobs) - set(pending(jobs, load_state(state_file)))
+    start = time.perf_counter()
+    state = run(jobs, args.runs, args.command, args.workers, args.timeout, state_file, args.rerun)
+    print(report(jobs, state, skipped))
+    print(f'elapsed: {time.perf_counter() - start:.1f} s with {args.workers} workers')
@@ -0,0 +1,215 @@
+""" Lists the nuclides and thermal tables of MCNP decks and estimates the cross-section data they load """
+import re
+import json
+import argparse
+from collections import defaultdict
+import mcnp_deck
+
+
+BYTES_PER_WORD = 8
+
+_material = re.compile(r'^m(\d+)$')
+_thermal = re.compile(r'^mt(\d+)$')
+_zaid = re.compile(r'^(\d+)(?:\.(\d+[a-z]))?$', re.IGNORECASE)
+# MCNP accepts 1.2-3 for 1.2e-3
+_short_exponent = re.compile(r'^([+-]?(?:\d+\.?\d*|\.\d+))([+-]\d+)$')
+
+
+def number(text):
+    """ Returns the value of an MCNP number, including the 1.2-3 form """
+    match = _short_exponent.match(text)
+    if match:
+        return float(f'{match.group(1)}e{match.group(2)}')
+    return float(text)
+
+
+def read_materials(text):
+    """
+    Reads the material and thermal cards of a deck.
+
+    Returns
+    -------
+    materials: dict
+        keys: material number, values: list of (zaid, value); a zaid without
+        library takes the 'nlib' of the card, or stays as ZA
+    thermal: dict
+        keys: material number, values: list of S(a,b) tables
+    """
+    _, _, _, data = mcnp_deck.blocks(text)
+    materials, thermal = {}, {}
+    for card in mcnp_deck.cards(data):
+        fields = card.split()
+        name = fields[0].lower()
+        if _material.match(name):
+            keywords = dict(f.lower().split('=', 1) for f in fields[1:] if '=' in f)
+            values = [f for f in fields[1:] if '=' not in f]
+            nuclides = []
+            for zaid, value in zip(values[::2], values[1::2]):
+                match = _zaid.match(zaid)
+                if not match:
+                    continue
+                za, library = match.group(1), match.group(2) or keywords.get('nlib')
+                nuclides.append((f'{za}.{library.lower()}' if library else za, number(value)))
+            materials[int(name[1:])] = nuclides
+        elif _thermal.match(name):
+            thermal[int(name[2:])] = [f.lower() for f in fields[1:]]
+    return materials, thermal
+
+
+def read_xsdir(filename):
+    """
+    Reads the directory section of an xsdir file.
+
+    Returns
+    -------
+    tables: dict
+        keys: zaid (lower case), values: table length [words]
+    """
+    tables = {}
+    in_directory = False
+    entry = ''
+    with open(filename, errors='replace') as f:
+        for line in f:
+            if not in_directory:
+                in_directory = line.strip().lower() == 'directory'
+                continue
+            # an entry ending in '+' continues on the next line
+            entry += ' ' + line.strip()
+            if entry.endswith('+'):
+                entry = entry[:-1]
+                continue
+            fields, entry = entry.split(), ''
+            # zaid awr file access type address length ...
+            if len(fields) >= 7:
+                try:
+                    tables[fields[0].lower()] = int(fields[6])
+                except ValueError:
+                    continue
+    return tables
+
+
+def depleted_materials(filenames):
+    """
+    Returns the materials of the depleted (kernel) cells listed in cell
+    index files (cell_index.json written with the agr-1 or micro decks).
+    """
+    materials = set()
+    for filename in filenames:
+        with open(filename) as f:
+            records = json.load(f)['records']
+        materials.update(r['material'] for r in records if 'kernel' in (r.get('layer'), r.get('region')))
+    return materials
+
+
+def inventory(filenames, depleted=()):
+    """
+    Collects the nuclides and thermal tables of the decks.
+
+    Parameters
+    ----------
+    depleted: set of int
+        materials known to be depleted in every deck (see 'depleted_materials')
+
+    Returns
+    -------
+    nuclides: dict
+        keys: zaid, values: list of (deck, material, relative fraction)
+    thermal: dict
+        keys: table, values: list of (deck, material)
+    burned: set
+        (deck, material) of the 'depleted' materials and of the materials
+        holding transuranics (burned fuel)
+    """
+    nuclides, thermal, burned = defaultdict(list), defaultdict(list), set()
+    for filename in filenames:
+        materials, tables = read_materials(mcnp_deck.read_deck(filename))
+        for m, entries in materials.items():
+            total = sum(abs(v) for _, v in entries) or 1.
+            for zaid, value in entries:
+                nuclides[zaid].append((filename, m, abs(value) / total))
+            if m in depleted or any(int(zaid.split('.')[0]) // 1000 > 92 for zaid, _ in entries):
+                burned.add((filename, m))
+        for m, names in tables.items():
+            for name in names:
+                thermal[name].append((filename, m))
+    return dict(nuclides), dict(thermal), burned
+
+
+def findings(nuclides, thermal, tables=None, threshold=1e-5, burned=()):
+    """
+    Returns the nuclides that could be merged or dropped, as lines of text:
+    the same nuclide read from several libraries in one deck (each library
+    is a table loaded by every rank), nuclides below 'threshold' of every material they
+    appear in, and zaids missing from the xsdir 'tables'.
+
+    The 'burned' (deck, material) pairs (see 'inventory') are left out of
+    the drop candidates: their trace fission products (Xe-135, Sm-149, ...)
+    are few atoms but strong absorbers.
+    """
+    lines = []
+    # each deck loads its own tables: a merge only helps within one deck
+    by_za = defaultdict(lambda: defaultdict(list))
+    for zaid, uses in nuclides.items():
+        for deck in dict.fromkeys(deck for deck, _, _ in uses):
+            by_za[deck][zaid.split('.')[0]].append(zaid)
+    for deck, zas in by_za.items():
+        for za, zaids in sorted(zas.items(), key=lambda item: int(item[0])):
+            if len(zaids) > 1:
+                # the library used by most materials of the deck is the one to keep
+                zaids = sorted(zaids, key=lambda z: -sum(d == deck for d, _, _ in nuclides[z]))
+                lines.append(f'merge: {za} is read from {len(zaids)} libraries in {deck} ({", ".join(zaids)}), '
+                             f'{zaids[0]} is used most')
+    for zaid, uses in sorted(nuclides.items()):
+        if any((deck, m) in burned for deck, m, _ in uses):
+            continue
+        largest = max(fraction for _, _, fraction in uses)
+        if largest < threshold:
+            materials = sorted({m for _, m, _ in uses})
+            lines.append(f'drop: {zaid} is at most {largest:.2e} of its {len(materials)} materials '
+                         f'(m{materials[0]}' + (f' to m{materials[-1]})' if len(materials) > 1 else ')'))
+    if tables is not None:
+        for name in sorted(set(nuclides) | set(thermal)):
+            if '.' in name and name not in tables:
+                lines.append(f'missing: {name} is not in the xsdir')
+    return lines
+
+
+def report(filenames, xsdir=None, threshold=1e-5, largest=10, cell_index=()):
+    """ Returns the inventory report of the decks as text, the depleted materials taken from the 'cell_index' files """
+    nuclides, thermal, burned = inventory(filenames, depleted_materials(cell_index))
+    tables = read_xsdir(xsdir) if xsdir else None
+
+    lines = [f'decks: {len(filenames)}',
+             f'nuclides: {len(nuclides)} zaids, {len({z.split(".")[0] for z in nuclides})} ZA',
+             f'thermal tables: {len(thermal)} ({", ".join(sorted(thermal))})']
+    libraries = defaultdict(int)
+    for zaid in nuclides:
+        libraries[zaid.split('.')[1] if '.' in zaid else '(default)'] += 1
+    lines.append('libraries: ' + ', '.join(f'{lib} {n}' for lib, n in sorted(libraries.items())))
+
+    if tables is not None:
+        sizes = {name: tables[name] * BYTES_PER_WORD for name in list(nuclides) + list(thermal)
+                 if name in tables}
+        lines.append(f'cross-section data: {sum(sizes.values()) / 2**20:.1f} MB per rank '
+                     f'({len(sizes)} tables found in {xsdir})')
+        for name, size in sorted(sizes.items(), key=lambda item: -item[1])[:largest]:
+            lines.append(f'  {name:>12} {size / 2**20:8.2f} MB  {len(nuclides.get(name, thermal.get(name, [])))} uses')
+    if burned:
+        lines.append(f'depleted materials: {len(burned)}, their nuclides are not drop candidates')
+    lines += findings(nuclides, thermal, tables, threshold, burned)
+    return '\n'.join(lines)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('decks', nargs='+', help='MCNP decks (or templates)')
+    parser.add_argument('--xsdir', help='xsdir file giving the table lengths')
+    parser.add_argument('--threshold', type=float, default=1e-5,
+                        help='fraction below which a nuclide is a candidate to drop')
+    parser.add_argument('--largest', type=int, default=10, help='number of largest tables listed')
+    parser.add_argument('--cell-index', nargs='+', default=[], metavar='FILE',
+                        help='cell_index.json of the decks: nuclides of the depleted (kernel) materials are kept')
+    args = parser.parse_args()
+
+    print(report(args.decks, args.xsdir, args.threshold, args.largest, args.cell_index))
@@ -0,0 +1,183 @@
+""" Compares the cost and accuracy of depletion model variants against the reference """
+import os
+import re
+import argparse
+import numpy as np
+import decay_heat
+import mcnp_deck
+
+
+HEAT_FILE = 'results_heat_cell991.csv'
+COMPOSITION_FILE = 'composition.csv'
+LOG_FILES = ('run.log', 'outp', 'mcnp1.o')
+
+_log_patterns = {
+    # MCNP output
+    'runtime': re.compile(r'computer time\s*=\s*([\d.Ee+-]+)\s*minutes'),
+    # GNU time -v
+    'wall': re.compile(r'Elapsed \(wall clock\) time \([^)]*\):\s*([\d:.]+)'),
+    'memory': re.compile(r'Maximum resident set size \(kbytes\):\s*(\d+)'),
+}
+
+
+def find_variants(path='.'):
+    """ Returns the sub-directories of 'path' that contain an mcnp1 deck, sorted """
+    return sorted(
+        d for d in os.listdir(path)
+        if os.path.isfile(os.path.join(path, d, 'mcnp1')))
+
+
+def _seconds(clock):
+    """ Converts [h:]mm:ss[.ss] to seconds """
+    seconds = 0.
+    for field in clock.split(':'):
+        seconds = seconds*60 + float(field)
+    return seconds
+
+
+def read_log(directory):
+    """
+    Reads the runtime [s] and peak memory [MB] of a run from the first log
+    found in 'directory' (see LOG_FILES). Missing values are NaN.
+
+    The MCNP 'computer time = ... minutes' line and the GNU 'time -v' report
+    are understood, so a stub log with those lines can stand in for a run.
+    """
+    runtime, memory = np.nan, np.nan
+    for name in LOG_FILES:
+        filename = os.path.join(directory, name)
+        if not os.path.isfile(filename):
+            continue
+        with open(filename, errors='replace') as f:
+            text = f.read()
+        match = _log_patterns['wall'].search(text)
+        if match:
+            runtime = _seconds(match.group(1))
+        match = _log_patterns['runtime'].findall(text)
+        if match and np.isnan(runtime):
+            runtime = float(match[-1]) * 60
+        match = _log_patterns['memory'].search(text)
+        if match:
+            memory = int(match.group(1)) / 1024
+        break
+    return runtime, memory
+
+
+def read_heat(directory):
+    """
+    Returns the decay heat H_T and its uncertainty by decay step.
+    """
+    _, values, sigma = decay_heat.read_case(os.path.join(directory, HEAT_FILE))
+    h_t = decay_heat.QUANTITIES.index('H_T')
+    return values[:, h_t], sigma[:, h_t]
+
+
+def read_composition(directory):
+    """
+    Reads the optional 'composition.csv' of a variant: a 'time' column, one
+    column per isotope [g] and optional '<isotope> uncertainty' columns.
+
+    Returns
+    -------
+    composition: dict or None
+        keys: isotope, values: (mass, uncertainty) arrays
+    """
+    import pandas as pd
+
+    filename = os.path.join(directory, COMPOSITION_FILE)
+    if not os.path.isfile(filename):
+        return None
+    df = pd.read_csv(filename)
+    composition = {}
+    for column in df.columns:
+        if column == 'time' or column.endswith(' uncertainty'):
+            continue
+        unc = df.get(f'{column} uncertainty')
+        mass = df[column].to_numpy()
+        composition[column] = (mass, np.zeros_like(mass) if unc is None else unc.to_numpy())
+    return composition
+
+
+def evaluate(path='.', variants=None, reference='reference'):
+    """
+    Collects the size, cost and accuracy of each variant.
+
+    Parameters
+    ----------
+    path: str
+        directory holding the variant directories
+    variants: list of str
+        variant directories, defaults to every directory with an mcnp1 deck
+    reference: str
+        reference variant
+
+    Returns
+    -------
+    rows: list of dict
+        one per variant, the reference first
+    """
+    if variants is None:
+        variants = find_variants(path)
+    variants = [reference] + [v for v in variants if v != reference]
+
+    ref_dir = os.path.join(path, reference)
+    ref_heat, ref_heat_unc = read_heat(ref_dir)
+    ref_runtime, _ = read_log(ref_dir)
+    ref_comp = read_composition(ref_dir)
+
+    rows = []
+    for variant in variants:
+        directory = os.path.join(path, variant)
+        row = {'variant': variant}
+        row.update(mcnp_deck.summary(mcnp_deck.read_deck(os.path.join(directory, 'mcnp1'))))
+
+        runtime, memory = read_log(directory)
+        row['runtime [s]'] = runtime
+        row['memory [MB]'] = memory
+        row['speedup'] = ref_runtime / runtime
+
+        heat, heat_unc = read_heat(directory)
+        diff, unc = (d[1] for d in decay_heat.compare([ref_heat, heat], [ref_heat_unc, heat_unc]))
+        worst = np.argmax(np.abs(diff))
+        row['H_T diff [%]'] = diff[worst] * 100
+        row['H_T diff unc [%]'] = unc[worst] * 100
+
+        comp = read_composition(directory)
+        row['composition diff [%]'] = row['composition diff unc [%]'] = np.nan
+        if comp is not None and ref_comp is not None:
+            isotopes = [isotope for isotope in comp if isotope in ref_comp]
+            if isotopes:
+                # cases: reference and variant, quantities: the isotopes
+                mass = [np.stack([masses[i][0] for i in isotopes], axis=-1) for masses in (ref_comp, comp)]
+                mass_unc = [np.stack([masses[i][1] for i in isotopes], axis=-1) for masses in (ref_comp, comp)]
+                diff, unc = (d[1] for d in decay_heat.compare(mass, mass_unc))
+                worst = np.unravel_index(np.nanargmax(np.abs(diff)), diff.shape)
+                row['composition diff [%]'] = diff[worst] * 100
+                row['composition diff unc [%]'] = unc[worst] * 100
+        rows.append(row)
+    return rows
+
+
+def report(rows, filename=None):
+    """ Prints the speedup-versus-error table, and writes it as csv if 'filename' is given """
+    columns = list(rows[0])
+    lines = [','.join(columns)]
+    for row in rows:
+        lines.append(','.join(
+            f'{row[c]:.4g}' if isinstance(row[c], float) else str(row[c]) for c in columns))
+    text = '\n'.join(lines)
+    print(text)
+    if filename:
+        with open(filename, 'w+') as f:
+            f.write(text + '\n')
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('variants', nargs='*', help='variant directories (default: all)')
+    parser.add_argument('--reference', default='reference')
+    parser.add_argument('--output', default='benchmark.csv')
+    args = parser.parse_args()
+
+    report(evaluate('.', args.variants or None, args.reference), args.output)
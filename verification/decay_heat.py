@@ -0,0 +1,150 @@
+""" Loads and compares decay heat results (results_heat_cell*.csv) of many cases """
+import re
+import argparse
+import numpy as np
+
+
+QUANTITIES = ['H_TL', 'H_gamma,L', 'H_ch', 'H_gamma,Tr total', 'H_T']
+UNCERTAINTY = 'H_gamma,Tr total uncertainty'
+# transported gamma heating of each batch, the files give no uncertainty by batch
+BATCH = re.compile(r'^H_gamma,Tr batch (\d+)$')
+
+# only the transported gamma heating is statistical, H_T inherits its uncertainty
+_has_uncertainty = np.array([q in ('H_gamma,Tr total', 'H_T') for q in QUANTITIES])
+
+
+def read_case(filename):
+    """
+    Reads one result file.
+
+    Returns
+    -------
+    decay_time: np.ndarray
+        shape (n_steps,)
+    values: np.ndarray
+        shape (n_steps, n_quantities), see QUANTITIES
+    sigma: np.ndarray
+        1-sigma uncertainty, same shape as values
+    """
+    import pandas as pd
+
+    df = pd.read_csv(filename)
+    values = df[QUANTITIES].to_numpy(dtype=float)
+    sigma = df[UNCERTAINTY].to_numpy(dtype=float)[:, None] * _has_uncertainty[None, :]
+    return df['decay_time'].to_numpy(dtype=float), values, sigma
+
+
+def read_batches(filename):
+    """
+    Reads the transported gamma heating of each batch of one result file.
+
+    Returns
+    -------
+    batches: np.ndarray
+        batch ids, sorted
+    values: np.ndarray
+        shape (n_steps, n_batches)
+    """
+    import pandas as pd
+
+    df = pd.read_csv(filename)
+    columns = {int(match.group(1)): name for name in df.columns for match in [BATCH.match(name)] if match}
+    batches = np.array(sorted(columns), dtype=int)
+    return batches, df[[columns[b] for b in batches]].to_numpy(dtype=float).reshape(len(df), len(batches))
+
+
+def load_cases(filenames):
+    """
+    Stacks any number of result files into (case x step x quantity) arrays.
+    Cases with fewer decay steps are padded with NaN.
+
+    Returns
+    -------
+    decay_time: np.ndarray
+        shape (n_cases, n_steps)
+    values, sigma: np.ndarray
+        shape (n_cases, n_steps, n_quantities)
+    """
+    cases = [read_case(f) for f in filenames]
+    n_steps = max(len(t) for t, _, _ in cases)
+    shape = (len(cases), n_steps, len(QUANTITIES))
+    decay_time = np.full(shape[:2], np.nan)
+    values = np.full(shape, np.nan)
+    sigma = np.full(shape, np.nan)
+    for i, (t, v, s) in enumerate(cases):
+        decay_time[i, :len(t)] = t
+        values[i, :len(t)] = v
+        sigma[i, :len(t)] = s
+    return decay_time, values, sigma
+
+
+def load_batches(filenames):
+    """
+    Stacks the batch heating of any number of result files into a (case x
+    step x batch) array over the batches of all the files. Missing steps and
+    batches are NaN.
+
+    Returns
+    -------
+    batches: np.ndarray
+        batch ids
+    values: np.ndarray
+        shape (n_cases, n_steps, n_batches)
+    """
+    cases = [read_batches(f) for f in filenames]
+    batches = np.unique(np.concatenate([b for b, _ in cases])).astype(int)
+    n_steps = max(len(v) for _, v in cases)
+    values = np.full((len(cases), n_steps, len(batches)), np.nan)
+    for i, (b, v) in enumerate(cases):
+        values[i, :len(v)][:, np.searchsorted(batches, b)] = v
+    return batches, values
+
+
+def compare(values, sigma, reference=0):
+    """
+    Returns the relative difference of every case to 'reference' and its
+    propagated 1-sigma uncertainty, for all steps and quantities at once.
+
+    Parameters
+    ----------
+    values, sigma: array of float
+        shape (n_cases, n_steps, n_quantities) (or n_batches, with a NaN
+        sigma when unknown)
+    reference: int
+        index of the reference case
+
+    Returns
+    -------
+    diff, diff_sigma: np.ndarray
+        same shape as values
+    """
+    values, sigma = np.asarray(values, dtype=float), np.asarray(sigma, dtype=float)
+    ref, ref_sigma = values[reference], sigma[reference]
+    ratio = values / ref
+    diff_sigma = np.abs(ratio) * np.hypot(sigma / values, ref_sigma / ref)
+    return ratio - 1, diff_sigma
+
+
+def significant(diff, diff_sigma, k=2):
+    """ Returns True where |diff| exceeds k sigma """
+    return np.abs(diff) > k * diff_sigma
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('files', nargs='+', help='result files, the first one is the reference')
+    args = parser.parse_args()
+
+    decay_time, values, sigma = load_cases(args.files)
+    diff, diff_sigma = compare(values, sigma)
+    batches, batch_values = load_batches(args.files)
+    batch_diff = batch_values / batch_values[0] - 1
+    h_t = QUANTITIES.index('H_T')
+    for name, d, s, b, t in zip(args.files, diff[..., h_t], diff_sigma[..., h_t], batch_diff, decay_time):
+        for step in range(len(t)):
+            line = f'{name} t={t[step]:.4e} H_T diff: {d[step]*100:+.2f} +- {s[step]*100:.2f} %'
+            if np.isfinite(b[step]).any():
+                worst = np.nanargmax(np.abs(b[step]))
+                line += f', batch {batches[worst]}: {b[step, worst]*100:+.2f} %'
+            print(line)
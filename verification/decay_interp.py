@@ -0,0 +1,212 @@
+""" Interpolates decay heat and gamma intensity results at arbitrary cooling times """
+import os
+import numpy as np
+
+
+def _pchip_slopes(h, delta, first, last):
+    """ Fritsch-Carlson slopes at every knot of the flattened series """
+    d = np.zeros(len(h))
+    multi = last > first
+    d[first[multi]] = delta[first[multi]]
+    d[last[multi]] = delta[last[multi] - 1]
+    inner = np.ones(len(h), dtype=bool)
+    inner[first] = False
+    inner[last] = False
+    k = np.nonzero(inner)[0]
+    d0, d1 = delta[k-1], delta[k]
+    w1, w2 = 2*h[k] + h[k-1], h[k] + 2*h[k-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = (w1 + w2) / (w1/d0 + w2/d1)
+    d[k] = np.where(d0*d1 > 0, mean, 0)
+    return d
+
+
+class DecayInterpolator:
+    """
+    Piecewise interpolation of many series over decay time.
+
+    Every series has its own time axis. The knots of all series are stored
+    in one sorted array (series id * span + log t), so a batch of
+    (series, time) queries is answered with one searchsorted and one
+    polynomial evaluation.
+
+    Parameters
+    ----------
+    keys: np.ndarray
+        flattened knot keys, series id * span + log(t) - xmin
+    coeffs: np.ndarray
+        shape (n_knots, 4), polynomial coefficients of the interval starting
+        at each knot, in s = log(t) - log(t_k)
+    log_y: np.ndarray
+        True where the interval polynomial gives log(y)
+    y: np.ndarray
+        values at the knots
+    bounds: np.ndarray
+        shape (n_series, 2), first and last knot of each series
+    xmin, span: float
+        key transform
+    names: list of str
+    """
+
+    def __init__(self, keys, coeffs, log_y, y, bounds, xmin, span, names):
+        self.keys = keys
+        self.coeffs = coeffs
+        self.log_y = log_y
+        self.y = y
+        self.bounds = bounds
+        self.xmin = float(xmin)
+        self.span = float(span)
+        self.names = list(names)
+        self._series = {name: i for i, name in enumerate(self.names)}
+
+    @classmethod
+    def fit(cls, times, values, names=None, method='loglog'):
+        """
+        Precomputes the interpolation coefficients.
+
+        Parameters
+        ----------
+        times: array of float or list of arrays
+            decay times, shared (n_t,) or one array per series (> 0, increasing)
+        values: array of float or list of arrays
+            shape (n_series, n_t) or one array per series
+        names: list of str
+            series names, defaults to '0', '1', ...
+        method: str
+            'loglog': power law between knots (linear in log t where a value
+            is not positive), 'monotone': monotone cubic (PCHIP) in log t
+        """
+        if method not in ('loglog', 'monotone'):
+            raise ValueError(f"method must be 'loglog' or 'monotone', not {method!r}")
+        values = [np.asarray(v, dtype=float) for v in values]
+        if np.ndim(times[0]) == 0:
+            times = [np.asarray(times, dtype=float)] * len(values)
+        times = [np.asarray(t, dtype=float) for t in times]
+        if names is None:
+            names = [str(i) for i in range(len(values))]
+
+        lengths = np.array([len(t) for t in times])
+        if np.any(lengths != [len(v) for v in values]):
+            raise ValueError('times and values have different lengths')
+        x = np.log(np.concatenate(times))
+        y = np.concatenate(values)
+        series = np.repeat(np.arange(len(times)), lengths)
+        last = np.cumsum(lengths) - 1
+        first = last - lengths + 1
+        if np.any(np.diff(x)[np.diff(series) == 0] <= 0):
+            raise ValueError('decay times must be positive and increasing')
+
+        xmin = x.min()
+        span = x.max() - xmin + 1
+        keys = series * span + (x - xmin)
+
+        # interval quantities, the interval after the last knot of a series is unused
+        h = np.append(np.diff(x), 1.)
+        dy = np.append(np.diff(y), 0.)
+        h[last] = 1.
+        dy[last] = 0.
+        delta = dy / h
+
+        coeffs = np.zeros((len(y), 4))
+        log_y = np.zeros(len(y), dtype=bool)
+        if method == 'loglog':
+            y_next = np.append(y[1:], 0.)
+            log_y = (y > 0) & (y_next > 0)
+            log_y[last] = False
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ly = np.where(log_y, np.log(np.where(log_y, y, 1.)), 0.)
+                ly_next = np.where(log_y, np.log(np.where(log_y, y_next, 1.)), 0.)
+            coeffs[:, 0] = np.where(log_y, ly, y)
+            coeffs[:, 1] = np.where(log_y, (ly_next - ly) / h, delta)
+        else:
+            d = _pchip_slopes(h, delta, first, last)
+            d_next = np.append(d[1:], 0.)
+            coeffs[:, 0] = y
+            coeffs[:, 1] = d
+            coeffs[:, 2] = (3*delta - 2*d - d_next) / h
+            coeffs[:, 3] = (d + d_next - 2*delta) / h**2
+            coeffs[last, 1:] = 0
+
+        bounds = np.stack([first, last], axis=1)
+        return cls(keys, coeffs, log_y, y, bounds, xmin, span, names)
+
+    def index(self, names):
+        """ Returns the series ids of 'names' """
+        return np.array([self._series[n] for n in np.atleast_1d(names)])
+
+    def __call__(self, series, times):
+        """
+        Returns the interpolated values, NaN outside of the time range of a
+        series.
+
+        Parameters
+        ----------
+        series: array of int
+            series ids (see 'index'), broadcast against 'times'
+        times: array of float
+            decay times
+        """
+        series, times = np.broadcast_arrays(np.asarray(series, dtype=int),
+                                            np.asarray(times, dtype=float))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x = np.log(times) - self.xmin
+        keys = series * self.span + x
+        k = np.searchsorted(self.keys, keys, side='right') - 1
+        first, last = self.bounds[series, 0], self.bounds[series, 1]
+        inside = (k >= first) & (k < last)
+        k = np.clip(k, 0, len(self.keys) - 1)
+
+        s = keys - self.keys[k]
+        c = self.coeffs[k]
+        poly = c[..., 0] + s*(c[..., 1] + s*(c[..., 2] + s*c[..., 3]))
+        with np.errstate(over='ignore'):
+            result = np.where(self.log_y[k], np.exp(poly), poly)
+        at_last = (k == last) & (keys == self.keys[last])
+        result = np.where(at_last, self.y[last], result)
+        return np.where(inside | at_last, result, np.nan)
+
+    def save(self, filename, **sources):
+        """ Writes the coefficients as an .npz file, with the 'sources' arrays telling what they were fitted to """
+        np.savez(filename, keys=self.keys, coeffs=self.coeffs, log_y=self.log_y, y=self.y,
+                 bounds=self.bounds, xmin=self.xmin, span=self.span, names=np.array(self.names), **sources)
+
+    @classmethod
+    def load(cls, filename):
+        """ Loads coefficients written by 'save' """
+        with np.load(filename) as data:
+            return cls(data['keys'], data['coeffs'], data['log_y'], data['y'], data['bounds'],
+                       data['xmin'], data['span'], data['names'].tolist())
+
+
+def from_heat_files(filenames, method='loglog', cache=None):
+    """
+    Returns the interpolator of every quantity of the decay heat result
+    files, one series per '<file>:<quantity>'.
+
+    If 'cache' is given, the coefficients are read from it when it was
+    written for the same files (path, size and modification time) and
+    method; otherwise they are recomputed and written.
+    """
+    sources = {'files': np.array([os.path.abspath(f) for f in filenames]),
+               'signature': np.array([(os.stat(f).st_size, os.stat(f).st_mtime_ns) for f in filenames],
+                                     dtype=np.int64).reshape(-1, 2),
+               'method': np.array(method)}
+    if cache and os.path.exists(cache):
+        with np.load(cache) as data:
+            current = all(key in data.files and np.array_equal(data[key], value) for key, value in sources.items())
+        if current:
+            return DecayInterpolator.load(cache)
+
+    import decay_heat
+
+    times, values, names = [], [], []
+    for filename in filenames:
+        t, v, _ = decay_heat.read_case(filename)
+        for q, quantity in enumerate(decay_heat.QUANTITIES):
+            times.append(t)
+            values.append(v[:, q])
+            names.append(f'{filename}:{quantity}')
+    interp = DecayInterpolator.fit(times, values, names, method)
+    if cache:
+        interp.save(cache, **sources)
+    return interp
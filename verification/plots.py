@@ -1,29 +1,34 @@
 """ Makes plots for publication """
 import os
-import sys
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.patches as mpatches
-from matplotlib.cbook import get_sample_data
-from matplotlib.ticker import ScalarFormatter
 
 
-class ScalarFormatterClass(ScalarFormatter):
-    def _set_format(self):
-        self.format = "%1.2f"
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _scalar_formatter():
+    """ Returns a matplotlib ScalarFormatter with two decimals """
+    from matplotlib.ticker import ScalarFormatter
+
+    class ScalarFormatterClass(ScalarFormatter):
+        def _set_format(self):
+            self.format = "%1.2f"
+
+    return ScalarFormatterClass(useMathText=True)
 
 
 def add_labels(figname):
     '''
     Adds legend to geometry image 'figname'.
     '''
+    import matplotlib.pyplot as plt
+    import matplotlib.patches as mpatches
+
     fuel = mpatches.Patch(color=(1., 0, 1.), label='Fuel')
     shell = mpatches.Patch(color=(1., 1., 0.), label='Shell')
     water = mpatches.Patch(color=(0, 0, 1.), label='Water')
 
-    cwd = os.getcwd()
-    fname = get_sample_data(f'{cwd}/{figname}')
-    im = plt.imread(fname)
+    im = plt.imread(os.path.join(DATA_DIR, figname))
     plt.imshow(im)
     plt.legend(handles=[fuel, shell, water],
                loc="upper right", bbox_to_anchor=(1., 1.), fancybox=True)
@@ -44,6 +49,8 @@ def plot_composition_comparison(times, composition_1, composition_2, labels,
     labels: [list of str], labels for each composition
     figname: [str], name of the figure to produce
     """
+    import matplotlib.pyplot as plt
+
     n_plots = len(composition_1)
     fig, axs = plt.subplots(n_plots)
     fig.tight_layout(pad=2.1)
@@ -52,7 +59,7 @@ def plot_composition_comparison(times, composition_1, composition_2, labels,
             times, composition_1[isotope], marker='o', label=labels[0])
         axs[idx].plot(
             times, composition_2[isotope], marker='o', label=labels[1])
-        yScalarFormatter = ScalarFormatterClass(useMathText=True)
+        yScalarFormatter = _scalar_formatter()
         yScalarFormatter.set_powerlimits((0, 0))
         axs[idx].yaxis.set_major_formatter(yScalarFormatter)
         axs[idx].set_ylabel(f'{isotope.upper()} [g]')
@@ -86,19 +93,17 @@ def plot_gamma_intens_comparison(x_list, y_list, heat_list, labels,
     figure_name: str
         name of the figure to be plotted
     """
+    import matplotlib.pyplot as plt
+
     heat1 = np.array(heat_list[0])
     heat2 = np.array(heat_list[1])
     heat3 = (heat1-heat2)/heat2 * 100
 
     re_height, re_width = 32, 32  # Real image dimensions
-    image_name = 'geometry-zoom.png'
-
-    cwd = os.getcwd()
-    image_name = os.path.join(cwd, image_name)
-    fname = get_sample_data(image_name)
+    image_name = os.path.join(DATA_DIR, 'geometry-zoom.png')
 
     plt.figure()
-    im = plt.imread(fname)
+    im = plt.imread(image_name)
     # im = im[120:-120, 110:-110, :]
 
     plt.imshow(im)